@@ -0,0 +1,219 @@
+"""HTTP inference API for the plant disease classifier, for clients that cannot drive the Streamlit UI.
+
+Endpoints:
+  POST /predict   raw image bytes (image/* or application/octet-stream) -> one prediction;
+                  multipart/form-data with one or more image parts -> {"predictions": [...]}
+  GET  /health    liveness: the process is up and answering
+  GET  /ready     readiness: 200 once the model is loaded and warmed up, 503 before or on failure
+
+Connections are kept alive between requests (HTTP/1.1), request bodies are
+capped at PLANT_API_MAX_REQUEST_BYTES, and the model, cache and micro-batching
+are configured from the same settings as the UI.
+
+Usage: python api.py [--host 0.0.0.0] [--port 8080] [--access-log]
+"""
+import argparse
+import json
+import sys
+from email.message import Message
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PIL import Image
+
+import settings
+from loader import BackgroundLoader, create_classifier
+from scheduler import SchedulerBusy
+
+
+class RequestError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+# Image parts of a multipart/form-data body, in order
+def parse_multipart(body, content_type):
+    header = Message()
+    header["content-type"] = content_type
+    boundary = header.get_param("boundary")
+    if not boundary:
+        raise RequestError(HTTPStatus.BAD_REQUEST, "multipart body without a boundary")
+
+    delimiter = b"--" + boundary.encode("latin-1")
+    parts = []
+    for chunk in body.split(delimiter)[1:]:
+        if chunk.startswith(b"--"):
+            break
+        head, separator, data = chunk.partition(b"\r\n\r\n")
+        if not separator:
+            raise RequestError(HTTPStatus.BAD_REQUEST, "malformed multipart part")
+        # Each part ends with the CRLF that precedes the next delimiter
+        if data.endswith(b"\r\n"):
+            data = data[:-2]
+        headers = {}
+        for line in head.decode("latin-1").strip().split("\r\n"):
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        # Plain form fields (no filename, text or default type) travel alongside the images
+        has_filename = "filename=" in headers.get("content-disposition", "")
+        if not has_filename and headers.get("content-type", "text/plain").startswith("text/"):
+            continue
+        parts.append(data)
+    return parts
+
+
+class PredictionHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "PlantDiseaseAPI/1.0"
+    # Small JSON responses on kept-alive sockets: do not let Nagle hold them back
+    disable_nagle_algorithm = True
+
+    @property
+    def timeout(self):
+        return self.server.keepalive_timeout
+
+    def log_message(self, format, *args):
+        if self.server.access_log:
+            super().log_message(format, *args)
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if self.close_connection:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status, message, headers=None):
+        self._send_json(status, {"error": message}, headers)
+
+    def _content_length(self):
+        try:
+            return int(self.headers.get("Content-Length", ""))
+        except ValueError:
+            return None
+
+    # Clients that send "Expect: 100-continue" learn about an oversized body before uploading it
+    def handle_expect_100(self):
+        length = self._content_length()
+        if length is not None and length > self.server.max_request_bytes:
+            self.close_connection = True
+            self._send_error(HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                             f"request body exceeds {self.server.max_request_bytes} bytes")
+            return False
+        return super().handle_expect_100()
+
+    def _read_body(self):
+        if "chunked" in self.headers.get("Transfer-Encoding", "").lower():
+            self.close_connection = True
+            raise RequestError(HTTPStatus.LENGTH_REQUIRED, "chunked uploads are not supported; send Content-Length")
+        if "Content-Length" not in self.headers:
+            self.close_connection = True
+            raise RequestError(HTTPStatus.LENGTH_REQUIRED, "Content-Length is required")
+        length = self._content_length()
+        if length is None or length < 0:
+            self.close_connection = True
+            raise RequestError(HTTPStatus.BAD_REQUEST, "invalid Content-Length")
+        if length > self.server.max_request_bytes:
+            # The body is left unread, so this connection cannot carry another request
+            self.close_connection = True
+            raise RequestError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                               f"request body exceeds {self.server.max_request_bytes} bytes")
+        if length == 0:
+            raise RequestError(HTTPStatus.BAD_REQUEST, "empty request body")
+        return self.rfile.read(length)
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        loader = self.server.loader
+        if path == "/health":
+            self._send_json(HTTPStatus.OK, {"status": "ok"})
+        elif path == "/ready":
+            status = HTTPStatus.OK if loader.ready else HTTPStatus.SERVICE_UNAVAILABLE
+            self._send_json(status, dict(loader.status(), model_version=self.server.classifier.model_version))
+        else:
+            self._send_error(HTTPStatus.NOT_FOUND, f"no such endpoint: {path}")
+
+    def do_POST(self):
+        path = self.path.split("?", 1)[0]
+        try:
+            if path != "/predict":
+                # Drain the body so the connection can be reused
+                self._read_body()
+                raise RequestError(HTTPStatus.NOT_FOUND, f"no such endpoint: {path}")
+            body = self._read_body()
+            if not self.server.loader.ready:
+                status = self.server.loader.status()
+                raise RequestError(HTTPStatus.SERVICE_UNAVAILABLE,
+                                   status["error"] or f"model is still loading ({status['phase']})")
+
+            content_type = self.headers.get("Content-Type", "application/octet-stream")
+            batch = content_type.lower().startswith("multipart/form-data")
+            images = parse_multipart(body, content_type) if batch else [body]
+            if not images:
+                raise RequestError(HTTPStatus.BAD_REQUEST, "no images in multipart body")
+            if len(images) > self.server.max_batch_images:
+                raise RequestError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                                   f"at most {self.server.max_batch_images} images per request")
+
+            try:
+                results = self.server.classifier.predict_batch(images)
+            except SchedulerBusy as exc:
+                raise RequestError(HTTPStatus.SERVICE_UNAVAILABLE, str(exc)) from None
+            except Image.DecompressionBombError as exc:
+                raise RequestError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"image too large: {exc}") from None
+            except (OSError, ValueError) as exc:
+                raise RequestError(HTTPStatus.BAD_REQUEST, f"could not decode image: {exc}") from None
+        except RequestError as exc:
+            retry = {"Retry-After": "1"} if exc.status == HTTPStatus.SERVICE_UNAVAILABLE else None
+            self._send_error(exc.status, str(exc), retry)
+            return
+
+        predictions = [dict(result.to_dict(), cached=result.cached) for result in results]
+        payload = {"predictions": predictions} if batch else predictions[0]
+        payload["model_version"] = self.server.classifier.model_version
+        self._send_json(HTTPStatus.OK, payload)
+
+
+class PredictionServer(ThreadingHTTPServer):
+    request_queue_size = 128
+
+    def __init__(self, address, classifier, loader, max_request_bytes=settings.API_MAX_REQUEST_BYTES,
+                 max_batch_images=settings.API_MAX_BATCH_IMAGES,
+                 keepalive_timeout=settings.API_KEEPALIVE_TIMEOUT_S, access_log=False):
+        self.classifier = classifier
+        self.loader = loader
+        self.max_request_bytes = max_request_bytes
+        self.max_batch_images = max_batch_images
+        self.keepalive_timeout = keepalive_timeout
+        self.access_log = access_log
+        super().__init__(address, PredictionHandler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default=settings.API_HOST)
+    parser.add_argument("--port", type=int, default=settings.API_PORT)
+    parser.add_argument("--access-log", action="store_true", help="log every request to stderr")
+    args = parser.parse_args()
+
+    classifier = create_classifier()
+    # Start answering /health and /ready right away; the model loads in the background
+    loader = BackgroundLoader(classifier).start()
+    server = PredictionServer((args.host, args.port), classifier, loader, access_log=args.access_log)
+    print(f"serving on http://{args.host}:{server.server_port}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
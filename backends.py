@@ -0,0 +1,180 @@
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from instrumentation import resident_memory_bytes
+from serving import (
+    DEFAULT_BATCH_BUCKETS,
+    CompiledPredictor,
+    TFLitePredictor,
+    embedding_forward,
+    load_tflite_interpreter,
+    tflite_interpreter_class,
+)
+
+
+class InferenceBackend:
+    """Loads one model artifact and runs batched forward passes on it.
+
+    Subclasses implement ``import_runtime``, ``_load`` (returning the loaded
+    model) and ``_make_predictor``. The base class adds timing of load and
+    warm-up, a rolling latency window and resident-memory introspection.
+
+    With ``embeddings``, each output row is the class probabilities followed
+    by the penultimate-layer embedding, both from one forward pass.
+    """
+
+    name = None
+    supports_embeddings = True
+
+    def __init__(self, path, input_shape=(224, 224, 3), buckets=DEFAULT_BATCH_BUCKETS, embeddings=False):
+        if embeddings and not self.supports_embeddings:
+            raise ValueError(f"the {self.name} backend cannot return embeddings")
+        self.path = path
+        self.input_shape = tuple(input_shape)
+        self.buckets = tuple(buckets)
+        self.embeddings = embeddings
+        self.load_time = None
+        self.load_memory_bytes = None
+        self.warmup_timings = {}
+        self._model = None
+        self._predictor = None
+        self._latencies = deque(maxlen=1000)
+        self._lock = threading.Lock()
+
+    # Import the heavy runtime (TensorFlow or a TFLite interpreter) without loading the model
+    def import_runtime(self):
+        raise NotImplementedError
+
+    def _load(self):
+        raise NotImplementedError
+
+    def _make_predictor(self, model):
+        raise NotImplementedError
+
+    @property
+    def loaded(self):
+        return self._model is not None
+
+    def load(self):
+        with self._lock:
+            if self._model is None:
+                self.import_runtime()
+                memory_before = resident_memory_bytes()
+                start = time.perf_counter()
+                model = self._load()
+                self._predictor = self._make_predictor(model)
+                self.load_time = time.perf_counter() - start
+                self.load_memory_bytes = resident_memory_bytes() - memory_before
+                self._model = model
+        return self
+
+    @property
+    def model(self):
+        return self.load()._model
+
+    @property
+    def predictor(self):
+        return self.load()._predictor
+
+    def warmup(self):
+        self.warmup_timings = self.predictor.warmup()
+        return self.warmup_timings
+
+    # Float32 (N, H, W, 3) batch in, (N, num_classes) probabilities out (plus embeddings, see above)
+    def predict_batch(self, batch):
+        predictor = self.predictor
+        start = time.perf_counter()
+        probabilities = predictor(batch)
+        self._latencies.append((len(batch), time.perf_counter() - start))
+        return probabilities
+
+    def stats(self):
+        latencies = [seconds for _, seconds in list(self._latencies)]
+        stats = {
+            "backend": self.name,
+            "path": self.path,
+            "loaded": self.loaded,
+            "load_time_s": self.load_time,
+            "warmup_s": sum(self.warmup_timings.values()) if self.warmup_timings else None,
+            "load_memory_mb": None if self.load_memory_bytes is None else self.load_memory_bytes / 2 ** 20,
+            "resident_memory_mb": resident_memory_bytes() / 2 ** 20,
+            "calls": len(latencies),
+            "embeddings": self.embeddings,
+        }
+        if latencies:
+            stats["latency_p50_ms"] = float(np.percentile(latencies, 50)) * 1000
+            stats["latency_p95_ms"] = float(np.percentile(latencies, 95)) * 1000
+        return stats
+
+
+class KerasBackend(InferenceBackend):
+    """Full Keras model loaded from the .h5 file."""
+
+    name = "keras"
+
+    def import_runtime(self):
+        import tensorflow  # noqa: F401
+
+    def _load(self):
+        import tensorflow as tf
+        return tf.keras.models.load_model(self.path)
+
+    def _make_predictor(self, model):
+        forward = embedding_forward(model) if self.embeddings else (lambda x: model(x, training=False))
+        return CompiledPredictor(forward, self.input_shape, self.buckets)
+
+
+class SavedModelBackend(InferenceBackend):
+    """Serving signature of the SavedModel produced by convert_model.py; no Keras deserialization."""
+
+    name = "savedmodel"
+
+    def import_runtime(self):
+        import tensorflow  # noqa: F401
+
+    def _load(self):
+        import tensorflow as tf
+        return tf.saved_model.load(self.path)
+
+    def _make_predictor(self, model):
+        return CompiledPredictor(model.serve_embeddings if self.embeddings else model.serve, self.input_shape,
+                                 self.buckets)
+
+
+class TFLiteBackend(InferenceBackend):
+    """TFLite interpreter; runs without TensorFlow when a standalone interpreter package is installed."""
+
+    name = "tflite"
+    # Quantized variants are converted from the probabilities-only model
+    supports_embeddings = False
+
+    def __init__(self, path, input_shape=(224, 224, 3), buckets=DEFAULT_BATCH_BUCKETS, embeddings=False,
+                 num_threads=None):
+        super().__init__(path, input_shape, buckets, embeddings)
+        self.num_threads = num_threads
+
+    def import_runtime(self):
+        tflite_interpreter_class()
+
+    def _load(self):
+        return load_tflite_interpreter(self.path, self.num_threads)
+
+    def _make_predictor(self, model):
+        return TFLitePredictor(model, self.input_shape, self.buckets)
+
+    def stats(self):
+        return dict(super().stats(), num_threads=self.num_threads)
+
+
+BACKENDS = {
+    backend.name: backend for backend in (KerasBackend, SavedModelBackend, TFLiteBackend)
+}
+
+
+def create_backend(name, path, input_shape=(224, 224, 3), buckets=DEFAULT_BATCH_BUCKETS, **options):
+    if name not in BACKENDS:
+        raise ValueError(f"unknown inference backend {name!r}, expected one of {sorted(BACKENDS)}")
+    return BACKENDS[name](path, input_shape, buckets, **options)
@@ -0,0 +1,157 @@
+"""Classify every image under a directory tree without the Streamlit UI.
+
+Images stream through a bounded pipeline: parallel decode workers feed fixed-size
+batches to the model, results are appended to a JSONL or CSV file as each batch
+finishes, and a checkpoint records progress so an interrupted run can resume.
+
+Usage: python batch_predict.py IMAGE_DIR -o results.jsonl [--batch-size 32] [--workers 4]
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import tempfile
+import time
+
+from engine import DEFAULT_MODEL_PATH, PlantDiseaseClassifier
+from pipeline import iter_batches, iter_image_files
+
+CSV_FIELDS = ["path", "label", "confidence", "top_predictions", "error"]
+
+
+def load_checkpoint(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+# Replace the checkpoint atomically so a crash never leaves it half-written
+def save_checkpoint(path, state):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+
+class ResultWriter:
+    """Appends result rows as JSON lines or CSV, flushing after every batch."""
+
+    def __init__(self, path, fmt, truncate_to=None):
+        self.fmt = fmt
+        exists = os.path.exists(path)
+        self._file = open(path, "a+" if exists else "w", newline="")
+        # Drop rows written after the last checkpoint so a resumed run has no duplicates
+        if exists and truncate_to is not None:
+            self._file.truncate(truncate_to)
+        self._file.seek(0, os.SEEK_END)
+        self._csv = None
+        if fmt == "csv":
+            self._csv = csv.DictWriter(self._file, fieldnames=CSV_FIELDS)
+            if self._file.tell() == 0:
+                self._csv.writeheader()
+
+    def write(self, row):
+        if self._csv is not None:
+            row = dict(row, top_predictions=json.dumps(row.get("top_predictions", [])))
+            self._csv.writerow({field: row.get(field, "") for field in CSV_FIELDS})
+        else:
+            self._file.write(json.dumps(row) + "\n")
+
+    def flush(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return self._file.tell()
+
+    def close(self):
+        self._file.close()
+
+
+def run(args):
+    fmt = args.format or ("csv" if args.output.lower().endswith(".csv") else "jsonl")
+    checkpoint_path = args.checkpoint or f"{args.output}.checkpoint"
+
+    checkpoint = None if args.restart else load_checkpoint(checkpoint_path)
+    if checkpoint is None and os.path.exists(args.output):
+        # No checkpoint to resume from: start the output over
+        os.remove(args.output)
+    processed = checkpoint["processed"] if checkpoint else 0
+    after = checkpoint["last_path"] if checkpoint else None
+    if checkpoint:
+        print(f"Resuming after {after} ({processed} images already done)", file=sys.stderr)
+
+    classifier = PlantDiseaseClassifier(model_path=args.model, top_k=args.top_k).load()
+    writer = ResultWriter(args.output, fmt, truncate_to=checkpoint["output_offset"] if checkpoint else None)
+
+    paths = iter_image_files(args.image_dir, after=after)
+    batches = iter_batches(
+        paths,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        prefetch_batches=args.prefetch,
+        executor=args.executor,
+        path_of=lambda relative: os.path.join(args.image_dir, relative),
+    )
+
+    start = time.perf_counter()
+    done_this_run = 0
+    try:
+        for batch_paths, batch, errors in batches:
+            # Unreadable images are reported without spending a forward pass on their zero rows
+            keep = [position for position in range(len(batch_paths)) if position not in errors]
+            results = {}
+            if keep:
+                rows = batch if len(keep) == len(batch) else batch[keep]
+                results = dict(zip(keep, classifier.predict_preprocessed(rows)))
+            for position, path in enumerate(batch_paths):
+                if position in errors:
+                    writer.write({"path": path, "error": errors[position]})
+                else:
+                    result = results[position]
+                    writer.write({
+                        "path": path,
+                        "label": result.label,
+                        "confidence": result.confidence,
+                        "top_predictions": [list(pred) for pred in result.top_predictions],
+                    })
+
+            offset = writer.flush()
+            processed += len(batch_paths)
+            done_this_run += len(batch_paths)
+            save_checkpoint(checkpoint_path, {
+                "last_path": batch_paths[-1],
+                "processed": processed,
+                "output_offset": offset,
+            })
+
+            elapsed = time.perf_counter() - start
+            print(f"\r{processed} images  {done_this_run / elapsed:.1f} img/s", end="", file=sys.stderr)
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"\nDone: {done_this_run} images in {elapsed:.1f} s, {processed} total -> {args.output}",
+          file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("image_dir", help="directory tree of .jpg/.jpeg/.png images")
+    parser.add_argument("-o", "--output", required=True, help="results file (.jsonl or .csv)")
+    parser.add_argument("--format", choices=["jsonl", "csv"], help="default: from the output extension")
+    parser.add_argument("--checkpoint", help="default: OUTPUT.checkpoint")
+    parser.add_argument("--restart", action="store_true", help="ignore any checkpoint and start over")
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--executor", choices=["thread", "process"], default="thread")
+    parser.add_argument("--prefetch", type=int, default=2, help="decoded batches kept ahead of the model")
+    parser.add_argument("--top-k", type=int, default=3)
+    run(parser.parse_args(argv))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""Benchmark the two-stage cascade: early-exit share, agreement with the full model and latency saved.
+
+A deeper stand-in than the other benchmarks use (four conv blocks, so the
+early layers are a small share of the forward pass, as in the deployed
+network) is first trained for --epochs on synthetic leaves of two crops (apple leaves tinted red-blue, tomato leaves plain), half of them
+healthy and half with lesions, so that it predicts healthy classes the way
+the deployed model does. Then:
+
+* fit: the gate is fitted to the trained model on --fit unlabelled leaves;
+* evaluate: ``cascade.py evaluate`` on --eval held-out leaves, per --thresholds;
+* serving: single-image requests through the classifier with and without
+  the gate at each threshold, with the share of diagnoses that match the
+  full model's.
+
+Usage: python benchmarks/bench_cascade.py [--train 800] [--width 4] [--fit 400] [--eval 400] [--thresholds 90 95 99]
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+from common import INPUT_SHAPE, NUM_CLASSES, percentiles
+
+os.environ.setdefault("PLANT_PREDICTION_LOG", "0")
+
+from bench_dedupe import make_leaf, to_jpeg  # noqa: E402
+from cascade import CascadeGate, evaluate_cascade, fit_gate  # noqa: E402
+from engine import PlantDiseaseClassifier, gate_model_path  # noqa: E402
+from preprocessing import preprocess_batch  # noqa: E402
+
+# (label, crop tint, healthy) of the synthetic classes
+CLASSES = [
+    ("Apple___Apple_scab", (1.15, 0.85, 1.2), False),
+    ("Apple___healthy", (1.15, 0.85, 1.2), True),
+    ("Tomato___Late_blight", (1.0, 1.0, 1.0), False),
+    ("Tomato___healthy", (1.0, 1.0, 1.0), True),
+]
+
+
+def make_sample(rng, label_index):
+    _, tint, healthy = CLASSES[label_index]
+    leaf = make_leaf(rng, (800, 600), lesions=0 if healthy else int(rng.integers(6, 25)))
+    pixels = (np.asarray(leaf, dtype=np.float32) * np.array(tint)).clip(0, 255).astype(np.uint8)
+    return to_jpeg(Image.fromarray(pixels))
+
+
+def make_set(rng, count):
+    picks = rng.integers(0, len(CLASSES), count)
+    return [make_sample(rng, pick) for pick in picks], picks
+
+
+def write_set(directory, images):
+    os.makedirs(directory)
+    for i, data in enumerate(images):
+        with open(os.path.join(directory, f"leaf_{i:05d}.jpg"), "wb") as f:
+            f.write(data)
+
+
+def build_deep_standin(width=4, seed=0):
+    import tensorflow as tf
+
+    tf.keras.utils.set_random_seed(seed)
+    layers = [tf.keras.Input(INPUT_SHAPE), tf.keras.layers.Conv2D(16 * width, 3, strides=2, activation="relu")]
+    for filters in (32 * width, 64 * width, 128 * width):
+        layers += [tf.keras.layers.MaxPooling2D(2)]
+        for _ in range(2):
+            layers += [tf.keras.layers.Conv2D(filters, 3, padding="same", use_bias=False),
+                       tf.keras.layers.BatchNormalization(momentum=0.9), tf.keras.layers.ReLU()]
+    layers += [tf.keras.layers.GlobalAveragePooling2D(), tf.keras.layers.Dense(128, activation="relu"),
+               tf.keras.layers.Dense(NUM_CLASSES, activation="softmax")]
+    return tf.keras.Sequential(layers)
+
+
+def train_standin(path, rng, count, epochs, width):
+    import tensorflow as tf
+
+    with open(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "class_indices.json")) as f:
+        ids = {label: int(index) for index, label in json.load(f).items()}
+    images, picks = make_set(rng, count)
+    model = build_deep_standin(width)
+    model.compile(optimizer=tf.keras.optimizers.Adam(1e-3), loss="sparse_categorical_crossentropy",
+                  metrics=["accuracy"])
+    targets = np.array([ids[CLASSES[pick][0]] for pick in picks])
+    history = model.fit(preprocess_batch(images), targets, epochs=epochs, batch_size=32, verbose=0)
+    model.save(path)
+    return float(history.history["accuracy"][-1])
+
+
+def serve(classifier, tensors):
+    samples, top1 = [], []
+    for tensor in tensors:
+        start = time.perf_counter()
+        prediction = classifier.predict_preprocessed(tensor[None])[0]
+        samples.append(time.perf_counter() - start)
+        top1.append(prediction.label)
+    return samples, top1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--train", type=int, default=800)
+    parser.add_argument("--epochs", type=int, default=8)
+    parser.add_argument("--width", type=int, default=4, help="filter multiplier of the stand-in's conv blocks")
+    parser.add_argument("--fit", type=int, default=400)
+    parser.add_argument("--eval", type=int, default=400)
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[90.0, 95.0, 99.0])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    report = {"cpus": os.cpu_count()}
+    with tempfile.TemporaryDirectory() as tmp:
+        model_path = os.path.join(tmp, "model.h5")
+        start = time.perf_counter()
+        report["training"] = {"images": args.train, "epochs": args.epochs, "width": args.width,
+                              "accuracy": train_standin(model_path, rng, args.train, args.epochs, args.width),
+                              "seconds": time.perf_counter() - start}
+
+        fit_dir, eval_dir = os.path.join(tmp, "fit"), os.path.join(tmp, "eval")
+        write_set(fit_dir, make_set(rng, args.fit)[0])
+        eval_images, eval_picks = make_set(rng, args.eval)
+        write_set(eval_dir, eval_images)
+
+        start = time.perf_counter()
+        metadata = fit_gate(model_path, fit_dir, thresholds=args.thresholds, workers=os.cpu_count() or 4)
+        report["fit"] = {"seconds": time.perf_counter() - start, "layer": metadata["layer"],
+                         "cost_fraction": metadata["cost_fraction"], "holdout": metadata["holdout"]}
+        report["evaluate"] = evaluate_cascade(model_path, eval_dir, args.thresholds, workers=os.cpu_count() or 4)
+        report["evaluate"]["truly_healthy_fraction"] = float(np.mean([CLASSES[pick][2] for pick in eval_picks]))
+
+        tensors = preprocess_batch(eval_images)
+        classifier = PlantDiseaseClassifier(model_path=model_path, prefer_converted=False).load()
+        samples, full_top1 = serve(classifier, tensors)
+        report["serving"] = {"full_model": percentiles(samples), "cascade": []}
+        for threshold in args.thresholds:
+            gate = CascadeGate(gate_model_path(model_path), threshold)
+            classifier = PlantDiseaseClassifier(model_path=model_path, prefer_converted=False, cascade=gate).load()
+            samples, top1 = serve(classifier, tensors)
+            stats = gate.stats()
+            report["serving"]["cascade"].append({
+                "threshold": threshold,
+                "latency": percentiles(samples),
+                "early_exit_fraction": stats["early_exit_fraction"],
+                "agreement": float(np.mean([a == b for a, b in zip(top1, full_top1)])),
+                "gate_ms_per_row": stats["gate_ms_per_row"],
+                "saved_ms_per_row": stats["saved_ms_per_row"],
+            })
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
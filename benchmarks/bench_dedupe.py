@@ -0,0 +1,193 @@
+"""Benchmark near-duplicate detection: hash robustness, lookup latency at scale, and skipped inference.
+
+Three parts:
+
+* robustness: Hamming distances between synthetic leaf photos and re-shot
+  variants of them (recompressed, downscaled, brighter, cropped), next to the
+  distances between different leaves, so the threshold can be judged;
+* scale: single-image lookup latency as the index grows to --sizes entries,
+  against a brute-force scan, with results checked against that scan;
+* end to end: a scouting session where each leaf is uploaded one to three
+  times, classified with and without the duplicate index.
+
+Usage: python benchmarks/bench_dedupe.py [--max-distance 3] [--sizes 1000 10000 100000 500000]
+"""
+import argparse
+import io
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+
+from common import percentiles, save_standin_model
+from dedupe import DuplicateIndex, hamming_distances, perceptual_hash
+from engine import PlantDiseaseClassifier
+from preprocessing import preprocess_batch
+
+VARIANTS = {
+    "recompressed_q50": lambda img: img,
+    "downscaled_800px": lambda img: img.resize((800, 600), Image.Resampling.BILINEAR),
+    "brighter_10pct": lambda img: img.point(lambda v: min(255, int(v * 1.1))),
+    "cropped_2pct": lambda img: img.crop((img.width // 50, img.height // 50, img.width, img.height)),
+    "cropped_5pct": lambda img: img.crop((img.width // 20, img.height // 20, img.width, img.height)),
+}
+
+
+# Synthetic leaf on a gradient background, with a midrib and random lesions
+def make_leaf(rng, size=(1600, 1200), lesions=None):
+    width, height = size
+    shade = np.linspace(rng.uniform(60, 140), rng.uniform(120, 200), height)
+    background = shade[:, None, None] * np.ones((1, width, 3)) * rng.uniform(0.6, 1.0, 3)
+    img = Image.fromarray(background.astype(np.uint8))
+    draw = ImageDraw.Draw(img)
+    cx, cy = width * rng.uniform(0.35, 0.65), height * rng.uniform(0.35, 0.65)
+    rx, ry = width * rng.uniform(0.2, 0.4), height * rng.uniform(0.2, 0.4)
+    green = tuple(int(v) for v in (rng.uniform(30, 90), rng.uniform(110, 190), rng.uniform(20, 80)))
+    draw.ellipse((cx - rx, cy - ry, cx + rx, cy + ry), fill=green)
+    draw.line((cx - rx, cy, cx + rx, cy), fill=(200, 220, 150), width=6)
+    for _ in range(rng.integers(0, 25) if lesions is None else lesions):
+        x, y, r = cx + rng.uniform(-rx, rx) * 0.8, cy + rng.uniform(-ry, ry) * 0.8, rng.uniform(8, 40)
+        draw.ellipse((x - r, y - r, x + r, y + r), fill=(int(rng.uniform(90, 160)), int(rng.uniform(60, 100)), 20))
+    return img.filter(ImageFilter.GaussianBlur(2))
+
+
+def to_jpeg(img, quality=85):
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def shoot(img, variant):
+    return to_jpeg(VARIANTS[variant](img), quality=50 if variant == "recompressed_q50" else 85)
+
+
+def robustness(leaves, originals, max_distance):
+    hashes = perceptual_hash(preprocess_batch(originals))
+    report = {}
+    for variant in VARIANTS:
+        distances = np.bitwise_count(
+            perceptual_hash(preprocess_batch([shoot(img, variant) for img in leaves])) ^ hashes
+        )
+        report[variant] = {
+            "median_bits": float(np.median(distances)),
+            "max_bits": int(distances.max()),
+            "matched": float((distances <= max_distance).mean()),
+        }
+    pairs = np.bitwise_count(hashes[:, None] ^ hashes[None, :])[np.triu_indices(len(hashes), 1)]
+    report["different_leaves"] = {
+        "pairs": int(pairs.size),
+        "median_bits": float(np.median(pairs)),
+        "min_bits": int(pairs.min()),
+        "falsely_matched": float((pairs <= max_distance).mean()),
+    }
+    return report
+
+
+def random_hashes(rng, count):
+    return rng.integers(0, 2 ** 64, size=count, dtype=np.uint64)
+
+
+def scale(sizes, max_distance, queries, rng):
+    report = []
+    index = DuplicateIndex(max_distance, max_entries=max(sizes))
+    probabilities = np.full((1, 38), 1 / 38, dtype=np.float32)
+    stored = np.zeros(0, dtype=np.uint64)
+    for size in sizes:
+        new = random_hashes(rng, size - len(stored))
+        start = time.perf_counter()
+        index.add(new, np.broadcast_to(probabilities, (len(new), 38)))
+        add_s = time.perf_counter() - start
+        stored = np.concatenate([stored, new])
+
+        # Half the queries are stored hashes with up to max_distance bits flipped, half are unrelated
+        picks = rng.choice(stored, size=queries // 2)
+        flips = np.zeros(len(picks), dtype=np.uint64)
+        for i in range(len(picks)):
+            for bit in rng.choice(64, size=rng.integers(0, max_distance + 1), replace=False):
+                flips[i] |= np.uint64(1) << np.uint64(bit)
+        query_hashes = np.concatenate([picks ^ flips, random_hashes(rng, queries - len(picks))])
+
+        index_samples, scan_samples, mismatches = [], [], 0
+        for position in range(len(query_hashes)):
+            query = query_hashes[position:position + 1]
+            start = time.perf_counter()
+            found, _, _, _ = index.match(query)
+            index_samples.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            expected = hamming_distances(stored, int(query[0])).min() <= max_distance
+            scan_samples.append(time.perf_counter() - start)
+            mismatches += bool(found) != expected
+        report.append({
+            "entries": len(index),
+            "add_us_per_entry": add_s / max(len(new), 1) * 1e6,
+            "lookup_us": {key.replace("_ms", "_us"): value * 1000 for key, value in percentiles(index_samples).items()},
+            "brute_force_scan_us": {key.replace("_ms", "_us"): value * 1000
+                                    for key, value in percentiles(scan_samples).items()},
+            "mismatches_vs_scan": int(mismatches),
+        })
+    return report
+
+
+def end_to_end(leaves, max_distance, model_path, batch_size, rng):
+    # Each leaf is photographed one to three times; re-shots vary in compression, size and exposure
+    uploads = []
+    for img in leaves:
+        uploads.append(to_jpeg(img))
+        for variant in rng.choice(["recompressed_q50", "downscaled_800px", "brighter_10pct"],
+                                  size=rng.integers(0, 3), replace=False):
+            uploads.append(shoot(img, variant))
+    order = rng.permutation(len(uploads))
+    uploads = [uploads[i] for i in order]
+
+    report = {"uploads": len(uploads), "leaves": len(leaves)}
+    labels = {}
+    for name, dedupe in (("without_index", None), ("with_index", DuplicateIndex(max_distance))):
+        classifier = PlantDiseaseClassifier(model_path=model_path, dedupe=dedupe).load()
+        start = time.perf_counter()
+        results = []
+        inference_s = 0.0
+        for offset in range(0, len(uploads), batch_size):
+            batch = classifier.predict_batch(uploads[offset:offset + batch_size])
+            inference_s += batch[0].timings.get("inference", 0.0)
+            results.extend(batch)
+        labels[name] = [result.label for result in results]
+        report[name] = {
+            "wall_s": time.perf_counter() - start,
+            "inference_s": inference_s,
+            "reused": sum(result.cached for result in results),
+        }
+        if dedupe is not None:
+            report[name]["index"] = dedupe.stats()
+    report["label_agreement"] = float(np.mean([a == b for a, b in zip(labels["without_index"],
+                                                                      labels["with_index"])]))
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--max-distance", type=int, default=3)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10_000, 100_000, 500_000])
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--leaves", type=int, default=150)
+    parser.add_argument("--batch", type=int, default=8)
+    parser.add_argument("--model", help="model file (default: stand-in model)")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    leaves = [make_leaf(rng) for _ in range(args.leaves)]
+    originals = [to_jpeg(img) for img in leaves]
+
+    report = {"max_distance": args.max_distance}
+    report["robustness"] = robustness(leaves, originals, args.max_distance)
+    report["scale"] = scale(args.sizes, args.max_distance, args.queries, rng)
+    with tempfile.TemporaryDirectory() as tmp:
+        model_path = args.model or save_standin_model(os.path.join(tmp, "standin_model.h5"))
+        report["end_to_end"] = end_to_end(leaves[:100], args.max_distance, model_path, args.batch, rng)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""Benchmark embedding extraction and similar-case search over a million-case archive.
+
+Four parts:
+
+* extraction: forward-pass latency with and without the embedding output;
+* append: building a --rows archive in batches, then single-case appends;
+* partition: clustering the archive for approximate search;
+* search: per-query latency and peak memory of exact and partitioned search
+  at each --nprobe, each in a fresh process, with partitioned recall@k
+  measured against exact search.
+
+Archive vectors are synthetic: unit embeddings scattered around --clusters
+random centres, so similar cases exist the way they do for leaves of one
+disease. Queries are perturbed copies of archived vectors.
+
+Usage: python benchmarks/bench_embeddings.py [--rows 1000000] [--dim 256] [--nprobe 8 16 32]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from common import percentiles, save_standin_model, time_repeated
+from engine import PlantDiseaseClassifier
+from similar import SimilarCaseIndex
+
+
+def read_status(field):
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def synthetic_embeddings(rng, centres, count, spread):
+    picks = rng.integers(0, len(centres), count)
+    vectors = centres[picks] + rng.standard_normal((count, centres.shape[1]), dtype=np.float32) * spread
+    return vectors
+
+
+def extraction(model_path, repeat):
+    report = {}
+    batch_32 = np.random.default_rng(0).random((32, 224, 224, 3), dtype=np.float32)
+    for name, embeddings in (("probabilities_only", False), ("with_embeddings", True)):
+        classifier = PlantDiseaseClassifier(model_path=model_path, prefer_converted=False, embeddings=embeddings).load()
+        predictor = classifier.predictor
+        report[name] = {
+            "batch_1": percentiles(time_repeated(lambda: predictor(batch_32[:1]), repeat)),
+            "batch_32": percentiles(time_repeated(lambda: predictor(batch_32), repeat)),
+            "output_columns": int(predictor(batch_32[:1]).shape[1]),
+        }
+    return report
+
+
+# Searches in a fresh process, so memory growth is measured from a process that has only opened the index
+def run_worker(args):
+    index = SimilarCaseIndex(args.worker, nprobe=args.nprobe[0])
+    queries = np.load(os.path.join(args.worker, "queries.npy"))
+    exact = args.mode == "exact"
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+    baseline_rss, baseline_anon, baseline_file = read_status("VmRSS"), read_status("RssAnon"), read_status("RssFile")
+    samples, ids = [], []
+    for query in queries:
+        start = time.perf_counter()
+        found, _ = index.search(query, args.k, exact=exact)
+        samples.append(time.perf_counter() - start)
+        ids.append(found[0])
+    report = {
+        "mode": args.mode,
+        "queries": len(queries),
+        "latency": percentiles(samples),
+        "first_query_ms": samples[0] * 1000,
+        "peak_growth_mb": (read_status("VmHWM") - baseline_rss) / 2 ** 20,
+        # Heap allocations, and pages of the vector file mapped in (page cache, reclaimable)
+        "anonymous_growth_mb": (read_status("RssAnon") - baseline_anon) / 2 ** 20,
+        "mapped_file_growth_mb": (read_status("RssFile") - baseline_file) / 2 ** 20,
+    }
+    if not exact:
+        report["nprobe"] = args.nprobe[0]
+        truth = np.load(os.path.join(args.worker, "truth.npy"))
+        report["recall_at_k"] = float(np.mean([len(set(a) & set(b)) / args.k for a, b in zip(ids, truth)]))
+    print(json.dumps(report))
+
+
+def measure(script_args):
+    output = subprocess.run([sys.executable, os.path.abspath(__file__)] + script_args, check=True,
+                            stdout=subprocess.PIPE, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", help="model file (default: stand-in model)")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--clusters", type=int, default=2000)
+    parser.add_argument("--spread", type=float, default=0.05, help="per-dimension noise around a centre")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[8, 16, 32])
+    parser.add_argument("--lists", type=int, help="partition clusters (default: 4 * sqrt(rows))")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--exact-queries", type=int, default=10)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=30)
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--mode", choices=["exact", "partitioned"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        run_worker(args)
+        return
+
+    rng = np.random.default_rng(0)
+    report = {"rows": args.rows, "dim": args.dim, "k": args.k}
+    with tempfile.TemporaryDirectory() as tmp:
+        model_path = args.model or save_standin_model(os.path.join(tmp, "standin_model.h5"))
+        report["extraction"] = extraction(model_path, args.repeat)
+
+        directory = os.path.join(tmp, "cases")
+        index = SimilarCaseIndex(directory, args.dim, "benchmark")
+        centres = rng.standard_normal((args.clusters, args.dim), dtype=np.float32)
+        centres /= np.linalg.norm(centres, axis=1, keepdims=True)
+        batch_rows = 100_000
+        start = time.perf_counter()
+        for offset in range(0, args.rows, batch_rows):
+            count = min(batch_rows, args.rows - offset)
+            index.add(synthetic_embeddings(rng, centres, count, args.spread), ["case"] * count)
+        build_s = time.perf_counter() - start
+        report["append"] = {
+            "build_s": build_s,
+            "rows_per_s": args.rows / build_s,
+            "file_mb": os.path.getsize(os.path.join(directory, "vectors.f16")) / 2 ** 20,
+        }
+
+        picks = rng.integers(0, args.rows, args.queries)
+        vectors = np.memmap(os.path.join(directory, "vectors.f16"), dtype=np.float16, mode="r").reshape(-1, args.dim)
+        queries = (vectors[np.sort(picks)].astype(np.float32)
+                   + rng.standard_normal((args.queries, args.dim), dtype=np.float32) * args.spread)
+        np.save(os.path.join(directory, "queries.npy"), queries[:args.exact_queries])
+        report["exact"] = measure(["--worker", directory, "--mode", "exact", "--k", str(args.k)])
+
+        start = time.perf_counter()
+        truth, _ = index.search(queries, args.k, exact=True)
+        report["exact"]["batched_%d_queries_s" % args.queries] = time.perf_counter() - start
+        np.save(os.path.join(directory, "truth.npy"), truth)
+        np.save(os.path.join(directory, "queries.npy"), queries)
+
+        start = time.perf_counter()
+        lists = index.partition(args.lists)
+        report["partition"] = {"lists": lists, "seconds": time.perf_counter() - start}
+        report["partitioned"] = [
+            measure(["--worker", directory, "--mode", "partitioned", "--k", str(args.k), "--nprobe", str(nprobe)])
+            for nprobe in args.nprobe
+        ]
+
+        # Incremental appends into the partitioned archive, each followed by a search
+        single = synthetic_embeddings(rng, centres, 200, args.spread)
+        append_samples, search_samples = [], []
+        for vector in single:
+            start = time.perf_counter()
+            index.add(vector[None], ["case"])
+            append_samples.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            index.search(vector, args.k)
+            search_samples.append(time.perf_counter() - start)
+        report["append"]["single_case"] = percentiles(append_samples)
+        report["append"]["search_after_append"] = percentiles(search_samples)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
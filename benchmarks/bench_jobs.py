@@ -0,0 +1,132 @@
+"""Benchmark the job queue: throughput across worker counts, UI-thread stalls, overload and recovery.
+
+Four parts, all with the deployed model (the one the workers load):
+
+* throughput: --jobs single-image jobs submitted at once to pools of each
+  --workers size, against classifying the same images one after another in
+  this process, as a Streamlit session does without a pool;
+* stalls: how late a 10 ms timer in the submitting thread fires while those
+  images are classified on a background thread of this process (the GIL is
+  shared) and while they run as jobs;
+* overload: --burst jobs submitted at once to a queue of --max-queue, and how
+  many are rejected;
+* recovery: cancelling a running tiled analysis, and how long until the
+  replacement worker finishes the next job.
+
+Near-duplicate reuse and the prediction log are off, so every job reaches the model.
+
+Usage: python benchmarks/bench_jobs.py [--workers 1 2 4] [--jobs 200]
+"""
+import argparse
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from common import make_jpeg, percentiles
+
+os.environ.setdefault("PLANT_DEDUPE", "0")
+os.environ.setdefault("PLANT_PREDICTION_LOG", "0")
+
+from bench_dedupe import make_leaf, to_jpeg  # noqa: E402
+from jobs import JobQueue  # noqa: E402
+from loader import create_classifier  # noqa: E402
+from preprocessing import preprocess_batch  # noqa: E402
+
+
+# Lateness of a timer that should fire every interval_s in the calling thread, while work() runs
+def timer_lateness(work, interval_s=0.01):
+    done = threading.Event()
+    samples = []
+
+    def run():
+        work()
+        done.set()
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    while not done.is_set():
+        start = time.perf_counter()
+        time.sleep(interval_s)
+        samples.append(time.perf_counter() - start - interval_s)
+    thread.join()
+    return {"max_ms": float(np.max(samples)) * 1000, **percentiles(samples)}
+
+
+def run_jobs(job_queue, tensors):
+    start = time.perf_counter()
+    ids = [job_queue.submit("predict", (tensor[None], [None])) for tensor in tensors]
+    for job_id in ids:
+        job_queue.result(job_id)
+    seconds = time.perf_counter() - start
+    latencies = [job_queue.poll(job_id)["elapsed_s"] for job_id in ids]
+    return {"seconds": seconds, "jobs_per_s": len(ids) / seconds, "latency": percentiles(latencies)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, os.cpu_count() or 1])
+    parser.add_argument("--jobs", type=int, default=200)
+    parser.add_argument("--burst", type=int, default=100)
+    parser.add_argument("--max-queue", type=int, default=16)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    tensors = preprocess_batch([to_jpeg(make_leaf(rng, (800, 600))) for _ in range(args.jobs)])
+    report = {"cpus": os.cpu_count(), "jobs": args.jobs}
+
+    classifier = create_classifier(micro_batching=False).load()
+    classify = lambda: [classifier.predict_preprocessed(tensor[None]) for tensor in tensors]  # noqa: E731
+    start = time.perf_counter()
+    classify()
+    seconds = time.perf_counter() - start
+    report["in_process"] = {
+        "seconds": seconds,
+        "jobs_per_s": args.jobs / seconds,
+        "ui_timer_lateness": timer_lateness(classify),
+    }
+
+    report["pools"] = []
+    for workers in sorted(set(args.workers)):
+        job_queue = JobQueue(workers, max_queue=args.jobs).start()
+        start = time.perf_counter()
+        job_queue.wait()
+        while job_queue.stats()["ready_workers"] < workers:
+            time.sleep(0.05)
+        entry = {"workers": workers, "startup_s": time.perf_counter() - start,
+                 "threads_per_worker": job_queue.threads}
+        entry.update(run_jobs(job_queue, tensors))
+        entry["ui_timer_lateness"] = timer_lateness(lambda: run_jobs(job_queue, tensors))
+        report["pools"].append(entry)
+        job_queue.shutdown()
+
+    job_queue = JobQueue(1, max_queue=args.max_queue).start()
+    job_queue.wait()
+    accepted = rejected = 0
+    for tensor in tensors[:args.burst]:
+        try:
+            job_queue.submit("predict", (tensor[None], [None]))
+            accepted += 1
+        except Exception:
+            rejected += 1
+    report["overload"] = {"burst": args.burst, "max_queue": args.max_queue, "accepted": accepted,
+                          "rejected": rejected}
+    while job_queue.stats()["queue_depth"] or job_queue.stats()["busy_workers"]:
+        time.sleep(0.05)
+
+    photo = make_jpeg((8160, 6120))
+    job_id = job_queue.submit("tiles", photo)
+    while job_queue.poll(job_id)["state"] != "running":
+        time.sleep(0.001)
+    start = time.perf_counter()
+    job_queue.cancel(job_id)
+    job_queue.result(job_queue.submit("predict", (tensors[:1], [None])))
+    report["recovery"] = {"cancel_to_next_result_s": time.perf_counter() - start, "stats": job_queue.stats()}
+    job_queue.shutdown()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
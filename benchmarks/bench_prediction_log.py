@@ -0,0 +1,93 @@
+"""Benchmark the SQLite prediction log at scale: enqueue cost, write throughput and statistics latency.
+
+Logs --rows synthetic predictions through PredictionLog.record (as the
+inference path does), then times the Statistics-tab reads, which come from the
+incremental aggregates, against the equivalent full-scan GROUP BY query.
+
+Usage: python benchmarks/bench_prediction_log.py [--rows 1000000] [--batch 8] [--db path]
+"""
+import argparse
+import json
+import os
+import sqlite3
+import tempfile
+import time
+
+import numpy as np
+
+from common import percentiles, time_repeated
+from engine import load_class_indices
+from postprocess import Prediction
+
+
+def synthetic_predictions(count, labels, rng):
+    indices = rng.integers(0, len(labels), size=count)
+    confidences = rng.uniform(30, 100, size=count)
+    return [
+        Prediction(labels[i], float(c), [(labels[i], float(c)), (labels[(i + 1) % len(labels)], 0.0)])
+        for i, c in zip(indices, confidences)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--batch", type=int, default=8, help="predictions per record() call")
+    parser.add_argument("--db", help="database file (default: a temporary file)")
+    args = parser.parse_args()
+
+    from prediction_log import PredictionLog
+
+    labels = list(load_class_indices().values())
+    rng = np.random.default_rng(0)
+    pool = synthetic_predictions(4096, labels, rng)
+    latencies = rng.lognormal(np.log(40), 0.5, size=args.rows // args.batch + 1) / 1000.0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.db or os.path.join(tmp, "predictions.sqlite3")
+        log = PredictionLog(path, max_queue=args.rows // args.batch + 1).start()
+
+        record_samples = []
+        start = time.perf_counter()
+        for n, offset in enumerate(range(0, args.rows, args.batch)):
+            batch = [pool[(offset + j) % len(pool)] for j in range(min(args.batch, args.rows - offset))]
+            call_start = time.perf_counter()
+            log.record(batch, latencies[n], "bench")
+            record_samples.append(time.perf_counter() - call_start)
+        enqueue_s = time.perf_counter() - start
+        log.flush()
+        written_s = time.perf_counter() - start
+
+        stats_samples = time_repeated(log.stats, 50)
+        recent_samples = time_repeated(lambda: log.recent(20), 50)
+
+        connection = sqlite3.connect(path)
+        full_scan = lambda: connection.execute(
+            "SELECT label, COUNT(*), AVG(confidence) FROM predictions GROUP BY label"
+        ).fetchall()
+        scan_samples = time_repeated(full_scan, 3, warmup=1)
+        connection.close()
+
+        stats = log.stats()
+        log.close()
+        report = {
+            "rows": args.rows,
+            "batch": args.batch,
+            "dropped": stats["dropped"],
+            "record_call_us": {key: value * 1000 for key, value in percentiles(record_samples).items()},
+            "enqueue_s": enqueue_s,
+            "write_rows_per_s": args.rows / written_s,
+            "db_mb": os.path.getsize(path) / 2 ** 20,
+            "stats_from_aggregates": percentiles(stats_samples),
+            "recent_20": percentiles(recent_samples),
+            "full_scan_group_by": percentiles(scan_samples),
+            "latency_percentiles_ms": stats["latency"],
+            "actual_latency_percentiles_ms": {
+                f"p{p}_ms": float(np.percentile(latencies[:len(record_samples)] * 1000, p)) for p in (50, 95, 99)
+            },
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Compare the fast preprocessing path with the original load_and_preprocess_image.
+
+Usage: python benchmarks/bench_preprocessing.py [--repeat 10] [--json out.json]
+"""
+import argparse
+import io
+import json
+import statistics
+import time
+
+import numpy as np
+from PIL import Image
+
+from common import make_jpeg
+from preprocessing import load_and_preprocess_image
+
+RESOLUTIONS = [(640, 480), (1920, 1080), (4032, 3024), (6000, 4000)]
+
+
+# The original implementation from main.py, kept verbatim as the baseline
+def baseline_load_and_preprocess_image(image_path, target_size=(224, 224)):
+    img = Image.open(image_path)
+    img = img.resize(target_size)
+    img_array = np.array(img)
+    img_array = np.expand_dims(img_array, axis=0)
+    img_array = img_array.astype('float32') / 255.
+    return img_array
+
+
+def time_call(fn, data, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(io.BytesIO(data))
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples), result
+
+
+def run(repeat):
+    rows = []
+    for size in RESOLUTIONS:
+        data = make_jpeg(size)
+        baseline_s, baseline = time_call(baseline_load_and_preprocess_image, data, repeat)
+        fast_s, fast = time_call(load_and_preprocess_image, data, repeat)
+        rows.append({
+            "resolution": f"{size[0]}x{size[1]}",
+            "jpeg_bytes": len(data),
+            "baseline_ms": baseline_s * 1000,
+            "fast_ms": fast_s * 1000,
+            "speedup": baseline_s / fast_s,
+            "mean_abs_diff": float(np.abs(baseline - fast).mean()),
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args()
+
+    rows = run(args.repeat)
+    print(f"{'resolution':>12} {'baseline ms':>12} {'fast ms':>9} {'speedup':>8} {'mean |diff|':>12}")
+    for row in rows:
+        print(f"{row['resolution']:>12} {row['baseline_ms']:12.1f} {row['fast_ms']:9.1f} "
+              f"{row['speedup']:7.1f}x {row['mean_abs_diff']:12.4f}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Benchmark tiled high-resolution analysis: latency and peak memory on phone and 50 MP photos.
+
+For each input size a synthetic field photo (JPEG) is analyzed whole, through
+PlantDiseaseClassifier.predict, and tiled, through tiling.TiledAnalyzer at each
+--max-tiles. Each measurement runs in a fresh process; peak memory is the
+growth of its resident set during the call (Linux VmHWM, reset just before),
+next to the size of a fully decoded RGB copy of the photo for scale.
+
+Usage: python benchmarks/bench_tiling.py [--model path.h5] [--sizes 4032x3024 8160x6120] [--max-tiles 16 64]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import make_jpeg, save_standin_model
+from engine import PlantDiseaseClassifier
+from tiling import TiledAnalyzer
+
+
+def read_status(field):
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+# One measurement in a fresh process, so earlier allocations cannot hide the peak
+def run_worker(args):
+    classifier = PlantDiseaseClassifier(model_path=args.model).load()
+    with open(args.worker, "rb") as f:
+        data = f.read()
+    if args.mode == "whole":
+        analyze = classifier.predict
+    else:
+        analyzer = TiledAnalyzer(classifier, max_tiles=args.max_tiles[0], batch_size=args.batch_size)
+        analyze = analyzer
+    analyze(make_jpeg((640, 480)))
+
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+    baseline = read_status("VmRSS")
+    start = time.perf_counter()
+    result = analyze(data)
+    seconds = time.perf_counter() - start
+    report = {"seconds": seconds, "peak_mb": (read_status("VmHWM") - baseline) / 2 ** 20}
+    if args.mode == "tiled":
+        prediction = result.prediction
+        report.update(max_tiles=args.max_tiles[0], grid=result.grid, tiles=result.tiles)
+    else:
+        prediction = result
+    report["stages_ms"] = {name: value * 1000 for name, value in prediction.timings.items()}
+    print(json.dumps(report))
+
+
+def measure(script_args):
+    output = subprocess.run([sys.executable, os.path.abspath(__file__)] + script_args, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", help="model file (default: stand-in model)")
+    parser.add_argument("--sizes", nargs="+", default=["4032x3024", "8160x6120"])
+    parser.add_argument("--max-tiles", type=int, nargs="+", default=[16, 64])
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--mode", choices=["whole", "tiled"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        run_worker(args)
+        return
+
+    report = {"runs": []}
+    with tempfile.TemporaryDirectory() as tmp:
+        model_path = args.model or save_standin_model(os.path.join(tmp, "standin_model.h5"))
+        for size in args.sizes:
+            width, height = (int(value) for value in size.split("x"))
+            path = os.path.join(tmp, f"{size}.jpg")
+            with open(path, "wb") as f:
+                f.write(make_jpeg((width, height)))
+            common_args = ["--model", model_path, "--worker", path, "--batch-size", str(args.batch_size)]
+            entry = {
+                "size": size,
+                "megapixels": width * height / 1e6,
+                "jpeg_mb": os.path.getsize(path) / 2 ** 20,
+                "full_decode_mb": width * height * 3 / 2 ** 20,
+                "whole_image": measure(common_args + ["--mode", "whole"]),
+                "tiled": [measure(common_args + ["--mode", "tiled", "--max-tiles", str(max_tiles)])
+                          for max_tiles in args.max_tiles],
+            }
+            report["runs"].append(entry)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Benchmark adaptive test-time augmentation: how often it triggers and what it costs.
+
+Measures generating all views in one gather against one view at a time, the
+batched forward pass over all views against sequential per-view calls, and
+single-image request latency through PlantDiseaseClassifier without TTA
+and with TTA at thresholds that trigger on a chosen share of the images. The
+stand-in model's confidences are near uniform, so those thresholds are taken
+from percentiles of its confidence distribution rather than fixed values.
+
+Usage: python benchmarks/bench_tta.py [--model path.h5] [--images 200] [--trigger-rates 0.1 0.25]
+"""
+import argparse
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from common import percentiles, save_standin_model, time_repeated
+from augment import TestTimeAugmentation
+from bench_dedupe import make_leaf, to_jpeg
+from engine import PlantDiseaseClassifier
+from preprocessing import preprocess_batch
+
+
+def request_latencies(classifier, uploads):
+    samples, triggered = [], 0
+    for upload in uploads:
+        result = classifier.predict(upload)
+        samples.append(sum(result.timings.values()))
+        triggered += result.augmented
+    return samples, triggered
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", help="model file (default: stand-in model)")
+    parser.add_argument("--images", type=int, default=200)
+    parser.add_argument("--trigger-rates", type=float, nargs="+", default=[0.1, 0.25])
+    parser.add_argument("--repeat", type=int, default=30)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    uploads = [to_jpeg(make_leaf(rng, (800, 600))) for _ in range(args.images)]
+    tta = TestTimeAugmentation()
+    views = len(tta.views)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        model_path = args.model or save_standin_model(os.path.join(tmp, "standin_model.h5"))
+        classifier = PlantDiseaseClassifier(model_path=model_path).load()
+        batch = preprocess_batch(uploads[:1])
+        batch_8 = preprocess_batch(uploads[:8])
+        view_batch = tta.augment(batch)
+        predictor = classifier.predictor
+
+        report = {
+            "views": tta.view_names,
+            "augment_one_image": percentiles(time_repeated(lambda: tta.augment(batch), args.repeat)),
+            "augment_8_images": percentiles(time_repeated(lambda: tta.augment(batch_8), args.repeat)),
+            "forward_all_views_batched": percentiles(time_repeated(lambda: predictor(view_batch), args.repeat)),
+            "forward_views_sequential": percentiles(time_repeated(
+                lambda: [predictor(view_batch[i:i + 1]) for i in range(views)], args.repeat
+            )),
+        }
+
+        confidences, _ = classifier.predict_probabilities(preprocess_batch(uploads))
+        confidences = confidences.max(axis=1) * 100.0
+        baseline, _ = request_latencies(classifier, uploads)
+        report["without_tta"] = percentiles(baseline)
+
+        report["with_tta"] = []
+        for rate in args.trigger_rates:
+            threshold = float(np.quantile(confidences, rate))
+            classifier.tta = TestTimeAugmentation(threshold)
+            samples, triggered = request_latencies(classifier, uploads)
+            samples = np.array(samples)
+            flags = confidences < threshold
+            report["with_tta"].append({
+                "threshold": threshold,
+                "trigger_rate": triggered / len(uploads),
+                "all_requests": percentiles(samples),
+                "triggered_requests": percentiles(samples[flags]) if flags.any() else None,
+                "untriggered_requests": percentiles(samples[~flags]),
+                "mean_added_ms": (samples.mean() - np.mean(baseline)) * 1000,
+                "stats": classifier.tta.stats(),
+            })
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
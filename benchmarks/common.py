@@ -0,0 +1,87 @@
+"""Shared helpers for the benchmark scripts: synthetic inputs, stand-in model, statistics."""
+import io
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+
+INPUT_SHAPE = (224, 224, 3)
+NUM_CLASSES = 38
+
+
+# Smooth synthetic "leaf" so JPEG sizes resemble real photos rather than noise
+def make_jpeg(size, quality=90):
+    width, height = size
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    pixels = np.stack([
+        128 + 100 * np.sin(x / 97.0) * np.cos(y / 53.0),
+        160 + 80 * np.cos(x / 41.0),
+        90 + 60 * np.sin((x + y) / 71.0),
+    ], axis=-1).clip(0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+# Small Keras model with the production input/output shape (224x224x3 -> 38 softmax)
+def build_standin_model(seed=0):
+    import tensorflow as tf
+
+    tf.keras.utils.set_random_seed(seed)
+    return tf.keras.Sequential([
+        tf.keras.Input(INPUT_SHAPE),
+        tf.keras.layers.Conv2D(16, 3, strides=2, activation="relu"),
+        tf.keras.layers.MaxPooling2D(2),
+        tf.keras.layers.Conv2D(32, 3, activation="relu"),
+        tf.keras.layers.MaxPooling2D(2),
+        tf.keras.layers.GlobalAveragePooling2D(),
+        tf.keras.layers.Dense(64, activation="relu"),
+        tf.keras.layers.Dense(NUM_CLASSES, activation="softmax"),
+    ])
+
+
+def save_standin_model(path, seed=0):
+    build_standin_model(seed).save(path)
+    return path
+
+
+def percentiles(samples, points=(50, 95, 99)):
+    values = np.asarray(samples) * 1000.0
+    result = {f"p{p}_ms": float(np.percentile(values, p)) for p in points}
+    result["mean_ms"] = float(values.mean())
+    return result
+
+
+def time_repeated(fn, repeat, warmup=3):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def environment():
+    info = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+    try:
+        import tensorflow as tf
+        info["tensorflow"] = tf.__version__
+    except ImportError:
+        info["tensorflow"] = None
+    return info
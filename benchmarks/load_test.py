@@ -0,0 +1,164 @@
+"""Closed-loop load test for the HTTP inference API (api.py).
+
+Each client thread keeps one connection open and sends the next request as soon
+as the previous answer arrives, for a fixed duration. Reports requests per
+second, tail latency and non-200 responses. Every request carries a few random
+bytes after the JPEG end marker so the server's prediction cache cannot answer
+it (pass --allow-cache to measure cache hits instead). Start the server first,
+e.g. ``python api.py --port 8080``.
+
+Usage: python benchmarks/load_test.py [--url http://127.0.0.1:8080] [--concurrency 1 8 32]
+       [--duration 10] [--image leaf.jpg] [--batch 1] [--no-keepalive] [--allow-cache]
+       [--output load_test.json]
+"""
+import argparse
+import http.client
+import json
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from urllib.parse import urlsplit
+
+from common import make_jpeg, percentiles
+
+
+# Decoders stop at the JPEG end marker, so trailing bytes change the content hash but not the pixels
+def build_request(image, batch, unique=True):
+    images = [image + uuid.uuid4().bytes if unique else image for _ in range(batch)]
+    if batch == 1:
+        return images[0], "image/jpeg"
+    boundary = uuid.uuid4().hex
+    parts = []
+    for i, data in enumerate(images):
+        parts.append(
+            f"--{boundary}\r\nContent-Disposition: form-data; name=\"images\"; filename=\"leaf{i}.jpg\"\r\n"
+            f"Content-Type: image/jpeg\r\n\r\n".encode("latin-1") + data + b"\r\n"
+        )
+    parts.append(f"--{boundary}--\r\n".encode("latin-1"))
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+def wait_until_ready(host, port, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection(host, port, timeout=5)
+            connection.request("GET", "/ready")
+            if connection.getresponse().status == 200:
+                return True
+        except OSError:
+            pass
+        time.sleep(0.5)
+    return False
+
+
+def run_level(host, port, image, batch, concurrency, duration, keepalive, unique):
+    connection_header = {} if keepalive else {"Connection": "close"}
+    latencies, statuses = [], Counter()
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+
+    def client():
+        local_latencies, local_statuses = [], Counter()
+        connection = None
+        while time.perf_counter() < stop_at:
+            if connection is None:
+                connection = http.client.HTTPConnection(host, port, timeout=60)
+            body, content_type = build_request(image, batch, unique)
+            start = time.perf_counter()
+            try:
+                headers = dict(connection_header, **{"Content-Type": content_type})
+                connection.request("POST", "/predict", body=body, headers=headers)
+                response = connection.getresponse()
+                response.read()
+                status = response.status
+                if response.will_close:
+                    connection.close()
+                    connection = None
+            except (OSError, http.client.HTTPException):
+                status = "connection_error"
+                connection.close()
+                connection = None
+            local_statuses[status] += 1
+            if status == 200:
+                local_latencies.append(time.perf_counter() - start)
+        if connection is not None:
+            connection.close()
+        with lock:
+            latencies.extend(local_latencies)
+            statuses.update(local_statuses)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    result = {
+        "concurrency": concurrency,
+        "requests": sum(statuses.values()),
+        "ok": len(latencies),
+        "requests_per_s": len(latencies) / elapsed,
+        "statuses": {str(status): count for status, count in statuses.items()},
+    }
+    if latencies:
+        result.update(percentiles(latencies, points=(50, 95, 99)))
+        result["max_ms"] = max(latencies) * 1000.0
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8080")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per concurrency level")
+    parser.add_argument("--image", help="JPEG to send (default: synthetic 1280x960 leaf)")
+    parser.add_argument("--batch", type=int, default=1, help="images per request; >1 sends multipart")
+    parser.add_argument("--no-keepalive", action="store_true", help="open a new connection per request")
+    parser.add_argument("--allow-cache", action="store_true", help="repeat identical bytes so the cache answers")
+    parser.add_argument("--ready-timeout", type=float, default=120.0, help="seconds to wait for /ready")
+    parser.add_argument("--output", help="also write the report to this JSON file")
+    args = parser.parse_args()
+
+    target = urlsplit(args.url)
+    host, port = target.hostname, target.port or 80
+    if not wait_until_ready(host, port, args.ready_timeout):
+        sys.exit(f"{args.url} did not become ready within {args.ready_timeout:g}s")
+
+    if args.image:
+        with open(args.image, "rb") as f:
+            image = f.read()
+    else:
+        image = make_jpeg((1280, 960))
+    unique = not args.allow_cache
+
+    # Warm the server's connection handling and prediction path before measuring
+    run_level(host, port, image, args.batch, 1, 1.0, True, unique)
+
+    report = {
+        "url": args.url,
+        "image_bytes": len(image),
+        "batch": args.batch,
+        "keepalive": not args.no_keepalive,
+        "cache_busting": unique,
+        "duration_s": args.duration,
+        "levels": [],
+    }
+    for concurrency in args.concurrency:
+        print(f"concurrency {concurrency} ...", file=sys.stderr)
+        report["levels"].append(
+            run_level(host, port, image, args.batch, concurrency, args.duration, not args.no_keepalive, unique)
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Bytes sent to the browser to display one uploaded leaf, before and after server-side previews.
+
+Renders the image through Streamlit (via its AppTest harness) the old way,
+``st.image(Image.open(upload), use_container_width=True)``, and the new way,
+``st.image(preview_jpeg, ...)`` with the preview produced by session.UploadMemo.
+It then reads how many bytes Streamlit stored for the browser to fetch.
+
+Usage: python benchmarks/preview_bytes.py [--image leaf.jpg ...] [--max-dim 800] [--quality 80]
+"""
+import argparse
+import json
+import time
+
+from common import make_jpeg
+
+
+def render_app(data, mode, max_dim, quality):
+    import io
+    import json
+
+    import streamlit as st
+    from PIL import Image
+    from streamlit import runtime
+
+    from preprocessing import decode_image, encode_preview
+
+    if mode == "full":
+        st.image(Image.open(io.BytesIO(data)), use_container_width=True)
+    else:
+        image = decode_image(data, (max_dim, max_dim))
+        st.image(encode_preview(image, max_dim, quality), use_container_width=True)
+    # Media files Streamlit serves to the browser for this run
+    storage = runtime.get_instance().media_file_mgr._storage
+    st.text(json.dumps({"sent_bytes": sum(len(f.content) for f in storage._files_by_id.values())}))
+
+
+def sent_bytes(data, mode, max_dim, quality):
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_function(render_app, args=(data, mode, max_dim, quality), default_timeout=60).run()
+    if app.exception:
+        raise RuntimeError(app.exception[0].message)
+    return json.loads(app.text[-1].value)["sent_bytes"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--image", nargs="+", help="JPEG/PNG uploads (default: synthetic phone-size photos)")
+    parser.add_argument("--max-dim", type=int, default=800)
+    parser.add_argument("--quality", type=int, default=80)
+    args = parser.parse_args()
+
+    if args.image:
+        uploads = {}
+        for path in args.image:
+            with open(path, "rb") as f:
+                uploads[path] = f.read()
+    else:
+        uploads = {f"{w}x{h} JPEG": make_jpeg((w, h), quality=92) for w, h in [(4032, 3024), (3000, 4000),
+                                                                               (1600, 1200)]}
+
+    from preprocessing import decode_image, encode_preview
+
+    results = []
+    for name, data in uploads.items():
+        start = time.perf_counter()
+        image = decode_image(data, (args.max_dim, args.max_dim))
+        encode_preview(image, args.max_dim, args.quality)
+        preview_s = time.perf_counter() - start
+
+        before = sent_bytes(data, "full", args.max_dim, args.quality)
+        after = sent_bytes(data, "preview", args.max_dim, args.quality)
+        results.append({
+            "upload": name,
+            "upload_bytes": len(data),
+            "sent_bytes_before": before,
+            "sent_bytes_after": after,
+            "reduction": before / after,
+            "decode_and_preview_ms": preview_s * 1000,
+        })
+    print(json.dumps({"max_dim": args.max_dim, "quality": args.quality, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
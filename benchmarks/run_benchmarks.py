@@ -0,0 +1,281 @@
+"""Latency and throughput benchmarks for the inference path, written as JSON.
+
+Runs on CPU against a small stand-in Keras model with the production
+input/output shape (224x224x3 -> 38 classes) unless --model points at real weights.
+
+Usage: python benchmarks/run_benchmarks.py [--model path.h5] [--output results.json] [--only NAME ...]
+"""
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from common import environment, make_jpeg, percentiles, save_standin_model, time_repeated
+from engine import PlantDiseaseClassifier
+from instrumentation import history as timing_history
+from preprocessing import load_and_preprocess_image
+
+BATCH_SIZES = [1, 2, 4, 8, 16, 32, 64]
+RESOLUTIONS = [(320, 240), (640, 480), (1280, 960), (1920, 1080), (4032, 3024)]
+
+COLD_LOAD_SNIPPET = """
+import json, sys, time
+t0 = time.perf_counter()
+import tensorflow as tf
+t1 = time.perf_counter()
+model = tf.keras.models.load_model(sys.argv[1])
+t2 = time.perf_counter()
+model(tf.zeros((1, 224, 224, 3)), training=False)
+t3 = time.perf_counter()
+print(json.dumps({"import_s": t1 - t0, "load_s": t2 - t1, "first_call_s": t3 - t2}))
+"""
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    def register(fn):
+        BENCHMARKS[name] = fn
+        return fn
+    return register
+
+
+# Each run is a fresh interpreter, so TensorFlow import and model deserialization are truly cold
+@benchmark("cold_load")
+def bench_cold_load(ctx):
+    runs = []
+    for _ in range(ctx.cold_runs):
+        output = subprocess.run(
+            [sys.executable, "-c", COLD_LOAD_SNIPPET, ctx.model_path],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    return {
+        key: {"median_s": float(np.median([run[key] for run in runs])), "runs": [run[key] for run in runs]}
+        for key in runs[0]
+    }
+
+
+@benchmark("single_image_latency")
+def bench_single_image_latency(ctx):
+    data = make_jpeg((1280, 960))
+    timing_history.clear()
+    samples = time_repeated(lambda: ctx.classifier.predict(io.BytesIO(data)), ctx.repeat)
+    stages = {name: seconds * 1000.0 for name, seconds in timing_history.mean().items()}
+    return {"input": "1280x960 JPEG", **percentiles(samples), "stage_mean_ms": stages}
+
+
+@benchmark("batch_throughput")
+def bench_batch_throughput(ctx):
+    results = []
+    for batch_size in BATCH_SIZES:
+        batch = np.random.default_rng(0).random((batch_size, 224, 224, 3), dtype=np.float32)
+        repeat = max(3, ctx.repeat // batch_size)
+        samples = time_repeated(lambda: ctx.classifier.predict_preprocessed(batch), repeat, warmup=2)
+        median = float(np.median(samples))
+        results.append({
+            "batch_size": batch_size,
+            "median_batch_ms": median * 1000.0,
+            "images_per_s": batch_size / median,
+        })
+    return results
+
+
+@benchmark("preprocessing_vs_resolution")
+def bench_preprocessing(ctx):
+    results = []
+    for size in RESOLUTIONS:
+        data = make_jpeg(size)
+        samples = time_repeated(lambda: load_and_preprocess_image(io.BytesIO(data)), max(5, ctx.repeat // 5))
+        results.append({"resolution": f"{size[0]}x{size[1]}", "jpeg_bytes": len(data), **percentiles(samples)})
+    return results
+
+
+# model.predict builds a data adapter, step loop and callbacks on every call; calling the model does not
+@benchmark("predict_overhead")
+def bench_predict_overhead(ctx):
+    model = ctx.classifier.model
+    results = {}
+    for batch_size in (1, 32):
+        batch = np.random.default_rng(0).random((batch_size, 224, 224, 3), dtype=np.float32)
+        via_predict = time_repeated(lambda: model.predict(batch, verbose=0), ctx.repeat)
+        direct = time_repeated(lambda: model(batch, training=False), ctx.repeat)
+        results[f"batch_{batch_size}"] = {
+            "model_predict": percentiles(via_predict),
+            "direct_call": percentiles(direct),
+            "overhead_ms": (np.median(via_predict) - np.median(direct)) * 1000.0,
+        }
+    return results
+
+
+# Compiled, bucketed serving path used by the engine versus model.predict on the same batches
+@benchmark("serving_path")
+def bench_serving_path(ctx):
+    model = ctx.classifier.model
+    predictor = ctx.classifier.predictor
+    results = {"warmup_s": {str(bucket): seconds for bucket, seconds in ctx.classifier.warmup_timings.items()}}
+    for batch_size in (1, 3, 16, 32):
+        batch = np.random.default_rng(0).random((batch_size, 224, 224, 3), dtype=np.float32)
+        via_predict = time_repeated(lambda: model.predict(batch, verbose=0), ctx.repeat)
+        compiled = time_repeated(lambda: predictor(batch), ctx.repeat)
+        results[f"batch_{batch_size}"] = {
+            "padded_to": predictor.bucket_for(batch_size),
+            "model_predict": percentiles(via_predict),
+            "compiled": percentiles(compiled),
+            "speedup": float(np.median(via_predict) / np.median(compiled)),
+        }
+    return results
+
+
+# Fresh-process load time of the .h5 versus the SavedModel produced by convert_model.py
+@benchmark("artifact_load")
+def bench_artifact_load(ctx):
+    from convert_model import convert
+
+    with tempfile.TemporaryDirectory() as tmp:
+        metadata = convert(ctx.model_path, os.path.join(tmp, "converted"), load_runs=ctx.cold_runs)
+    return {"load_time_s": metadata["load_time_s"], "max_abs_diff": metadata["max_abs_diff"]}
+
+
+# Every backend on the same weights: load time and memory, single-image latency, batch throughput
+@benchmark("backends")
+def bench_backends(ctx):
+    from backends import create_backend
+    from convert_model import convert
+    from quantize import convert_variant
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        saved_model = os.path.join(tmp, "converted")
+        convert(ctx.model_path, saved_model, load_runs=0)
+        tflite_path = os.path.join(tmp, "float16.tflite")
+        with open(tflite_path, "wb") as f:
+            f.write(convert_variant(saved_model, "float16"))
+
+        candidates = [("keras", ctx.model_path, {}), ("savedmodel", saved_model, {})]
+        candidates += [("tflite", tflite_path, {"num_threads": threads})
+                       for threads in sorted({1, os.cpu_count() or 1})]
+        rng = np.random.default_rng(0)
+        single = rng.random((1, 224, 224, 3), dtype=np.float32)
+        batch = rng.random((16, 224, 224, 3), dtype=np.float32)
+        for name, path, options in candidates:
+            backend = create_backend(name, path, **options).load()
+            backend.warmup()
+            latency = time_repeated(lambda: backend.predict_batch(single), ctx.repeat)
+            throughput = time_repeated(lambda: backend.predict_batch(batch), max(3, ctx.repeat // 16))
+            label = name if not options else f"{name}_threads{options['num_threads']}"
+            stats = backend.stats()
+            results[label] = {
+                "load_time_s": stats["load_time_s"],
+                "load_memory_mb": stats["load_memory_mb"],
+                "single_image": percentiles(latency),
+                "batch16_images_per_s": 16 / float(np.median(throughput)),
+            }
+    return results
+
+
+# Many concurrent single-image clients: each calling the backend directly versus sharing a scheduler
+@benchmark("micro_batching")
+def bench_micro_batching(ctx):
+    from concurrent.futures import ThreadPoolExecutor
+
+    from scheduler import MicroBatchScheduler
+
+    backend = ctx.classifier.backend
+    image = np.random.default_rng(0).random((1, 224, 224, 3), dtype=np.float32)
+    requests_per_client = max(5, ctx.repeat // 4)
+
+    def run_clients(call, clients):
+        def client():
+            samples = []
+            for _ in range(requests_per_client):
+                start = time.perf_counter()
+                call(image)
+                samples.append(time.perf_counter() - start)
+            return samples
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=clients) as pool:
+            samples = [s for result in [pool.submit(client) for _ in range(clients)] for s in result.result()]
+        elapsed = time.perf_counter() - start
+        return {"requests_per_s": len(samples) / elapsed, **percentiles(samples)}
+
+    results = {}
+    for clients in (1, 4, 16, 32):
+        scheduler = MicroBatchScheduler(backend.predict_batch, max_batch_size=32, max_wait_ms=5.0,
+                                        max_queue=256).start()
+        results[f"clients_{clients}"] = {
+            "direct": run_clients(backend.predict_batch, clients),
+            "micro_batched": run_clients(scheduler.predict, clients),
+            "mean_batch_size": scheduler.metrics()["mean_batch_size"],
+        }
+        scheduler.stop()
+    return results
+
+
+@benchmark("postprocess")
+def bench_postprocess(ctx):
+    postprocessor = ctx.classifier.postprocessor
+    rng = np.random.default_rng(0)
+    results = []
+    for batch_size in BATCH_SIZES:
+        probabilities = rng.dirichlet(np.full(len(postprocessor.labels), 0.3), size=batch_size).astype(np.float32)
+        samples = time_repeated(lambda: postprocessor(probabilities), ctx.repeat)
+        stats = percentiles(samples)
+        results.append({"batch_size": batch_size, **stats, "per_image_us": stats["mean_ms"] * 1000 / batch_size})
+    return results
+
+
+class Context:
+    def __init__(self, model_path, repeat, cold_runs):
+        self.model_path = model_path
+        self.repeat = repeat
+        self.cold_runs = cold_runs
+        self._classifier = None
+
+    # Always the Keras backend: predict_overhead and serving_path compare model.predict with the
+    # compiled path, and a converted SavedModel next to the .h5 has no predict
+    @property
+    def classifier(self):
+        if self._classifier is None:
+            self._classifier = PlantDiseaseClassifier(model_path=self.model_path, backend="keras").load()
+        return self._classifier
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", help="model file to benchmark (default: stand-in model)")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--repeat", type=int, default=100, help="samples for latency measurements")
+    parser.add_argument("--cold-runs", type=int, default=3)
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), help="run a subset")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        model_path = args.model or save_standin_model(os.path.join(tmp, "standin_model.h5"))
+        ctx = Context(model_path, args.repeat, args.cold_runs)
+        report = {
+            "environment": environment(),
+            "model": {"path": args.model or "stand-in", "bytes": os.path.getsize(model_path)},
+            "results": {},
+            "wall_s": {},
+        }
+        for name in args.only or BENCHMARKS:
+            print(f"running {name} ...", file=sys.stderr)
+            start = time.perf_counter()
+            report["results"][name] = BENCHMARKS[name](ctx)
+            report["wall_s"][name] = time.perf_counter() - start
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report["results"], indent=2))
+
+
+if __name__ == "__main__":
+    main()
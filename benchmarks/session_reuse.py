@@ -0,0 +1,91 @@
+"""Counts image decodes and forward passes across simulated Streamlit reruns.
+
+Replays a typical session (upload, analyze, then unrelated widget clicks, tab
+switches and a second analyze) twice: once the way the UI worked before
+per-session memoization (decode for display on every rerun, classify on every
+click), and once through session.UploadMemo. Fails if the memoized session
+decodes an upload more than once or runs more than one forward pass for it.
+
+Usage: python benchmarks/session_reuse.py [--model path.h5] [--uploads 3]
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+from common import make_jpeg, save_standin_model
+from engine import PlantDiseaseClassifier
+from instrumentation import counters
+from preprocessing import decode_image
+from session import UploadMemo
+
+# What each rerun of the script does besides rendering: "analyze" clicks the button
+SESSION = ["upload", "analyze", "rerun", "switch_tab", "rerun", "analyze", "rerun"]
+
+
+class FakeUpload(io.BytesIO):
+    """Stands in for streamlit's UploadedFile: bytes plus a stable file_id and name."""
+
+    def __init__(self, data, file_id, name):
+        super().__init__(data)
+        self.file_id = file_id
+        self.name = name
+
+
+def replay_without_memo(classifier, uploads):
+    for action in SESSION:
+        for upload in uploads:
+            decode_image(upload, None)
+        if action == "analyze":
+            classifier.predict_batch(uploads)
+
+
+def replay_with_memo(classifier, uploads):
+    state = {}
+    for action in SESSION:
+        memo = UploadMemo(state, classifier)
+        memo.sync(uploads)
+        for upload in uploads:
+            memo.image(upload)
+        if action == "analyze":
+            memo.predict(uploads)
+        else:
+            memo.predictions(uploads)
+
+
+def measure(replay, model_path, uploads):
+    classifier = PlantDiseaseClassifier(model_path=model_path).load()
+    counters.clear()
+    start = time.perf_counter()
+    replay(classifier, uploads)
+    return {"wall_s": time.perf_counter() - start, **counters.snapshot()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", help="model file (default: stand-in model)")
+    parser.add_argument("--uploads", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        model_path = args.model or save_standin_model(os.path.join(tmp, "standin_model.h5"))
+        uploads = [FakeUpload(make_jpeg((1600 + 16 * i, 1200)), f"file-{i}", f"leaf{i}.jpg")
+                   for i in range(args.uploads)]
+        report = {
+            "session": SESSION,
+            "uploads": args.uploads,
+            "without_memo": measure(replay_without_memo, model_path, uploads),
+            "with_memo": measure(replay_with_memo, model_path, uploads),
+        }
+    print(json.dumps(report, indent=2))
+
+    memoized = report["with_memo"]
+    if memoized.get("decode", 0) > args.uploads or memoized.get("forward", 0) > 1:
+        sys.exit("memoized session repeated decodes or forward passes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+# Versions already computed in this process, by (real path, size, mtime)
+_model_versions = {}
+_model_versions_lock = threading.Lock()
+
+
+# Fingerprint of the model file's contents, so copies and checkouts of the same weights agree on
+# it wherever they are. Hashing is memoized on size and mtime, which change whenever the file does
+def model_version(model_path):
+    try:
+        stat = os.stat(model_path)
+    except OSError:
+        return "unknown"
+    memo_key = (os.path.realpath(model_path), stat.st_size, stat.st_mtime_ns)
+    with _model_versions_lock:
+        version = _model_versions.get(memo_key)
+    if version is None:
+        digest = hashlib.sha256()
+        with open(model_path, "rb") as f:
+            for chunk in iter(lambda: f.read(2 ** 20), b""):
+                digest.update(chunk)
+        version = digest.hexdigest()[:16]
+        with _model_versions_lock:
+            _model_versions[memo_key] = version
+    return version
+
+
+class PredictionCache:
+    """Prediction results keyed by image content hash and model version.
+
+    Entries live in a bounded in-memory LRU; when ``disk_dir`` is set they are
+    also persisted as small JSON files so they survive restarts. The disk tier
+    is bounded too: past ``disk_max_bytes`` the least recently used files are
+    deleted (after a restart, the least recently written). Values must be
+    JSON-serializable.
+    """
+
+    def __init__(self, max_entries=512, disk_dir=None, disk_max_bytes=256 * 2 ** 20):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._entries = OrderedDict()
+        # Size of every file in the disk tier, least recently used first
+        self._disk_files = OrderedDict()
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._scan_disk()
+
+    @staticmethod
+    def make_key(data, version):
+        return content_hash(version.encode() + b"\0" + data)
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+
+        value = self._read_disk(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._store(key, value)
+            if key in self._disk_files:
+                self._disk_files.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._store(key, value)
+        self._write_disk(key, value)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "disk_entries": len(self._disk_files),
+                "disk_bytes": self._disk_bytes,
+                "disk_evictions": self.disk_evictions,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _store(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _scan_disk(self):
+        files = []
+        for root, _, names in os.walk(self.disk_dir):
+            for name in names:
+                if name.endswith(".json"):
+                    try:
+                        stat = os.stat(os.path.join(root, name))
+                    except OSError:
+                        continue
+                    files.append((stat.st_mtime_ns, name[:-len(".json")], stat.st_size))
+        for _, key, size in sorted(files):
+            self._disk_files[key] = size
+            self._disk_bytes += size
+        with self._lock:
+            self._evict_disk()
+
+    # Delete least recently used files until the disk tier fits disk_max_bytes; called with the lock held
+    def _evict_disk(self):
+        while self.disk_max_bytes and self._disk_bytes > self.disk_max_bytes and len(self._disk_files) > 1:
+            key, size = self._disk_files.popitem(last=False)
+            self._disk_bytes -= size
+            self.disk_evictions += 1
+            try:
+                os.remove(self._disk_path(key))
+            except OSError:
+                pass
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def _read_disk(self, key):
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._disk_path(key)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_disk(self, key, value):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first so readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(value, f)
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        with self._lock:
+            self._disk_bytes += size - self._disk_files.pop(key, 0)
+            self._disk_files[key] = size
+            self._evict_disk()
@@ -0,0 +1,373 @@
+"""Two-stage cascade: a cheap healthy/diseased gate in front of the full classifier, and the tool that builds it.
+
+The gate is the deployed network truncated after an early layer, its feature
+maps pooled (mean and max per channel), followed by a softmax head over
+(crop, healthy or diseased) groups. The head is fitted to the full model's
+own predictions summed per group, so no labels are needed and the gate
+learns to agree with the model it screens for. Leaves it calls healthy with
+enough confidence exit early; everything else runs through the full network.
+The gate is saved next to the model (``*_gate.h5``), and is used by the app
+only while it matches the deployed model.
+
+    fit DATA_DIR        fit the gate on the images under DATA_DIR (any folder
+                        layout) and save it next to the model
+    evaluate DATA_DIR   report, for each --thresholds value, the share of
+                        images that exit early, agreement of the cascade's
+                        diagnosis with the full model and the latency saved
+
+Usage: python cascade.py fit DATA_DIR [--model path.h5] [--layer NAME] [--budget 0.33] [--limit N]
+       python cascade.py evaluate DATA_DIR [--model path.h5] [--thresholds 80 90 95 99] [--limit N]
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from itertools import islice
+
+import numpy as np
+
+from backends import create_backend
+from cache import model_version
+from postprocess import LabelIndex
+from serving import DEFAULT_BATCH_BUCKETS, CompiledPredictor
+
+
+# (crop, healthy) groups in order of first appearance, and the group of each class
+def gate_groups(labels):
+    keys = [(crop, "healthy" in label.lower()) for label, crop in zip(labels.labels, labels.crops)]
+    groups = list(dict.fromkeys(keys))
+    return groups, np.array([groups.index(key) for key in keys])
+
+
+def write_metadata(path, metadata):
+    with open(f"{path}.json", "w") as f:
+        json.dump(metadata, f, indent=2)
+
+
+def read_gate_metadata(path):
+    try:
+        with open(f"{path}.json") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class CascadeGate:
+    """First stage of the cascade: a small model that screens leaves as healthy or diseased, per crop.
+
+    ``__call__`` runs the gate on a preprocessed batch. A row exits early
+    when its most likely group is a healthy crop with at least ``threshold``
+    percent confidence; its class probabilities then come from the gate, each
+    group's probability spread over the group's classes. Other rows escalate
+    to the full model, whose time the classifier reports back through
+    ``record_escalation`` so the latency saved can be estimated.
+    """
+
+    def __init__(self, path, threshold=95.0, input_shape=(224, 224, 3), buckets=DEFAULT_BATCH_BUCKETS):
+        metadata = read_gate_metadata(path)
+        if metadata is None:
+            raise ValueError(f"{path} has no gate metadata; rebuild it with cascade.py fit")
+        self.path = path
+        self.threshold = threshold
+        self.source_version = metadata["source_version"]
+        self.labels = list(metadata["labels"])
+        groups, self.class_groups = gate_groups(LabelIndex({str(i): label for i, label in enumerate(self.labels)}))
+        self.healthy = np.array([healthy for _, healthy in groups])
+        self.group_sizes = np.bincount(self.class_groups)
+        self.backend = create_backend("keras", path, input_shape, buckets)
+        self._lock = threading.Lock()
+
+        self.rows = 0
+        self.early_exits = 0
+        self.gate_seconds = 0.0
+        self._escalations = deque(maxlen=1000)
+
+    def warmup(self):
+        return self.backend.warmup()
+
+    # Early-exit mask and per-class probabilities for (N, groups) gate outputs
+    def decide(self, gate, threshold):
+        best = gate.argmax(axis=1)
+        confidence = gate[np.arange(len(gate)), best] * 100.0
+        exits = self.healthy[best] & (confidence >= threshold)
+        return exits, gate[:, self.class_groups] / self.group_sizes[self.class_groups]
+
+    def __call__(self, batch):
+        start = time.perf_counter()
+        exits, probabilities = self.decide(np.asarray(self.backend.predict_batch(batch)), self.threshold)
+        with self._lock:
+            self.rows += len(batch)
+            self.early_exits += int(exits.sum())
+            self.gate_seconds += time.perf_counter() - start
+        return exits, probabilities
+
+    # Time the full model took for rows the gate escalated
+    def record_escalation(self, rows, seconds):
+        with self._lock:
+            self._escalations.append((rows, seconds))
+
+    def stats(self):
+        with self._lock:
+            escalations = list(self._escalations)
+            stats = {
+                "path": self.path,
+                "threshold": self.threshold,
+                "rows": self.rows,
+                "early_exits": self.early_exits,
+                "early_exit_fraction": self.early_exits / self.rows if self.rows else None,
+                "gate_ms_per_row": self.gate_seconds / self.rows * 1000 if self.rows else None,
+            }
+        if escalations:
+            full_ms = sum(seconds for _, seconds in escalations) / sum(rows for rows, _ in escalations) * 1000
+            stats["full_model_ms_per_row"] = full_ms
+            # Per request: exits skip the full model, every request pays for the gate
+            stats["saved_ms_per_row"] = stats["early_exit_fraction"] * full_ms - stats["gate_ms_per_row"]
+        return stats
+
+
+# Multiply-accumulates of each layer: kernel size times output positions (0 for layers without a kernel)
+def layer_costs(model):
+    costs = []
+    for layer in model.layers:
+        kernel = getattr(layer, "kernel", None)
+        if kernel is None:
+            costs.append(0)
+            continue
+        shape = layer.output.shape
+        positions = int(np.prod(shape[1:-1])) if len(shape) > 2 else 1
+        costs.append(int(np.prod(kernel.shape)) * positions)
+    return costs
+
+
+# Deepest layer (below the classifier head) whose cumulative cost is at most budget of the whole network
+def choose_gate_layer(model, budget):
+    costs = np.cumsum(layer_costs(model))
+    candidates = [i for i in range(len(model.layers) - 1) if 0 < costs[i] <= budget * costs[-1]]
+    if not candidates:
+        raise ValueError(f"no layer of this model costs at most {budget:.0%} of a forward pass; pass --layer")
+    return model.layers[candidates[-1]].name
+
+
+# Features the gate head sees: the layer's output, feature maps pooled to their mean and max per channel
+def feature_model(model, layer_name):
+    import tensorflow as tf
+
+    features = model.get_layer(layer_name).output
+    if len(features.shape) == 4:
+        features = tf.keras.layers.Concatenate()([
+            tf.keras.layers.GlobalAveragePooling2D()(features),
+            tf.keras.layers.GlobalMaxPooling2D()(features),
+        ])
+    elif len(features.shape) > 2:
+        features = tf.keras.layers.Flatten()(features)
+    return tf.keras.Model(model.inputs, features)
+
+
+def softmax(logits):
+    logits = logits - logits.max(axis=1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+# Softmax regression of soft targets on features by full-batch Adam; returns (weights, bias) acting on
+# the raw features (the standardization is folded in)
+def fit_softmax(features, targets, l2=1e-4, steps=500, learning_rate=0.05):
+    mean, scale = features.mean(axis=0), features.std(axis=0) + 1e-6
+    x = (features - mean) / scale
+    weights = np.zeros((x.shape[1], targets.shape[1]), dtype=np.float64)
+    bias = np.log(targets.mean(axis=0) + 1e-6)
+    moments = [np.zeros_like(weights), np.zeros_like(bias)]
+    velocities = [np.zeros_like(weights), np.zeros_like(bias)]
+    for step in range(1, steps + 1):
+        error = (softmax(x @ weights + bias) - targets) / len(x)
+        gradients = [x.T @ error + l2 * weights, error.sum(axis=0)]
+        for parameter, gradient, moment, velocity in zip((weights, bias), gradients, moments, velocities):
+            moment[:] = 0.9 * moment + 0.1 * gradient
+            velocity[:] = 0.999 * velocity + 0.001 * gradient ** 2
+            parameter -= learning_rate * (moment / (1 - 0.9 ** step)) / (np.sqrt(velocity / (1 - 0.999 ** step)) + 1e-8)
+    weights = weights / scale[:, None]
+    return weights.astype(np.float32), (bias - mean @ weights).astype(np.float32)
+
+
+def build_gate_model(features, weights, bias):
+    import tensorflow as tf
+
+    head = tf.keras.layers.Dense(len(bias), activation="softmax", name="gate")
+    gate = tf.keras.Model(features.inputs, head(features.outputs[0]))
+    head.set_weights([weights, bias])
+    return gate
+
+
+# Full-model probabilities and gate features of every readable image under data_dir
+def collect_outputs(classifier, predictors, data_dir, batch_size=32, workers=4, limit=None):
+    from pipeline import iter_batches, iter_image_files
+
+    items = iter_image_files(data_dir)
+    if limit is not None:
+        items = islice(items, limit)
+    outputs = [[] for _ in predictors]
+    for batch_items, batch, errors in iter_batches(items, batch_size=batch_size, workers=workers,
+                                                   path_of=lambda item: os.path.join(data_dir, item)):
+        keep = [p for p in range(len(batch_items)) if p not in errors]
+        if keep:
+            rows = batch if len(keep) == len(batch) else batch[keep]
+            for output, predictor in zip(outputs, predictors):
+                output.append(np.asarray(predictor(rows)))
+        print(f"\r{sum(len(chunk) for chunk in outputs[0])} images", end="", file=sys.stderr)
+    print(file=sys.stderr)
+    return [np.concatenate(output) if output else None for output in outputs]
+
+
+# Diagnoses the cascade would serve at each threshold, compared with the full model's
+def agreement_report(gate, gate_outputs, full_probabilities, thresholds):
+    full_top1 = full_probabilities.argmax(axis=1)
+    full_groups = gate_groups_of(gate, full_probabilities).argmax(axis=1)
+    report = {
+        "images": len(full_top1),
+        "group_agreement": float((gate_outputs.argmax(axis=1) == full_groups).mean()),
+        "full_model_healthy_fraction": float(gate.healthy[full_groups].mean()),
+        "thresholds": [],
+    }
+    for threshold in thresholds:
+        exits, probabilities = gate.decide(gate_outputs, threshold)
+        served = np.where(exits, probabilities.argmax(axis=1), full_top1)
+        report["thresholds"].append({
+            "threshold": threshold,
+            "early_exit_fraction": float(exits.mean()),
+            "agreement": float((served == full_top1).mean()),
+            "early_exit_agreement": float((served[exits] == full_top1[exits]).mean()) if exits.any() else None,
+        })
+    return report
+
+
+# Full-model probabilities summed per gate group
+def gate_groups_of(gate, probabilities):
+    matrix = np.zeros((len(gate.class_groups), len(gate.group_sizes)), dtype=np.float32)
+    matrix[np.arange(len(gate.class_groups)), gate.class_groups] = 1.0
+    return probabilities @ matrix
+
+
+def per_image_ms(predictor, repeat=50):
+    image = np.zeros((1,) + predictor.input_shape, dtype=np.float32)
+    predictor(image)
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        predictor(image)
+        samples.append(time.perf_counter() - start)
+    return float(np.median(samples)) * 1000
+
+
+# Fits the gate for model_path on the images under data_dir, saves it next to the model and returns its metadata
+def fit_gate(model_path, data_dir, layer=None, budget=1 / 3, thresholds=(80.0, 90.0, 95.0, 99.0), l2=1e-4,
+             steps=500, limit=None, batch_size=32, workers=4):
+    from engine import PlantDiseaseClassifier, gate_model_path
+
+    classifier = PlantDiseaseClassifier(model_path=model_path, prefer_converted=False).load()
+    model = classifier.model
+    layer = layer or choose_gate_layer(model, budget)
+    costs = layer_costs(model)
+    layer_index = [existing.name for existing in model.layers].index(layer)
+    features = feature_model(model, layer)
+    extract = CompiledPredictor(lambda x: features(x, training=False), classifier.backend.input_shape)
+    probabilities, feature_rows = collect_outputs(classifier, (classifier.predictor, extract), data_dir,
+                                                  batch_size, workers, limit)
+    if probabilities is None:
+        raise ValueError(f"no readable images under {data_dir}")
+
+    labels = classifier.postprocessor.labels
+    groups, class_groups = gate_groups(labels)
+    group_matrix = np.zeros((len(labels), len(groups)), dtype=np.float32)
+    group_matrix[np.arange(len(labels)), class_groups] = 1.0
+    targets = probabilities @ group_matrix
+
+    # Hold out a fifth of the images to report how well the gate generalizes
+    order = np.random.default_rng(0).permutation(len(targets))
+    holdout, train = order[:len(order) // 5], order[len(order) // 5:]
+    weights, bias = fit_softmax(feature_rows[train], targets[train], l2, steps)
+    gate_model = build_gate_model(features, weights, bias)
+
+    path = gate_model_path(model_path)
+    gate_model.save(path)
+    metadata = {
+        "source_version": model_version(model_path),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "layer": layer,
+        "cost_fraction": float(sum(costs[:layer_index + 1]) / sum(costs)),
+        "feature_size": int(feature_rows.shape[1]),
+        "labels": labels.labels,
+        "groups": [list(group) for group in groups],
+        "fit_images": int(len(train)),
+        "holdout_images": int(len(holdout)),
+    }
+    write_metadata(path, metadata)
+    if len(holdout):
+        holdout_outputs = softmax(feature_rows[holdout] @ weights + bias)
+        metadata["holdout"] = agreement_report(CascadeGate(path), holdout_outputs, probabilities[holdout],
+                                               thresholds)
+        write_metadata(path, metadata)
+    return dict(metadata, path=path)
+
+
+# Agreement with the full model and latency of the fitted gate for model_path, on the images under data_dir
+def evaluate_cascade(model_path, data_dir, thresholds=(80.0, 90.0, 95.0, 99.0), limit=None, batch_size=32,
+                     workers=4):
+    from engine import PlantDiseaseClassifier, gate_model_path
+
+    path = gate_model_path(model_path)
+    gate = CascadeGate(path)
+    if gate.source_version != model_version(model_path):
+        raise ValueError(f"{path} was fitted to a different model; rerun cascade.py fit")
+    gate.warmup()
+    classifier = PlantDiseaseClassifier(model_path=model_path).load()
+    full_probabilities, gate_outputs = collect_outputs(
+        classifier, (classifier.predictor, gate.backend.predictor), data_dir, batch_size, workers, limit
+    )
+    if full_probabilities is None:
+        raise ValueError(f"no readable images under {data_dir}")
+    report = agreement_report(gate, gate_outputs, full_probabilities, thresholds)
+    full_ms, gate_ms = per_image_ms(classifier.predictor), per_image_ms(gate.backend.predictor)
+    report.update(model_format=classifier.model_format, full_model_ms=full_ms, gate_ms=gate_ms)
+    for entry in report["thresholds"]:
+        # Single-image requests: every request pays for the gate, escalated ones for the full model too
+        cascade_ms = gate_ms + (1 - entry["early_exit_fraction"]) * full_ms
+        entry.update(mean_latency_ms=cascade_ms, saved_ms=full_ms - cascade_ms, saved_fraction=1 - cascade_ms / full_ms)
+    return report
+
+
+def main():
+    from engine import DEFAULT_MODEL_PATH
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=["fit", "evaluate"])
+    parser.add_argument("data_dir", help="leaf images (sub-folders are searched)")
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH)
+    parser.add_argument("--layer", help="truncate the network after this layer (default: chosen by --budget)")
+    parser.add_argument("--budget", type=float, default=1 / 3,
+                        help="largest share of the full forward pass the truncated network may cost")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[80.0, 90.0, 95.0, 99.0],
+                        help="escalation thresholds (percent gate confidence) to report")
+    parser.add_argument("--l2", type=float, default=1e-4)
+    parser.add_argument("--steps", type=int, default=500)
+    parser.add_argument("--limit", type=int)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    args = parser.parse_args()
+    try:
+        if args.command == "fit":
+            metadata = fit_gate(args.model, args.data_dir, args.layer, args.budget, args.thresholds, args.l2,
+                                args.steps, args.limit, args.batch_size, args.workers)
+            print(json.dumps(dict(metadata, labels=len(metadata["labels"]), groups=len(metadata["groups"])),
+                             indent=2))
+        else:
+            print(json.dumps(evaluate_cascade(args.model, args.data_dir, args.thresholds, args.limit,
+                                              args.batch_size, args.workers), indent=2))
+    except ValueError as exc:
+        sys.exit(str(exc))
+
+
+if __name__ == "__main__":
+    main()
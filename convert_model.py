@@ -0,0 +1,148 @@
+"""Convert the .h5 Keras model into a fast-loading SavedModel for serving.
+
+Deserializing the full Keras graph from HDF5 is the slowest part of a cold
+start. This exports the model's inference function as a SavedModel with a
+serving signature (plus a ``serve_embeddings`` endpoint that also returns
+the penultimate-layer embedding), checks that its outputs match the original
+within a tolerance, and records the source fingerprint so the app only uses the
+converted artifact while it matches the deployed .h5. Meant to run during the
+Docker build.
+
+Usage: python convert_model.py [--model path.h5] [--output dir] [--atol 1e-5] [--if-present]
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from cache import model_version
+from engine import CONVERSION_METADATA, DEFAULT_MODEL_PATH, SAVED_MODEL_ENDPOINTS, converted_model_path
+from serving import embedding_forward
+
+LOAD_SNIPPET = """
+import json, sys, time
+import tensorflow as tf
+start = time.perf_counter()
+if sys.argv[2] == "savedmodel":
+    model = tf.saved_model.load(sys.argv[1])
+else:
+    model = tf.keras.models.load_model(sys.argv[1])
+print(json.dumps({"load_s": time.perf_counter() - start}))
+"""
+
+
+# Load time of an artifact in a fresh interpreter (TensorFlow import excluded)
+def measure_load_time(path, fmt, runs=3):
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", LOAD_SNIPPET, path, fmt],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1])["load_s"])
+    return float(np.median(samples))
+
+
+def export_saved_model(model, path):
+    import tensorflow as tf
+
+    signature = [tf.TensorSpec((None,) + tuple(model.input_shape[1:]), tf.float32)]
+    with_embeddings = embedding_forward(model)
+    if hasattr(model, "export"):
+        from keras.export import ExportArchive
+
+        archive = ExportArchive()
+        archive.track(model)
+        archive.add_endpoint("serve", lambda x: model(x, training=False), input_signature=signature)
+        archive.add_endpoint("serve_embeddings", with_embeddings, input_signature=signature)
+        archive.write_out(path, verbose=False)
+    else:
+        # tf.keras 2.x: save the inference functions under the same names
+        serve = tf.function(lambda x: model(x, training=False), input_signature=signature)
+        module = tf.Module()
+        module.model = model
+        module.serve = serve
+        module.serve_embeddings = tf.function(with_embeddings, input_signature=signature)
+        tf.saved_model.save(module, path, signatures={"serving_default": serve})
+
+
+def convert(model_path, output_path, atol=1e-5, samples=8, load_runs=3):
+    import tensorflow as tf
+
+    model = tf.keras.models.load_model(model_path)
+    input_shape = tuple(model.input_shape[1:])
+
+    # Export into a scratch directory and only move it into place once it is verified
+    parent = os.path.dirname(os.path.abspath(output_path))
+    scratch = tempfile.mkdtemp(dir=parent, prefix=".convert-")
+    try:
+        exported = os.path.join(scratch, "model")
+        export_saved_model(model, exported)
+
+        restored = tf.saved_model.load(exported)
+        batch = np.random.default_rng(0).random((samples,) + input_shape, dtype=np.float32)
+        expected = model(batch, training=False).numpy()
+        actual = restored.serve(batch).numpy()
+        # The embeddings endpoint must reproduce the probabilities in its leading columns
+        with_embeddings = restored.serve_embeddings(batch).numpy()[:, :expected.shape[1]]
+        max_abs_diff = float(max(np.abs(expected - actual).max(), np.abs(expected - with_embeddings).max()))
+        if max_abs_diff > atol:
+            raise ValueError(f"converted outputs differ by {max_abs_diff:.3g} (tolerance {atol:g})")
+
+        metadata = {
+            "source": os.path.basename(model_path),
+            "source_version": model_version(model_path),
+            "max_abs_diff": max_abs_diff,
+            "tolerance": atol,
+            "endpoints": list(SAVED_MODEL_ENDPOINTS),
+            "converted_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        }
+        if load_runs:
+            metadata["load_time_s"] = {
+                "h5": measure_load_time(model_path, "keras", load_runs),
+                "savedmodel": measure_load_time(exported, "savedmodel", load_runs),
+            }
+        with open(os.path.join(exported, CONVERSION_METADATA), "w") as f:
+            json.dump(metadata, f, indent=2)
+
+        if os.path.exists(output_path):
+            shutil.rmtree(output_path)
+        os.replace(exported, output_path)
+        return metadata
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH)
+    parser.add_argument("--output", help="default: next to the model as <name>_savedmodel")
+    parser.add_argument("--atol", type=float, default=1e-5, help="max allowed absolute output difference")
+    parser.add_argument("--samples", type=int, default=8, help="random inputs used for the output check")
+    parser.add_argument("--load-runs", type=int, default=3, help="fresh-process load timings (0 to skip)")
+    parser.add_argument("--if-present", action="store_true", help="exit quietly when the model file is missing")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.model):
+        if args.if_present:
+            print(f"{args.model} not found, skipping conversion")
+            return
+        sys.exit(f"model not found: {args.model}")
+
+    output = args.output or converted_model_path(args.model)
+    try:
+        metadata = convert(args.model, output, args.atol, args.samples, args.load_runs)
+    except ValueError as exc:
+        sys.exit(f"conversion rejected: {exc}")
+    print(json.dumps(metadata, indent=2))
+    print(f"wrote {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+HASH_BITS = 64
+# pHash: the lowest 8x8 DCT frequencies of a 32x32 grayscale thumbnail, each compared with their median
+THUMBNAIL_SIZE = 32
+HASH_FREQUENCIES = 8
+GRAY_WEIGHTS = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+
+def dct_matrix(size):
+    k = np.arange(size)
+    return np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / (2 * size)).astype(np.float32)
+
+
+DCT = dct_matrix(THUMBNAIL_SIZE)[:HASH_FREQUENCIES]
+
+
+# 64-bit perceptual hashes of a preprocessed float (N, H, W, 3) batch, as uint64 (N,). Robust to
+# recompression, rescaling and exposure changes; a crop of more than a few percent changes many bits
+def perceptual_hash(batch):
+    gray = np.asarray(batch) @ GRAY_WEIGHTS
+    height, width = gray.shape[1:]
+    # Area-average down to the thumbnail with two reduceat passes instead of a per-image resize
+    row_edges = np.linspace(0, height, THUMBNAIL_SIZE + 1).astype(int)
+    col_edges = np.linspace(0, width, THUMBNAIL_SIZE + 1).astype(int)
+    thumbnails = np.add.reduceat(np.add.reduceat(gray, row_edges[:-1], axis=1), col_edges[:-1], axis=2)
+    thumbnails /= np.outer(np.diff(row_edges), np.diff(col_edges))
+    frequencies = (DCT @ thumbnails @ DCT.T).reshape(len(gray), HASH_BITS)
+    # The DC term only carries overall brightness, so it is left out of the median
+    bits = frequencies > np.median(frequencies[:, 1:], axis=1, keepdims=True)
+    return np.packbits(bits, axis=1).view(">u8").ravel().astype(np.uint64)
+
+
+def hamming_distances(hashes, value):
+    return np.bitwise_count(hashes ^ np.uint64(value))
+
+
+# Bit ranges (shift, mask) splitting a 64-bit hash into `count` nearly equal chunks
+def chunk_layout(count):
+    widths = [HASH_BITS // count + (1 if i < HASH_BITS % count else 0) for i in range(count)]
+    layout = []
+    shift = 0
+    for width in widths:
+        layout.append((shift, (1 << width) - 1))
+        shift += width
+    return layout
+
+
+class DuplicateIndex:
+    """Perceptual hashes of classified images with their class probabilities, for near-duplicate lookup.
+
+    Lookups use multi-index hashing: each hash is split into ``max_distance + 1``
+    chunks, and by the pigeonhole principle any hash within ``max_distance``
+    bits agrees exactly with it on at least one chunk. Only entries sharing a
+    chunk with the query are compared bit by bit, so lookups stay fast with
+    hundreds of thousands of entries. The index holds at most ``max_entries``;
+    once full, the oldest entries are overwritten.
+    """
+
+    def __init__(self, max_distance=3, max_entries=200_000):
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        self._layout = chunk_layout(max_distance + 1)
+        self._tables = [{} for _ in self._layout]
+        self._hashes = np.zeros(0, dtype=np.uint64)
+        self._values = None
+        self._augmented = np.zeros(0, dtype=bool)
+        self._size = 0
+        self._next = 0
+        self._lock = threading.Lock()
+
+        self.lookups = 0
+        self.hits = 0
+        self.batch_hits = 0
+        self._lookup_times = deque(maxlen=1000)
+
+    def __len__(self):
+        return self._size
+
+    def _chunks(self, value):
+        return [(value >> shift) & mask for shift, mask in self._layout]
+
+    def _candidates(self, value):
+        candidates = []
+        for table, chunk in zip(self._tables, self._chunks(value)):
+            slots = table.get(chunk)
+            if slots:
+                candidates.extend(slots)
+        return candidates
+
+    # Slot of the closest indexed hash within max_distance bits, or None
+    def _nearest(self, value):
+        candidates = self._candidates(value)
+        if not candidates:
+            return None
+        slots = np.fromiter(candidates, dtype=np.intp, count=len(candidates))
+        distances = hamming_distances(self._hashes[slots], value)
+        best = int(distances.argmin())
+        return int(slots[best]) if distances[best] <= self.max_distance else None
+
+    def match(self, hashes):
+        """Look up a batch of hashes.
+
+        Returns ``(found, values, augmented, leaders)``: the positions with an
+        indexed near-duplicate, those entries' stored rows and augmented flags,
+        and for every position the earlier position in this batch it duplicates
+        (-1 if none). Positions with neither need a forward pass.
+        """
+        start = time.perf_counter()
+        found, slots = [], []
+        leaders = np.full(len(hashes), -1, dtype=np.intp)
+        fresh = []
+        with self._lock:
+            for position, value in enumerate(hashes.tolist()):
+                slot = self._nearest(value)
+                if slot is not None:
+                    found.append(position)
+                    slots.append(slot)
+                    continue
+                # Repeat shots uploaded together: reuse the first of them within this batch
+                if fresh:
+                    distances = hamming_distances(hashes[fresh], value)
+                    best = int(distances.argmin())
+                    if distances[best] <= self.max_distance:
+                        leaders[position] = fresh[best]
+                        continue
+                fresh.append(position)
+            values = self._values[slots] if slots else None
+            augmented = self._augmented[slots] if slots else None
+
+            self.lookups += len(hashes)
+            self.hits += len(found)
+            self.batch_hits += int((leaders >= 0).sum())
+            self._lookup_times.append((time.perf_counter() - start) / max(len(hashes), 1))
+        return found, values, augmented, leaders
+
+    # Index hashes with their rows (e.g. class probabilities) and whether each row came from test-time
+    # augmentation, overwriting the oldest entries when full
+    def add(self, hashes, values, augmented=None):
+        values = np.asarray(values)
+        if augmented is None:
+            augmented = np.zeros(len(values), dtype=bool)
+        with self._lock:
+            if self._values is None:
+                self._values = np.zeros((0, values.shape[1]), dtype=values.dtype)
+            for value, row, flag in zip(hashes.tolist(), values, augmented):
+                if self._size < self.max_entries:
+                    slot = self._size
+                    if slot == len(self._hashes):
+                        self._grow()
+                    self._size += 1
+                else:
+                    slot = self._next
+                    self._next = (self._next + 1) % self.max_entries
+                    for table, chunk in zip(self._tables, self._chunks(int(self._hashes[slot]))):
+                        table[chunk].remove(slot)
+                self._hashes[slot] = value
+                self._values[slot] = row
+                self._augmented[slot] = flag
+                for table, chunk in zip(self._tables, self._chunks(value)):
+                    table.setdefault(chunk, []).append(slot)
+
+    def _grow(self):
+        capacity = min(self.max_entries, max(1024, 2 * len(self._hashes)))
+        hashes = np.zeros(capacity, dtype=np.uint64)
+        hashes[:self._size] = self._hashes[:self._size]
+        values = np.zeros((capacity, self._values.shape[1]), dtype=self._values.dtype)
+        values[:self._size] = self._values[:self._size]
+        augmented = np.zeros(capacity, dtype=bool)
+        augmented[:self._size] = self._augmented[:self._size]
+        self._hashes, self._values, self._augmented = hashes, values, augmented
+
+    def clear(self):
+        with self._lock:
+            self._tables = [{} for _ in self._layout]
+            self._size = 0
+            self._next = 0
+
+    def stats(self):
+        with self._lock:
+            lookup_times = np.array(self._lookup_times) * 1e6
+            reused = self.hits + self.batch_hits
+            return {
+                "entries": self._size,
+                "lookups": self.lookups,
+                "index_hits": self.hits,
+                "batch_hits": self.batch_hits,
+                "dedupe_rate": reused / self.lookups if self.lookups else 0.0,
+                "lookup_us_p50": float(np.percentile(lookup_times, 50)) if lookup_times.size else None,
+                "lookup_us_p99": float(np.percentile(lookup_times, 99)) if lookup_times.size else None,
+            }
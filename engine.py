@@ -0,0 +1,426 @@
+import json
+import os
+import time
+
+import numpy as np
+
+from backends import create_backend
+from cache import model_version as compute_model_version
+from dedupe import perceptual_hash
+from instrumentation import StageTimer, counters, history as timing_history
+from postprocess import PostProcessor, Prediction
+from preprocessing import TARGET_SIZE, decode_image, preprocess_batch, read_image_bytes
+from scheduler import MicroBatchScheduler
+from serving import DEFAULT_BATCH_BUCKETS
+
+# Define working directory and model paths
+WORKING_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_MODEL_PATH = os.path.join(WORKING_DIR, "trained_model", "plant_disease_prediction_model.h5")
+DEFAULT_CLASS_INDICES_PATH = os.path.join(WORKING_DIR, "class_indices.json")
+
+# Location of the fast-loading SavedModel produced from a .h5 file by convert_model.py
+def converted_model_path(model_path):
+    return os.path.splitext(model_path)[0] + "_savedmodel"
+
+
+CONVERSION_METADATA = "conversion.json"
+# Endpoints of SavedModels written by convert_model.py; older conversions only have "serve"
+SAVED_MODEL_ENDPOINTS = ("serve", "serve_embeddings")
+
+MODEL_VARIANTS = ("float32", "float16", "int8")
+
+
+# Location of a quantized TFLite variant produced from a .h5 file by quantize.py
+def quantized_model_path(model_path, variant):
+    return f"{os.path.splitext(model_path)[0]}_{variant}.tflite"
+
+
+# Location of the cascade gate fitted to a .h5 file by cascade.py
+def gate_model_path(model_path):
+    return f"{os.path.splitext(model_path)[0]}_gate.h5"
+
+
+def read_conversion_metadata(saved_model_path):
+    try:
+        with open(os.path.join(saved_model_path, CONVERSION_METADATA)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+# Load the class indices
+def load_class_indices(path=DEFAULT_CLASS_INDICES_PATH):
+    with open(path) as f:
+        return json.load(f)
+
+
+class PlantDiseaseClassifier:
+    """Headless inference engine: decode, preprocess, forward pass and post-processing.
+
+    TensorFlow is imported and the model loaded on first use, so importing this
+    module stays cheap for the UI, batch jobs and tests.
+    """
+
+    def __init__(self, model_path=DEFAULT_MODEL_PATH, class_indices_path=DEFAULT_CLASS_INDICES_PATH,
+                 target_size=TARGET_SIZE, top_k=3, cache=None, batch_buckets=DEFAULT_BATCH_BUCKETS,
+                 prefer_converted=True, variant="float32", tflite_threads=None, backend="auto",
+                 prediction_log=None, dedupe=None, tta=None, embeddings=False, similar_cases=None, cascade=None):
+        if variant not in MODEL_VARIANTS:
+            raise ValueError(f"unknown model variant {variant!r}, expected one of {MODEL_VARIANTS}")
+        self.model_path = model_path
+        self.model_version = compute_model_version(model_path)
+        self.variant = variant
+        self.cache = cache
+        self.dedupe = dedupe
+        self.tta = tta
+        self.prediction_log = prediction_log
+        self.similar_cases = similar_cases
+        self.target_size = target_size
+        self.class_indices = load_class_indices(class_indices_path)
+        self.postprocessor = PostProcessor(self.class_indices, top_k)
+
+        # Quantized variants carry no embedding output; predictions then come without embeddings
+        self.embeddings = embeddings and variant == "float32" and backend != "tflite"
+        backend_name, artifact_path = self._resolve_backend(backend, prefer_converted)
+        options = {"num_threads": tflite_threads} if backend_name == "tflite" else {}
+        self.backend = create_backend(
+            backend_name, artifact_path, (target_size[1], target_size[0], 3), batch_buckets,
+            embeddings=self.embeddings, **options
+        )
+        # A gate fitted to another model would screen for the wrong network; serve without the cascade
+        self.cascade = None
+        if (cascade is not None and cascade.source_version == self.model_version
+                and cascade.labels == self.postprocessor.labels.labels):
+            self.cascade = cascade
+        if variant != "float32":
+            self.model_version = f"{self.model_version}-{variant}"
+        self.scheduler = None
+        self._embedding_size = None
+
+    # Pick the backend and artifact: "auto" serves a quantized variant through TFLite, otherwise
+    # the converted SavedModel when it matches the deployed .h5, falling back to the .h5 itself
+    def _resolve_backend(self, backend, prefer_converted):
+        if backend == "auto":
+            if self.variant != "float32":
+                backend = "tflite"
+            elif prefer_converted and self._find_converted_model():
+                backend = "savedmodel"
+            else:
+                backend = "keras"
+
+        if backend == "tflite":
+            if self.variant == "float32":
+                raise ValueError("the tflite backend serves a quantized variant; set variant to float16 or int8")
+            path = quantized_model_path(self.model_path, self.variant)
+            self._check_quantized_model(path)
+            return backend, path
+        if self.variant != "float32":
+            raise ValueError(f"the {self.variant} variant is only available through the tflite backend")
+        if backend == "savedmodel":
+            path = self._find_converted_model()
+            if path is None:
+                raise ValueError(f"no up-to-date converted model at {converted_model_path(self.model_path)}; "
+                                 "run convert_model.py")
+            return backend, path
+        return backend, self.model_path
+
+    # Use the converted SavedModel only when it was built from the .h5 that is deployed now (and
+    # has the embeddings endpoint, when embeddings are wanted)
+    def _find_converted_model(self):
+        path = converted_model_path(self.model_path)
+        metadata = read_conversion_metadata(path)
+        if metadata is None or not os.path.exists(os.path.join(path, "saved_model.pb")):
+            return None
+        if self.embeddings and "serve_embeddings" not in metadata.get("endpoints", ("serve",)):
+            return None
+        if os.path.exists(self.model_path):
+            return path if metadata.get("source_version") == self.model_version else None
+        # Slim deployments may ship only the converted artifact
+        self.model_version = metadata.get("source_version", self.model_version)
+        return path
+
+    # A quantized variant built from an older .h5 would silently serve stale weights
+    def _check_quantized_model(self, path):
+        try:
+            with open(f"{path}.json") as f:
+                metadata = json.load(f)
+        except (OSError, ValueError):
+            metadata = {}
+        source_version = metadata.get("source_version")
+        if os.path.exists(self.model_path):
+            if source_version is not None and source_version != self.model_version:
+                raise ValueError(f"{path} was built from a different model; rerun quantize.py")
+        elif source_version is not None:
+            self.model_version = source_version
+
+    @property
+    def model_format(self):
+        return self.backend.name
+
+    @property
+    def model(self):
+        return self.backend.model
+
+    @property
+    def predictor(self):
+        return self.backend.predictor
+
+    @property
+    def load_time(self):
+        return self.backend.load_time
+
+    @property
+    def warmup_timings(self):
+        return self.backend.warmup_timings
+
+    # Width of the penultimate-layer embedding (known once the model has run), or None without embeddings
+    @property
+    def embedding_size(self):
+        if not self.embeddings:
+            return None
+        if self._embedding_size is None:
+            self._embedding_size = self.embed(np.zeros((1,) + self.backend.input_shape, np.float32)).shape[1]
+        return self._embedding_size
+
+    @property
+    def is_loaded(self):
+        return self.backend.loaded
+
+    # Version part of prediction cache keys: the model, plus the test-time augmentation settings
+    # that change its answers, so a new TTA configuration does not serve the old results
+    @property
+    def cache_version(self):
+        if self.tta is None:
+            return self.model_version
+        return f"{self.model_version}:tta={self.tta.threshold:g}:{','.join(self.tta.view_names)}"
+
+    # Stats of the backend and of each enabled model-side component (micro-batching scheduler,
+    # test-time augmentation, duplicate index, cascade gate), keyed by component
+    def component_stats(self):
+        stats = {"backend": self.backend.stats()}
+        if self.scheduler is not None:
+            stats["micro_batching"] = self.scheduler.metrics()
+        if self.tta is not None:
+            stats["tta"] = self.tta.stats()
+        if self.dedupe is not None:
+            stats["dedupe"] = self.dedupe.stats()
+        if self.cascade is not None:
+            stats["cascade"] = self.cascade.stats()
+        return stats
+
+    # Trace and run every serving bucket once (the cascade gate's too) so the first real request pays
+    # no tracing cost
+    def warmup(self):
+        if self.cascade is not None:
+            self.cascade.warmup()
+        return self.backend.warmup()
+
+    # Route forward passes through a shared scheduler that merges concurrent requests into micro-batches
+    def enable_micro_batching(self, max_batch_size=32, max_wait_ms=5.0, max_queue=64):
+        if self.scheduler is None:
+            self.scheduler = MicroBatchScheduler(
+                self.backend.predict_batch, max_batch_size, max_wait_ms, max_queue
+            ).start()
+        return self.scheduler
+
+    # Load the model and warm up the serving path
+    def load(self):
+        self.backend.load()
+        self.warmup()
+        return self
+
+    def predict(self, image, timer=None):
+        return self.predict_batch([image], timer=timer)[0]
+
+    def predict_batch(self, images, timer=None):
+        timer = timer if timer is not None else StageTimer()
+        images = list(images)
+        results = [None] * len(images)
+        keys = [None] * len(images)
+        pending = list(range(len(images)))
+
+        # Look up repeat uploads by content hash before paying for decode and inference
+        if self.cache is not None:
+            with timer.stage("cache"):
+                pending = []
+                for i, image in enumerate(images):
+                    data = read_image_bytes(image)
+                    if data is not None:
+                        images[i] = data
+                        keys[i] = self.cache.make_key(data, self.cache_version)
+                        cached = self.cache.get(keys[i])
+                        if cached is not None:
+                            results[i] = Prediction.from_dict(cached, cached=True)
+                            continue
+                    pending.append(i)
+
+        if pending:
+            with timer.stage("decode"):
+                decoded = [decode_image(images[i], self.target_size) for i in pending]
+
+            with timer.stage("preprocess"):
+                batch = preprocess_batch(decoded, self.target_size, decoded=True)
+
+            self._classify(batch, pending, results, keys, timer)
+
+        timing_history.record(timer)
+        for result in results:
+            result.timings = dict(timer.timings)
+        self.log_predictions(results, timer)
+        return results
+
+    # Classify an already preprocessed float32 (N, H, W, 3) batch in one forward pass. Rows whose
+    # cache key (see cache_key) is already in the prediction cache skip the forward pass
+    def predict_preprocessed(self, batch, timer=None, keys=None):
+        timer = timer if timer is not None else StageTimer()
+        results = [None] * len(batch)
+        pending = list(range(len(batch)))
+
+        if keys is not None and self.cache is not None:
+            with timer.stage("cache"):
+                pending = []
+                for i, key in enumerate(keys):
+                    cached = self.cache.get(key) if key is not None else None
+                    if cached is not None:
+                        results[i] = Prediction.from_dict(cached, cached=True)
+                    else:
+                        pending.append(i)
+
+        if pending:
+            self._classify(batch if len(pending) == len(batch) else batch[pending], pending, results,
+                           keys if self.cache is not None else None, timer)
+
+        for result in results:
+            result.timings = dict(timer.timings)
+        self.log_predictions(results, timer)
+        return results
+
+    # Class probabilities for a preprocessed batch, and which rows were re-checked with test-time
+    # augmentation (low-confidence rows only, all their views in one extra forward pass)
+    def predict_probabilities(self, batch, timer=None, augment=True):
+        probabilities, _, augmented = self.predict_outputs(batch, timer, augment)
+        return probabilities, augmented
+
+    # Like predict_probabilities, plus the penultimate-layer embeddings from the same forward pass
+    # (None unless the classifier was created with embeddings). Augmented views only refine the
+    # probabilities; embeddings always describe the image as given
+    def predict_outputs(self, batch, timer=None, augment=True):
+        timer = timer if timer is not None else StageTimer()
+        with timer.stage("inference"):
+            probabilities, embeddings = self._split(self._forward(batch))
+        if self.tta is None or not augment:
+            return probabilities, embeddings, np.zeros(len(batch), dtype=bool)
+        with timer.stage("tta"):
+            probabilities, augmented = self.tta(batch, probabilities,
+                                                lambda views: self._split(self._forward(views))[0])
+        return probabilities, embeddings, augmented
+
+    # predict_outputs behind the cascade gate, when there is one: rows the gate confidently calls
+    # healthy take its probabilities (and no embedding) without a full forward pass. Also returns
+    # which rows exited early
+    def _predict_cascaded(self, batch, timer):
+        if self.cascade is None:
+            return self.predict_outputs(batch, timer) + (np.zeros(len(batch), dtype=bool),)
+        with timer.stage("gate"):
+            early_exit, probabilities = self.cascade(batch)
+        escalated = np.flatnonzero(~early_exit)
+        embeddings, augmented = [None] * len(batch), np.zeros(len(batch), dtype=bool)
+        if len(escalated):
+            start = time.perf_counter()
+            computed, computed_embeddings, augmented[escalated] = self.predict_outputs(
+                batch if len(escalated) == len(batch) else batch[escalated], timer
+            )
+            self.cascade.record_escalation(len(escalated), time.perf_counter() - start)
+            probabilities[escalated] = computed
+            if computed_embeddings is not None:
+                for j, embedding in zip(escalated, computed_embeddings):
+                    embeddings[j] = embedding
+        return probabilities, embeddings, augmented, early_exit
+
+    # Penultimate-layer embeddings alone, e.g. for results that came from the cache without one
+    def embed(self, batch):
+        if not self.embeddings:
+            raise ValueError("this classifier was created without embeddings")
+        return self._split(self._forward(batch))[1]
+
+    # Model output rows are the class probabilities, followed by the embedding when enabled
+    def _split(self, outputs):
+        outputs = np.asarray(outputs)
+        if not self.embeddings:
+            return outputs, None
+        classes = len(self.class_indices)
+        return outputs[:, :classes], outputs[:, classes:]
+
+    # Fill results[rows] from the preprocessed batch (row j holds image rows[j]). With a duplicate
+    # index, near-duplicates of already classified images reuse their probabilities and only the
+    # remaining rows run through the model; everything is post-processed in one pass. Rows the cascade
+    # gate answered are neither cached nor indexed, so a later request gets the full model's answer
+    def _classify(self, batch, rows, results, keys, timer):
+        reused = np.zeros(len(rows), dtype=bool)
+        augmented = np.zeros(len(rows), dtype=bool)
+        early_exit = np.zeros(len(rows), dtype=bool)
+        # Reused rows have no embedding of their own; it is computed on demand (see embed)
+        embeddings = [None] * len(rows)
+        if self.dedupe is None:
+            probabilities, computed_embeddings, augmented, early_exit = self._predict_cascaded(batch, timer)
+            if computed_embeddings is not None:
+                embeddings = list(computed_embeddings)
+        else:
+            with timer.stage("dedupe"):
+                hashes = perceptual_hash(batch)
+                found, values, found_augmented, leaders = self.dedupe.match(hashes)
+            reused[found] = True
+            reused[leaders >= 0] = True
+            forward = np.flatnonzero(~reused)
+            probabilities = None
+            if len(forward):
+                computed, computed_embeddings, augmented[forward], early_exit[forward] = self._predict_cascaded(
+                    batch if len(forward) == len(batch) else batch[forward], timer
+                )
+                probabilities = np.empty((len(rows), computed.shape[1]), dtype=computed.dtype)
+                probabilities[forward] = computed
+                full = ~early_exit[forward]
+                self.dedupe.add(hashes[forward][full], computed[full], augmented[forward][full])
+                if computed_embeddings is not None:
+                    for j, embedding in zip(forward, computed_embeddings):
+                        embeddings[j] = embedding
+            if found:
+                if probabilities is None:
+                    probabilities = np.empty((len(rows), values.shape[1]), dtype=values.dtype)
+                probabilities[found] = values
+                augmented[found] = found_augmented
+            followers = np.flatnonzero(leaders >= 0)
+            probabilities[followers] = probabilities[leaders[followers]]
+            augmented[followers] = augmented[leaders[followers]]
+            early_exit[followers] = early_exit[leaders[followers]]
+            for j in followers:
+                embeddings[j] = embeddings[leaders[j]]
+
+        with timer.stage("postprocess"):
+            for j, prediction in enumerate(self.postprocessor(probabilities)):
+                i = rows[j]
+                prediction.cached = bool(reused[j])
+                prediction.augmented = bool(augmented[j])
+                prediction.early_exit = bool(early_exit[j])
+                prediction.embedding = embeddings[j]
+                results[i] = prediction
+                # A near-duplicate's result is not the answer for these exact bytes; keep it out of the cache
+                if keys is not None and keys[i] is not None and not reused[j] and not early_exit[j]:
+                    self.cache.put(keys[i], prediction.to_dict())
+
+    def log_predictions(self, results, timer):
+        if self.prediction_log is not None:
+            self.prediction_log.record(results, timer.total, self.model_version)
+
+    # Prediction cache key for an image given as bytes, a path or a file-like object (None without a cache)
+    def cache_key(self, image):
+        if self.cache is None:
+            return None
+        data = read_image_bytes(image)
+        return None if data is None else self.cache.make_key(data, self.cache_version)
+
+    def _forward(self, batch):
+        counters.increment("forward")
+        if self.scheduler is not None:
+            return self.scheduler.predict(batch)
+        return self.backend.predict_batch(batch)
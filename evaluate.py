@@ -0,0 +1,202 @@
+"""Evaluate the classifier on a labelled image directory and write an accuracy report.
+
+The directory holds one sub-folder per class, named exactly as in
+class_indices.json (e.g. ``Tomato___Late_blight/``). Images are streamed
+through parallel decoding and batched inference; top-1/top-5 accuracy,
+per-class precision/recall and the confusion matrix are accumulated with
+vectorized counts, so memory stays constant however large the dataset is.
+The report is read by the Statistics tab of the app.
+
+Usage: python evaluate.py DATA_DIR [--report evaluation_report.json] [--variant float32] [--limit N] [--tta-threshold 50]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from itertools import islice
+
+import numpy as np
+
+import settings
+from augment import TestTimeAugmentation
+from engine import DEFAULT_MODEL_PATH, MODEL_VARIANTS, PlantDiseaseClassifier, load_class_indices
+from pipeline import iter_batches, iter_image_files
+from postprocess import top_k
+
+
+# (relative path, class index) for every image whose top-level folder names a known class
+def iter_labelled_images(data_dir, class_indices, skipped=None):
+    label_to_index = {label: int(index) for index, label in class_indices.items()}
+    for relative in iter_image_files(data_dir):
+        label = relative.split("/")[0]
+        index = label_to_index.get(label)
+        if index is None:
+            if skipped is not None:
+                skipped[label] = skipped.get(label, 0) + 1
+            continue
+        yield relative, index
+
+
+class EvaluationAccumulator:
+    """Running confusion matrix and top-k hit counts over (N, C) probability batches."""
+
+    def __init__(self, num_classes, k=5):
+        self.num_classes = num_classes
+        self.k = k
+        self.confusion = np.zeros((num_classes, num_classes), dtype=np.int64)
+        self.top_k_hits = 0
+
+    def update(self, probabilities, labels):
+        indices, _ = top_k(probabilities, self.k)
+        predicted = indices[:, 0]
+        # One bincount over flattened (true, predicted) pairs fills the whole batch into the matrix
+        self.confusion += np.bincount(
+            labels * self.num_classes + predicted, minlength=self.num_classes ** 2
+        ).reshape(self.num_classes, self.num_classes)
+        self.top_k_hits += int((indices == labels[:, None]).any(axis=1).sum())
+
+    @property
+    def total(self):
+        return int(self.confusion.sum())
+
+    def summary(self, class_names):
+        total = self.total
+        correct = np.diag(self.confusion).astype(np.float64)
+        support = self.confusion.sum(axis=1)
+        predicted = self.confusion.sum(axis=0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            precision = np.where(predicted > 0, correct / predicted, np.nan)
+            recall = np.where(support > 0, correct / support, np.nan)
+            f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), np.nan)
+        present = support > 0
+
+        # Macro averages over the classes present in the data; an undefined score counts as 0
+        def mean(values):
+            values = np.nan_to_num(values[present], nan=0.0)
+            return float(values.mean()) if values.size else None
+
+        def number(value):
+            return None if np.isnan(value) else float(value)
+
+        return {
+            "images": total,
+            "top1_accuracy": float(correct.sum() / total) if total else None,
+            "top_k": self.k,
+            f"top{self.k}_accuracy": self.top_k_hits / total if total else None,
+            "macro_precision": mean(precision),
+            "macro_recall": mean(recall),
+            "macro_f1": mean(f1),
+            "per_class": [
+                {"label": name, "support": int(support[i]), "predicted": int(predicted[i]),
+                 "precision": number(precision[i]), "recall": number(recall[i]), "f1": number(f1[i])}
+                for i, name in enumerate(class_names)
+            ],
+            "labels": list(class_names),
+            "confusion_matrix": self.confusion.tolist(),
+        }
+
+
+def evaluate(classifier, data_dir, batch_size=32, workers=4, prefetch=2, executor="thread", limit=None,
+             k=5, progress=True):
+    class_indices = classifier.class_indices
+    class_names = [class_indices[str(i)] for i in range(len(class_indices))]
+    skipped = {}
+    items = iter_labelled_images(data_dir, class_indices, skipped)
+    if limit is not None:
+        items = islice(items, limit)
+
+    accumulator = EvaluationAccumulator(len(class_names), k)
+    decode_errors = []
+    inference_s = 0.0
+    start = time.perf_counter()
+    batches = iter_batches(items, batch_size=batch_size, workers=workers, prefetch_batches=prefetch,
+                           executor=executor, path_of=lambda item: os.path.join(data_dir, item[0]))
+    for batch_items, batch, errors in batches:
+        keep = [position for position in range(len(batch_items)) if position not in errors]
+        for position, error in errors.items():
+            decode_errors.append({"path": batch_items[position][0], "error": error})
+        if not keep:
+            continue
+        labels = np.array([batch_items[position][1] for position in keep])
+        inference_start = time.perf_counter()
+        probabilities, _ = classifier.predict_probabilities(batch if len(keep) == len(batch) else batch[keep])
+        inference_s += time.perf_counter() - inference_start
+        accumulator.update(probabilities, labels)
+
+        if progress:
+            elapsed = time.perf_counter() - start
+            print(f"\r{accumulator.total} images  {accumulator.total / elapsed:.1f} img/s", end="",
+                  file=sys.stderr)
+    elapsed = time.perf_counter() - start
+    if progress:
+        print(file=sys.stderr)
+
+    report = accumulator.summary(class_names)
+    report.update({
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "data_dir": os.path.abspath(data_dir),
+        "model_path": classifier.model_path,
+        "model_version": classifier.model_version,
+        "model_format": classifier.model_format,
+        "variant": classifier.variant,
+        "elapsed_s": elapsed,
+        "images_per_s": report["images"] / elapsed if elapsed else None,
+        "inference_images_per_s": report["images"] / inference_s if inference_s else None,
+        "decode_errors": len(decode_errors),
+        "decode_error_samples": decode_errors[:20],
+        "skipped_folders": skipped,
+        "tta": classifier.tta.stats() if classifier.tta is not None else None,
+    })
+    return report
+
+
+# Evaluation report for the app, or None when none has been written yet
+def load_report(path=settings.EVALUATION_REPORT_PATH):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("data_dir", help="labelled images, one folder per class named as in class_indices.json")
+    parser.add_argument("--report", default=settings.EVALUATION_REPORT_PATH)
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH)
+    parser.add_argument("--variant", choices=MODEL_VARIANTS, default=settings.MODEL_VARIANT)
+    parser.add_argument("--backend", default=settings.BACKEND)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--executor", choices=["thread", "process"], default="thread")
+    parser.add_argument("--prefetch", type=int, default=2, help="decoded batches kept ahead of the model")
+    parser.add_argument("--limit", type=int, help="evaluate at most this many images")
+    parser.add_argument("--top-k", type=int, default=5, help="k for the top-k accuracy")
+    parser.add_argument("--tta-threshold", type=float,
+                        help="re-check predictions below this confidence (percent) with test-time augmentation")
+    args = parser.parse_args()
+
+    class_indices = load_class_indices()
+    tta = TestTimeAugmentation(args.tta_threshold) if args.tta_threshold is not None else None
+    classifier = PlantDiseaseClassifier(model_path=args.model, variant=args.variant, backend=args.backend,
+                                        tflite_threads=settings.TFLITE_THREADS, tta=tta,
+                                        batch_buckets=settings.SERVING_BATCH_BUCKETS).load()
+    report = evaluate(classifier, args.data_dir, args.batch_size, args.workers, args.prefetch, args.executor,
+                      args.limit, args.top_k)
+    if not report["images"]:
+        known = ", ".join(list(class_indices.values())[:3])
+        sys.exit(f"no labelled images under {args.data_dir} (expected folders such as {known}, ...)")
+
+    tmp_path = f"{args.report}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(report, f, indent=2)
+    os.replace(tmp_path, args.report)
+
+    print(f"top-1 {report['top1_accuracy']:.2%}  top-{args.top_k} {report[f'top{args.top_k}_accuracy']:.2%}  "
+          f"macro F1 {report['macro_f1']:.3f}  {report['images']} images  "
+          f"{report['images_per_s']:.1f} img/s -> {args.report}")
+
+
+if __name__ == "__main__":
+    main()
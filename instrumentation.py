@@ -0,0 +1,110 @@
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+
+
+class StageTimer:
+    """Times named pipeline stages (decode, preprocess, inference, ...) with a monotonic clock.
+
+    Optional callbacks fire when a stage starts and ends so a UI can drive its
+    progress bar from real work instead of sleeps.
+    """
+
+    def __init__(self, on_stage_start=None, on_stage_end=None):
+        self.timings = {}
+        self._on_stage_start = on_stage_start
+        self._on_stage_end = on_stage_end
+
+    @contextmanager
+    def stage(self, name):
+        if self._on_stage_start is not None:
+            self._on_stage_start(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.timings[name] = self.timings.get(name, 0.0) + elapsed
+            if self._on_stage_end is not None:
+                self._on_stage_end(name, elapsed)
+
+    @property
+    def total(self):
+        return sum(self.timings.values())
+
+    def as_milliseconds(self):
+        return {name: seconds * 1000.0 for name, seconds in self.timings.items()}
+
+
+class TimingHistory:
+    """Keeps the stage timings of the most recent runs so they can be inspected later."""
+
+    def __init__(self, maxlen=200):
+        self._runs = deque(maxlen=maxlen)
+
+    def record(self, timer):
+        self._runs.append(dict(timer.timings))
+
+    def latest(self):
+        return dict(self._runs[-1]) if self._runs else {}
+
+    def mean(self):
+        totals, counts = {}, {}
+        for run in self._runs:
+            for name, seconds in run.items():
+                totals[name] = totals.get(name, 0.0) + seconds
+                counts[name] = counts.get(name, 0) + 1
+        return {name: totals[name] / counts[name] for name in totals}
+
+    def clear(self):
+        self._runs.clear()
+
+    def __len__(self):
+        return len(self._runs)
+
+
+class EventCounter:
+    """Thread-safe counts of expensive operations (image decodes, forward passes, ...)."""
+
+    def __init__(self):
+        self._counts = Counter()
+        self._lock = threading.Lock()
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self._counts[name] += amount
+
+    def get(self, name):
+        with self._lock:
+            return self._counts[name]
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counts)
+
+    def clear(self):
+        with self._lock:
+            self._counts.clear()
+
+
+# Process-wide record of recent prediction timings
+history = TimingHistory()
+
+# Process-wide operation counts
+counters = EventCounter()
+
+
+# Current resident set size of this process in bytes (peak RSS where /proc is unavailable)
+def resident_memory_bytes():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+    import sys
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
@@ -0,0 +1,475 @@
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from multiprocessing.connection import Connection, wait
+
+import numpy as np
+
+import settings
+from instrumentation import StageTimer
+from loader import create_classifier
+from scheduler import SchedulerBusy
+from tiling import TiledAnalyzer
+
+# Job kinds: "predict" takes (preprocessed float32 batch, cache keys) and returns a list of
+# Predictions; "tiles" takes the bytes of a full-resolution photo and returns a tiling.TileResult
+JOB_KINDS = ("predict", "tiles")
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED, TIMED_OUT = "queued", "running", "done", "failed", "cancelled", "timed_out"
+ACTIVE_STATES = (QUEUED, RUNNING)
+
+
+class JobQueueFull(SchedulerBusy):
+    """Raised when the job queue already holds ``max_queue`` waiting jobs."""
+
+
+class Job:
+    __slots__ = ("id", "kind", "payload", "state", "result", "error", "submitted_at", "started_at",
+                 "finished_at", "deadline")
+
+    def __init__(self, kind, payload, timeout_s):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.payload = payload
+        self.state = QUEUED
+        self.result = None
+        self.error = None
+        self.submitted_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+        self.deadline = self.submitted_at + timeout_s
+
+    def status(self, position=None):
+        now = self.finished_at or time.monotonic()
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "state": self.state,
+            # Jobs ahead of this one in the queue
+            "position": position,
+            "elapsed_s": now - self.submitted_at,
+            "running_s": now - self.started_at if self.started_at is not None else 0.0,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+# Predictions served from the cache or by a near-duplicate carry no embedding; the worker fills
+# them in so similar-case search never needs a model in the submitting process
+def _fill_embeddings(classifier, batch, results):
+    missing = [i for i, result in enumerate(results) if result.embedding is None]
+    if classifier.embeddings and missing:
+        for i, embedding in zip(missing, classifier.embed(batch[missing])):
+            results[i].embedding = embedding
+
+
+def _run_job(classifier, analyzer, kind, payload):
+    if kind == "predict":
+        batch, keys = payload
+        results = classifier.predict_preprocessed(batch, keys=keys)
+        _fill_embeddings(classifier, batch, results)
+        return results
+    return analyzer(payload)
+
+
+# Entry point of a worker process: builds and loads its own classifier, reports "ready" (with its
+# startup timings) or "failed", then runs one job at a time until its connection is closed. Every
+# reply is (kind, job id, value, the classifier's component stats)
+def _worker_main(connection, threads):
+    timer = StageTimer()
+    try:
+        classifier = create_classifier(micro_batching=False, tflite_threads=threads)
+        with timer.stage("import"):
+            classifier.backend.import_runtime()
+        with timer.stage("load"):
+            classifier.backend.load()
+        with timer.stage("warmup"):
+            classifier.warmup()
+        analyzer = TiledAnalyzer(classifier, settings.TILE_MAX_TILES, settings.TILE_OVERLAP,
+                                 settings.TILE_BATCH_SIZE, settings.TILE_LESION_THRESHOLD)
+    except Exception as exc:
+        connection.send(("failed", None, f"{type(exc).__name__}: {exc}", None))
+        return
+    connection.send(("ready", None, dict(timer.timings), classifier.component_stats()))
+
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            return
+        if message is None:
+            return
+        job_id, kind, payload = message
+        try:
+            result = _run_job(classifier, analyzer, kind, payload)
+        except Exception as exc:
+            connection.send(("error", job_id, f"{type(exc).__name__}: {exc}", classifier.component_stats()))
+        else:
+            connection.send(("done", job_id, result, classifier.component_stats()))
+
+
+class _Worker:
+    __slots__ = ("process", "connection", "job", "ready", "stats")
+
+    def __init__(self, process, connection):
+        self.process = process
+        self.connection = connection
+        self.job = None
+        self.ready = False
+        self.stats = None
+
+
+class JobQueue:
+    """Runs analyses as jobs on a pool of worker processes that each load their own copy of the model.
+
+    ``submit`` returns a job id at once; callers ``poll`` it until it has
+    finished instead of blocking on the forward pass. A dispatcher thread
+    hands the oldest queued job to the next idle worker, one job per worker at
+    a time, so ``workers`` processes keep as many cores busy without sharing
+    one interpreter lock. Each worker's runtime gets ``threads`` intra-op
+    threads (default: the cores divided among the workers).
+
+    The queue is bounded: ``submit`` raises ``JobQueueFull`` once
+    ``max_queue`` jobs are waiting. Every job has a deadline ``timeout_s``
+    after submission; a job still queued then is dropped, and a running one
+    has its worker terminated and replaced, as does cancelling a running job,
+    since a forward pass cannot be interrupted from outside. Finished jobs
+    stay available to ``poll`` until ``keep_finished`` newer ones have
+    finished.
+
+    Exposes the same ``ready``/``done``/``phase``/``status()`` interface as
+    loader.BackgroundLoader; it is ready once any worker has loaded the model.
+    ``worker_stats`` returns the model-side stats each worker last reported.
+    """
+
+    def __init__(self, workers=1, max_queue=32, timeout_s=60.0, threads=None, keep_finished=1000):
+        self.workers = max(1, workers)
+        self.max_queue = max_queue
+        self.timeout_s = timeout_s
+        self.threads = threads or max(1, (os.cpu_count() or 1) // self.workers)
+        self.keep_finished = keep_finished
+        self.phase = "pending"
+        self.phase_timings = {}
+        self.error = None
+        self._pool = []
+        self._queue = deque()
+        self._jobs = {}
+        self._finished = OrderedDict()
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._done = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._wakeup_read, self._wakeup_write = os.pipe()
+        os.set_blocking(self._wakeup_read, False)
+        os.set_blocking(self._wakeup_write, False)
+
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.timed_out = 0
+        self.restarts = 0
+        self.max_queue_depth = 0
+        self._queue_waits = deque(maxlen=1000)
+        self._run_times = deque(maxlen=1000)
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self.phase = "load"
+                self._pool = [self._spawn() for _ in range(self.workers)]
+                self._thread = threading.Thread(target=self._run, name="job-dispatcher", daemon=True)
+                self._thread.start()
+        return self
+
+    def shutdown(self, timeout=5.0):
+        self._stopping.set()
+        self._wake()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        self._thread = None
+        for worker in self._pool:
+            self._stop_worker(worker)
+        self._pool = []
+
+    def submit(self, kind, payload, timeout_s=None):
+        """Queue a job and return its id. Raises JobQueueFull when the queue is full."""
+        if kind not in JOB_KINDS:
+            raise ValueError(f"unknown job kind: {kind}")
+        if self._thread is None:
+            self.start()
+        with self._lock:
+            if self.error is not None:
+                raise RuntimeError(f"no worker could load the model: {self.error}")
+            if len(self._queue) >= self.max_queue:
+                self.rejected += 1
+                raise JobQueueFull(f"job queue is full ({len(self._queue)} jobs waiting)")
+            job = Job(kind, payload, self.timeout_s if timeout_s is None else timeout_s)
+            self._jobs[job.id] = job
+            self._queue.append(job)
+            self.submitted += 1
+            self.max_queue_depth = max(self.max_queue_depth, len(self._queue))
+        self._wake()
+        return job.id
+
+    # Status of a job (see Job.status), or None for an unknown or long-finished one
+    def poll(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id) or self._finished.get(job_id)
+            if job is None:
+                return None
+            return job.status(self._queue.index(job) if job.state == QUEUED else None)
+
+    # Block until a job has finished and return its result; raises RuntimeError if it did not succeed
+    def result(self, job_id, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._changed:
+            while job_id in self._jobs:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError(f"job {job_id} has not finished")
+                self._changed.wait(remaining)
+            job = self._finished.get(job_id)
+        if job is None:
+            raise KeyError(job_id)
+        if job.state != DONE:
+            raise RuntimeError(f"job {job.state}: {job.error}")
+        return job.result
+
+    # Cancel a queued or running job; returns False if it had already finished
+    def cancel(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return False
+            if job.state == QUEUED:
+                self._queue.remove(job)
+            # A running job's worker is replaced by the dispatcher, which owns the worker processes
+            self._finish(job, CANCELLED, error="cancelled")
+        self._wake()
+        return True
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    @property
+    def ready(self):
+        return self._done.is_set() and self.error is None
+
+    def wait(self, timeout=None):
+        self._done.wait(timeout)
+        return self.ready
+
+    def status(self):
+        return {
+            "phase": self.phase,
+            "ready": self.ready,
+            "error": self.error,
+            "timings": dict(self.phase_timings),
+        }
+
+    def stats(self):
+        with self._lock:
+            waits = list(self._queue_waits)
+            run_times = list(self._run_times)
+            stats = {
+                "workers": len(self._pool),
+                "ready_workers": sum(worker.ready for worker in self._pool),
+                "busy_workers": sum(worker.job is not None for worker in self._pool),
+                "threads_per_worker": self.threads,
+                "queue_depth": len(self._queue),
+                "max_queue": self.max_queue,
+                "max_queue_depth": self.max_queue_depth,
+                "submitted": self.submitted,
+                "rejected": self.rejected,
+                "completed": self.completed,
+                "failed": self.failed,
+                "cancelled": self.cancelled,
+                "timed_out": self.timed_out,
+                "worker_restarts": self.restarts,
+            }
+        if waits:
+            stats["queue_wait_p50_ms"] = float(np.percentile(waits, 50)) * 1000
+            stats["queue_wait_p95_ms"] = float(np.percentile(waits, 95)) * 1000
+        if run_times:
+            stats["run_p50_ms"] = float(np.percentile(run_times, 50)) * 1000
+            stats["run_p95_ms"] = float(np.percentile(run_times, 95)) * 1000
+        return stats
+
+    # Component stats (see PlantDiseaseClassifier.component_stats) last reported by each loaded worker
+    def worker_stats(self):
+        with self._lock:
+            return [worker.stats for worker in self._pool if worker.stats is not None]
+
+    # Workers run this module as a script rather than through multiprocessing, which would re-run the
+    # Streamlit script (registered as __main__) in every worker. Each gets one end of a socket pair
+    def _spawn(self):
+        connection, child = socket.socketpair()
+        # Thread counts are read when the runtime is imported
+        env = dict(os.environ, TF_NUM_INTRAOP_THREADS=str(self.threads), TF_NUM_INTEROP_THREADS="1")
+        process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--fd", str(child.fileno()), "--threads", str(self.threads)],
+            pass_fds=(child.fileno(),), env=env,
+        )
+        child.close()
+        return _Worker(process, Connection(connection.detach()))
+
+    @staticmethod
+    def _stop_worker(worker):
+        worker.process.terminate()
+        try:
+            worker.process.wait(1.0)
+        except subprocess.TimeoutExpired:
+            worker.process.kill()
+            worker.process.wait()
+        worker.connection.close()
+
+    # Terminate a worker (stuck, crashed or running an abandoned job) and start a fresh one in its slot
+    def _replace(self, worker):
+        self._stop_worker(worker)
+        self._pool[self._pool.index(worker)] = self._spawn()
+        self.restarts += 1
+
+    def _wake(self):
+        try:
+            os.write(self._wakeup_write, b"\0")
+        except BlockingIOError:
+            pass
+
+    def _finish(self, job, state, result=None, error=None):
+        job.state = state
+        job.result = result
+        job.error = error
+        job.payload = None
+        job.finished_at = time.monotonic()
+        del self._jobs[job.id]
+        self._finished[job.id] = job
+        while len(self._finished) > self.keep_finished:
+            self._finished.popitem(last=False)
+        if state == DONE:
+            self.completed += 1
+            self._run_times.append(job.finished_at - job.started_at)
+        elif state == FAILED:
+            self.failed += 1
+        elif state == CANCELLED:
+            self.cancelled += 1
+        else:
+            self.timed_out += 1
+        self._changed.notify_all()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            with self._lock:
+                self._expire()
+                self._dispatch()
+                connections = {worker.connection: worker for worker in self._pool}
+            for item in wait(list(connections) + [self._wakeup_read], timeout=0.1):
+                if item == self._wakeup_read:
+                    try:
+                        os.read(self._wakeup_read, 4096)
+                    except BlockingIOError:
+                        pass
+                    continue
+                worker = connections[item]
+                try:
+                    message = item.recv()
+                except (EOFError, OSError):
+                    try:
+                        worker.process.wait(1.0)
+                    except subprocess.TimeoutExpired:
+                        pass
+                    message = ("exited", None, f"worker exited with code {worker.process.returncode}", None)
+                with self._lock:
+                    # A worker replaced earlier in this round has a new connection; skip the stale one
+                    if worker in self._pool and worker.connection is item:
+                        self._handle(worker, message)
+
+    # Drop queued jobs past their deadline; replace workers whose job timed out or was cancelled
+    def _expire(self):
+        now = time.monotonic()
+        for job in [job for job in self._queue if job.deadline <= now]:
+            self._queue.remove(job)
+            self._finish(job, TIMED_OUT, error=f"timed out after {now - job.submitted_at:.1f} s in the queue")
+        for worker in list(self._pool):
+            job = worker.job
+            if job is None:
+                continue
+            if job.state == RUNNING and job.deadline <= now:
+                self._finish(job, TIMED_OUT, error=f"timed out after {now - job.submitted_at:.1f} s")
+            if job.state != RUNNING:
+                self._replace(worker)
+
+    # Hand the oldest queued jobs to idle workers
+    def _dispatch(self):
+        for worker in self._pool:
+            if not self._queue:
+                return
+            if not worker.ready or worker.job is not None:
+                continue
+            job = self._queue.popleft()
+            try:
+                worker.connection.send((job.id, job.kind, job.payload))
+            except OSError:
+                # Died while idle; its exit is picked up by the dispatcher loop
+                self._queue.appendleft(job)
+                continue
+            job.state = RUNNING
+            job.started_at = time.monotonic()
+            job.payload = None
+            worker.job = job
+            self._queue_waits.append(job.started_at - job.submitted_at)
+
+    def _handle(self, worker, message):
+        kind, job_id, value, stats = message
+        if stats is not None:
+            worker.stats = stats
+        if kind == "ready":
+            worker.ready = True
+            if not self._done.is_set():
+                self.phase_timings = value
+                self.phase = "ready"
+                self._done.set()
+        elif kind in ("done", "error"):
+            job, worker.job = worker.job, None
+            if job is not None and job.id == job_id and job.state == RUNNING:
+                self._finish(job, DONE if kind == "done" else FAILED,
+                             result=value if kind == "done" else None, error=None if kind == "done" else value)
+        elif worker.ready or self.ready:
+            # Crashed (while serving, or loading a model another worker has loaded): fail its job and
+            # start a replacement
+            job, worker.job = worker.job, None
+            if job is not None and job.state == RUNNING:
+                self._finish(job, FAILED, error=value)
+            self._replace(worker)
+        else:
+            # Could not load the model; a replacement would fail the same way
+            self._stop_worker(worker)
+            self._pool.remove(worker)
+            if not self._pool:
+                self.error = value
+                self.phase = "failed"
+                self._done.set()
+                while self._queue:
+                    self._finish(self._queue.popleft(), FAILED, error=value)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inference worker process of a JobQueue (not run directly)")
+    parser.add_argument("--fd", type=int, required=True, help="inherited socket connected to the queue")
+    parser.add_argument("--threads", type=int, default=1)
+    args = parser.parse_args()
+    try:
+        _worker_main(Connection(args.fd), args.threads)
+    except (BrokenPipeError, ConnectionResetError):
+        # The queue went away (its process exited) while this worker was busy
+        pass
@@ -0,0 +1,121 @@
+import os
+import threading
+
+import settings
+from cache import PredictionCache
+from augment import TestTimeAugmentation
+from cascade import CascadeGate
+from dedupe import DuplicateIndex
+from engine import DEFAULT_MODEL_PATH, PlantDiseaseClassifier, gate_model_path
+from instrumentation import StageTimer
+from prediction_log import PredictionLog
+from similar import SimilarCaseIndex
+
+STARTUP_PHASES = ("import", "load", "warmup")
+
+
+class BackgroundLoader:
+    """Imports the inference runtime, loads the model and warms it up on a background thread.
+
+    Lets the UI render immediately on a cold container; callers check ``ready``
+    (or ``wait()``) before running inference. Each startup phase is timed.
+    """
+
+    def __init__(self, classifier):
+        self.classifier = classifier
+        self.phase = "pending"
+        self.phase_timings = {}
+        self.error = None
+        self._done = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="model-loader", daemon=True)
+                self._thread.start()
+        return self
+
+    def _run(self):
+        timer = StageTimer(on_stage_start=self._set_phase)
+        try:
+            with timer.stage("import"):
+                self.classifier.backend.import_runtime()
+            with timer.stage("load"):
+                self.classifier.backend.load()
+            with timer.stage("warmup"):
+                self.classifier.warmup()
+            self.phase = "ready"
+        except Exception as exc:
+            self.error = exc
+            self.phase = "failed"
+        finally:
+            self.phase_timings = dict(timer.timings)
+            self._done.set()
+
+    def _set_phase(self, name):
+        self.phase = name
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    @property
+    def ready(self):
+        return self._done.is_set() and self.error is None
+
+    def wait(self, timeout=None):
+        self._done.wait(timeout)
+        return self.ready
+
+    def status(self):
+        return {
+            "phase": self.phase,
+            "ready": self.ready,
+            "error": None if self.error is None else f"{type(self.error).__name__}: {self.error}",
+            "timings": dict(self.phase_timings),
+        }
+
+
+# Classifier configured from settings, shared by the Streamlit UI, the HTTP API and job workers.
+# Without local_inference it is for a process whose forward passes run in job workers: it keeps what
+# cache keys, similar-case search and the prediction log need, but gets no micro-batching scheduler,
+# duplicate index or cascade gate
+def create_classifier(micro_batching=settings.MICROBATCH_ENABLED, tflite_threads=settings.TFLITE_THREADS,
+                      local_inference=True):
+    cache = PredictionCache(max_entries=settings.CACHE_MAX_ENTRIES, disk_dir=settings.CACHE_DIR,
+                            disk_max_bytes=settings.CACHE_DISK_MAX_MB * 2 ** 20)
+    prediction_log = None
+    if settings.PREDICTION_LOG_ENABLED:
+        prediction_log = PredictionLog(settings.PREDICTION_LOG_PATH, settings.PREDICTION_LOG_MAX_QUEUE).start()
+    dedupe = None
+    if local_inference and settings.DEDUPE_ENABLED:
+        dedupe = DuplicateIndex(settings.DEDUPE_MAX_DISTANCE, settings.DEDUPE_MAX_ENTRIES)
+    # Embeddings are only computed when there is an archive to search them in
+    similar_cases = None
+    if settings.SIMILAR_CASES_ENABLED and SimilarCaseIndex.exists(settings.SIMILAR_CASES_DIR):
+        similar_cases = SimilarCaseIndex(settings.SIMILAR_CASES_DIR, nprobe=settings.SIMILAR_CASES_NPROBE)
+    # The classifier ignores a gate fitted to a different model
+    cascade = None
+    if local_inference and settings.CASCADE_ENABLED and os.path.exists(gate_model_path(DEFAULT_MODEL_PATH)):
+        cascade = CascadeGate(gate_model_path(DEFAULT_MODEL_PATH), settings.CASCADE_THRESHOLD,
+                              buckets=settings.SERVING_BATCH_BUCKETS)
+    classifier = PlantDiseaseClassifier(
+        cache=cache,
+        cascade=cascade,
+        embeddings=similar_cases is not None,
+        similar_cases=similar_cases,
+        dedupe=dedupe,
+        tta=TestTimeAugmentation(settings.TTA_THRESHOLD) if settings.TTA_ENABLED else None,
+        prediction_log=prediction_log,
+        batch_buckets=settings.SERVING_BATCH_BUCKETS,
+        variant=settings.MODEL_VARIANT,
+        tflite_threads=tflite_threads,
+        backend=settings.BACKEND,
+    )
+    if micro_batching and local_inference:
+        classifier.enable_micro_batching(
+            settings.MICROBATCH_MAX_BATCH, settings.MICROBATCH_MAX_WAIT_MS, settings.MICROBATCH_MAX_QUEUE
+        )
+    return classifier
@@ -1,11 +1,18 @@
-import os
 import json
-from PIL import Image
-import numpy as np
-import tensorflow as tf
+import os
+import time
 import streamlit as st
 from streamlit.components.v1 import html
-import time
+import settings
+from evaluate import load_report
+from instrumentation import StageTimer
+from jobs import JobQueue
+from loader import BackgroundLoader, create_classifier
+from scheduler import SchedulerBusy
+from session import UploadMemo
+from tiling import TiledAnalyzer
+
+STYLESHEET_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "style.css")
 
 # Set Streamlit page config
 st.set_page_config(
@@ -15,474 +22,27 @@ st.set_page_config(
     initial_sidebar_state="expanded",
 )
 
-# Enhanced custom styles with animations and modern design elements
-st.markdown(
-    """
-    <style>
-        /* Global Styles */
-        body {
-            font-family: 'Poppins', 'Helvetica Neue', Arial, sans-serif;
-            color: rgb(44, 62, 80);
-            background-color: #f8f9fa;
-        }
-        
-        /* Main Title Styling with enhanced gradient and animation */
-        .main-title {
-            font-size: 52px;
-            font-weight: 800;
-            background: linear-gradient(120deg, #2ecc71, #27ae60, #16a085);
-            background-size: 200% auto;
-            -webkit-background-clip: text;
-            -webkit-text-fill-color: transparent;
-            text-align: center;
-            margin: 30px 0;
-            padding: 20px;
-            text-shadow: 2px 2px 4px rgba(0,0,0,0.1);
-            animation: gradient 6s ease infinite;
-        }
-        
-        @keyframes gradient {
-            0% {background-position: 0% 50%;}
-            50% {background-position: 100% 50%;}
-            100% {background-position: 0% 50%;}
-        }
-        
-        /* Modern subtitle with animated underline */
-        .subtitle {
-            font-size: 22px;
-            color: #7f8c8d;
-            text-align: center;
-            margin-bottom: 30px;
-            font-style: italic;
-            position: relative;
-            display: inline-block;
-            left: 50%;
-            transform: translateX(-50%);
-            padding-bottom: 8px;
-        }
-        
-        .subtitle:after {
-            content: '';
-            position: absolute;
-            width: 0;
-            height: 3px;
-            bottom: 0;
-            left: 0;
-            background: linear-gradient(90deg, #2ecc71, #16a085);
-            transition: width 0.5s ease;
-            animation: expand-line 2.5s ease-in-out infinite;
-        }
-        
-        @keyframes expand-line {
-            0% {width: 0%;}
-            50% {width: 100%;}
-            100% {width: 0%;}
-        }
-        
-        /* Enhanced Image Container with 3D effect */
-        .image-container {
-            border: 3px dashed #2ecc71;
-            padding: 25px;
-            margin: 30px 0;
-            background-color: #ffffff;
-            border-radius: 18px;
-            box-shadow: 0 8px 20px rgba(46, 204, 113, 0.15);
-            transition: all 0.4s ease;
-            position: relative;
-            overflow: hidden;
-        }
-        
-        .image-container:before {
-            content: '';
-            position: absolute;
-            top: -10px;
-            left: -10px;
-            right: -10px;
-            bottom: -10px;
-            background: linear-gradient(45deg, transparent, rgba(46, 204, 113, 0.1), transparent);
-            transform: scale(1.2);
-            transition: all 0.5s ease;
-            z-index: -1;
-            animation: shine 3s infinite;
-        }
-        
-        @keyframes shine {
-            0% {transform: scale(1.2) translateX(-100%);}
-            100% {transform: scale(1.2) translateX(100%);}
-        }
-        
-        .image-container:hover {
-            transform: translateY(-8px) scale(1.01);
-            box-shadow: 0 12px 24px rgba(46, 204, 113, 0.25);
-            border-color: #27ae60;
-        }
-        
-        /* Modern Upload Area with pulse animation */
-        .upload-area {
-            font-size: 20px;
-            font-family: 'Courier New', monospace;
-            color: #34495e;
-            background-color: #ecf0f1;
-            padding: 40px;
-            border-radius: 15px;
-            text-align: center;
-            margin: 20px 0;
-            position: relative;
-            overflow: hidden;
-            box-shadow: inset 0 0 10px rgba(0,0,0,0.05);
-        }
-        
-        .upload-area:after {
-            content: '';
-            position: absolute;
-            top: 0;
-            left: 0;
-            right: 0;
-            bottom: 0;
-            border: 3px dashed #3498db;
-            border-radius: 12px;
-            animation: pulse 2s infinite;
-            opacity: 0;
-        }
-        
-        @keyframes pulse {
-            0% {transform: scale(0.95); opacity: 0.7;}
-            50% {transform: scale(1); opacity: 0.3;}
-            100% {transform: scale(0.95); opacity: 0.7;}
-        }
-        
-        /* Enhanced Prediction Result with floating particles */
-        .prediction-result {
-            font-size: 28px;
-            font-weight: bold;
-            color: #ffffff;
-            background: linear-gradient(135deg, #2ecc71, #27ae60, #16a085);
-            background-size: 200% auto;
-            padding: 25px;
-            border-radius: 15px;
-            box-shadow: 0 8px 15px rgba(0,0,0,0.15);
-            text-align: center;
-            margin: 30px 0;
-            animation: fadeIn 0.7s ease-in, gradient 8s ease infinite;
-            position: relative;
-            overflow: hidden;
-        }
-        
-        .prediction-result:before {
-            content: "";
-            position: absolute;
-            top: -10px;
-            left: -10px;
-            right: -10px;
-            bottom: -10px;
-            background: url("data:image/svg+xml,%3Csvg width='100' height='100' viewBox='0 0 100 100' xmlns='http://www.w3.org/2000/svg'%3E%3Cpath d='M11 18c3.866 0 7-3.134 7-7s-3.134-7-7-7-7 3.134-7 7 3.134 7 7 7zm48 25c3.866 0 7-3.134 7-7s-3.134-7-7-7-7 3.134-7 7 3.134 7 7 7zm-43-7c1.657 0 3-1.343 3-3s-1.343-3-3-3-3 1.343-3 3 1.343 3 3 3zm63 31c1.657 0 3-1.343 3-3s-1.343-3-3-3-3 1.343-3 3 1.343 3 3 3zM34 90c1.657 0 3-1.343 3-3s-1.343-3-3-3-3 1.343-3 3 1.343 3 3 3zm56-76c1.657 0 3-1.343 3-3s-1.343-3-3-3-3 1.343-3 3 1.343 3 3 3zM12 86c2.21 0 4-1.79 4-4s-1.79-4-4-4-4 1.79-4 4 1.79 4 4 4zm28-65c2.21 0 4-1.79 4-4s-1.79-4-4-4-4 1.79-4 4 1.79 4 4 4zm23-11c2.76 0 5-2.24 5-5s-2.24-5-5-5-5 2.24-5 5 2.24 5 5 5zm-6 60c2.21 0 4-1.79 4-4s-1.79-4-4-4-4 1.79-4 4 1.79 4 4 4zm29 22c2.76 0 5-2.24 5-5s-2.24-5-5-5-5 2.24-5 5 2.24 5 5 5zM32 63c2.76 0 5-2.24 5-5s-2.24-5-5-5-5 2.24-5 5 2.24 5 5 5zm57-13c2.76 0 5-2.24 5-5s-2.24-5-5-5-5 2.24-5 5 2.24 5 5 5zm-9-21c1.105 0 2-.895 2-2s-.895-2-2-2-2 .895-2 2 .895 2 2 2zM60 91c1.105 0 2-.895 2-2s-.895-2-2-2-2 .895-2 2 .895 2 2 2zM35 41c1.105 0 2-.895 2-2s-.895-2-2-2-2 .895-2 2 .895 2 2 2zM12 60c1.105 0 2-.895 2-2s-.895-2-2-2-2 .895-2 2 .895 2 2 2z' fill='%23ffffff' fill-opacity='0.05' fill-rule='evenodd'/%3E%3C/svg%3E");
-            z-index: 0;
-        }
-        
-        .prediction-result .content {
-            position: relative;
-            z-index: 1;
-        }
-        
-        /* Enhanced Button with neon glow effect */
-        .stButton > button {
-            background: linear-gradient(135deg, #2ecc71, #27ae60);
-            color: white;
-            font-size: 18px;
-            font-weight: bold;
-            padding: 14px 30px;
-            border: none;
-            border-radius: 30px;
-            cursor: pointer;
-            transition: all 0.3s ease;
-            width: 100%;
-            margin-top: 20px;
-            position: relative;
-            overflow: hidden;
-            box-shadow: 0 6px 12px rgba(46, 204, 113, 0.25), 0 0 0 2px rgba(46, 204, 113, 0.1);
-        }
-        
-        .stButton > button:hover {
-            transform: translateY(-3px) scale(1.02);
-            box-shadow: 0 8px 15px rgba(46, 204, 113, 0.35), 0 0 0 4px rgba(46, 204, 113, 0.2);
-            background: linear-gradient(135deg, #27ae60, #16a085);
-        }
-        
-        .stButton > button:active {
-            transform: translateY(1px);
-        }
-        
-        .stButton > button:before {
-            content: "";
-            position: absolute;
-            top: 0;
-            left: -100%;
-            width: 100%;
-            height: 100%;
-            background: linear-gradient(90deg, transparent, rgba(255, 255, 255, 0.2), transparent);
-            transition: 0.5s;
-        }
-        
-        .stButton > button:hover:before {
-            left: 100%;
-        }
-        
-        /* Card Layout with floating effect */
-        .card {
-            background: white;
-            padding: 25px;
-            border-radius: 20px;
-            box-shadow: 0 10px 20px rgba(0,0,0,0.1);
-            margin: 20px 0;
-            transition: all 0.3s ease;
-            border-top: 5px solid #2ecc71;
-        }
-        
-        .card:hover {
-            transform: translateY(-5px);
-            box-shadow: 0 15px 30px rgba(0,0,0,0.15);
-        }
-        
-        /* Enhanced Info Section with leaf pattern */
-        .info-section {
-            background-color: rgb(170, 250, 176);
-            background-image: url("data:image/svg+xml,%3Csvg width='60' height='60' viewBox='0 0 80 80' xmlns='http://www.w3.org/2000/svg'%3E%3Cpath d='M14 16H9v-2h5V9.87a4 4 0 1 1 2 0V14h5v2h-5v15.95A10 10 0 0 0 23.66 27l-3.46-2 8.2-2.2-2.9 5a12 12 0 0 1-21 0l-2.89-5 8.2 2.2-3.47 2A10 10 0 0 0 14 31.95V16zm40 40h-5v-2h5v-4.13a4 4 0 1 1 2 0V54h5v2h-5v15.95A10 10 0 0 0 63.66 67l-3.47-2 8.2-2.2-2.88 5a12 12 0 0 1-21.02 0l-2.88-5 8.2 2.2-3.47 2A10 10 0 0 0 54 71.95V56zm-39 6a2 2 0 1 1 0-4 2 2 0 0 1 0 4zm40-40a2 2 0 1 1 0-4 2 2 0 0 1 0 4zM15 8a2 2 0 1 0 0-4 2 2 0 0 0 0 4zm40 40a2 2 0 1 0 0-4 2 2 0 0 0 0 4z' fill='%2327ae60' fill-opacity='0.08' fill-rule='evenodd'/%3E%3C/svg%3E");
-            padding: 20px;
-            border-radius: 15px;
-            margin: 25px 0;
-            font-size: 16px;
-            line-height: 1.7;
-            color: rgb(44, 62, 80);
-            box-shadow: 0 6px 15px rgba(46, 204, 113, 0.15);
-            border-left: 5px solid #27ae60;
-            transition: all 0.3s ease;
-        }
-        
-        .info-section:hover {
-            transform: translateY(-3px);
-            box-shadow: 0 8px 20px rgba(46, 204, 113, 0.25);
-        }
-        
-        /* Step indicator for how-to process */
-        .step {
-            display: flex;
-            align-items: center;
-            margin: 15px 0;
-        }
-        
-        .step-number {
-            background: #27ae60;
-            color: white;
-            width: 30px;
-            height: 30px;
-            border-radius: 50%;
-            display: flex;
-            justify-content: center;
-            align-items: center;
-            font-weight: bold;
-            margin-right: 15px;
-            flex-shrink: 0;
-        }
-        
-        .step-text {
-            flex-grow: 1;
-        }
-        
-        /* Progress bar animation */
-        .progress-bar {
-            height: 6px;
-            background: #ecf0f1;
-            border-radius: 3px;
-            overflow: hidden;
-            margin: 20px 0;
-            position: relative;
-        }
-        
-        .progress-bar-fill {
-            height: 100%;
-            background: linear-gradient(90deg, #2ecc71, #27ae60, #16a085);
-            border-radius: 3px;
-            width: 0;
-            transition: width 0.4s ease;
-        }
-        
-        /* Stats Container for displaying additional metrics */
-        .stats-container {
-            display: flex;
-            flex-wrap: wrap;
-            gap: 15px;
-            margin: 20px 0;
-        }
-        
-        .stat-box {
-            background: white;
-            padding: 15px;
-            border-radius: 10px;
-            text-align: center;
-            flex: 1;
-            min-width: 120px;
-            box-shadow: 0 4px 8px rgba(0,0,0,0.1);
-            border-bottom: 3px solid #2ecc71;
-            transition: all 0.3s ease;
-        }
-        
-        .stat-box:hover {
-            transform: translateY(-5px);
-            box-shadow: 0 8px 15px rgba(0,0,0,0.15);
-        }
-        
-        .stat-value {
-            font-size: 24px;
-            font-weight: bold;
-            color: #27ae60;
-            margin: 5px 0;
-        }
-        
-        .stat-label {
-            font-size: 14px;
-            color: #7f8c8d;
-        }
-        
-        /* Disease details box */
-        .disease-details {
-            background-color: #f5f9fc;
-            border-radius: 15px;
-            padding: 20px;
-            margin-top: 20px;
-            border-left: 4px solid #3498db;
-            box-shadow: 0 4px 10px rgba(0,0,0,0.1);
-            display: none;
-        }
-        
-        /* Fancy loading animation */
-        .loading {
-            display: flex;
-            justify-content: center;
-            align-items: center;
-            padding: 20px;
-        }
-        
-        .loading-circle {
-            width: 15px;
-            height: 15px;
-            margin: 0 5px;
-            background-color: #2ecc71;
-            border-radius: 50%;
-            display: inline-block;
-            animation: loading 1.4s ease-in-out infinite;
-        }
-        
-        .loading-circle:nth-child(1) {
-            animation-delay: 0s;
-        }
-        
-        .loading-circle:nth-child(2) {
-            animation-delay: 0.2s;
-        }
-        
-        .loading-circle:nth-child(3) {
-            animation-delay: 0.4s;
-        }
-        
-        @keyframes loading {
-            0%, 100% {
-                transform: scale(0.5);
-                opacity: 0.3;
-            }
-            50% {
-                transform: scale(1.2);
-                opacity: 1;
-            }
-        }
-        
-        /* Footer with glowing effect */
-        .footer {
-            text-align: center;
-            color: #7f8c8d;
-            padding: 30px;
-            margin-top: 60px;
-            border-top: 1px solid #eee;
-            position: relative;
-        }
-        
-        .footer .heart {
-            color: #e74c3c;
-            display: inline-block;
-            animation: heartbeat 1.5s ease infinite;
-        }
-        
-        @keyframes heartbeat {
-            0% {transform: scale(1);}
-            5% {transform: scale(1.2);}
-            10% {transform: scale(1.1);}
-            15% {transform: scale(1.3);}
-            50% {transform: scale(1);}
-            100% {transform: scale(1);}
-        }
-        
-        /* Tips section with hover cards */
-        .tips-container {
-            display: flex;
-            flex-wrap: wrap;
-            gap: 15px;
-            margin: 20px 0;
-        }
-        
-        .tip-card {
-            background: white;
-            padding: 15px;
-            border-radius: 12px;
-            flex: 1;
-            min-width: 200px;
-            box-shadow: 0 4px 6px rgba(0,0,0,0.07);
-            transition: all 0.3s ease;
-            border-top: 3px solid transparent;
-        }
-        
-        .tip-card:nth-child(1) {border-top-color: #2ecc71;}
-        .tip-card:nth-child(2) {border-top-color: #3498db;}
-        .tip-card:nth-child(3) {border-top-color: #9b59b6;}
-        
-        .tip-card:hover {
-            transform: translateY(-5px);
-            box-shadow: 0 8px 15px rgba(0,0,0,0.1);
-        }
-        
-        .tip-icon {
-            font-size: 24px;
-            margin-bottom: 10px;
-        }
-        
-        .tip-title {
-            font-weight: bold;
-            margin-bottom: 8px;
-            color: #34495e;
-        }
-        
-        /* Sidebar customization */
-        .css-1d391kg {
-            background-color: #f8f9fa;
-        }
-        
-        /* Section divider */
-        .divider {
-            height: 3px;
-            background: linear-gradient(90deg, transparent, #2ecc71, transparent);
-            margin: 40px 0;
-            border-radius: 2px;
-        }
-        
-        /* Glowing highlight text */
-        .highlight {
-            background: linear-gradient(120deg, rgba(46, 204, 113, 0.2), rgba(46, 204, 113, 0));
-            padding: 3px 6px;
-            border-radius: 4px;
-            font-weight: 500;
-        }
-    </style>
-    """,
-    unsafe_allow_html=True
-)
+# Enhanced custom styles with animations and modern design elements, read from disk once per process
+@st.cache_resource
+def load_stylesheet():
+    with open(STYLESHEET_PATH) as f:
+        return f.read()
+
+
+# The stylesheet is added to the page's <head> once per browser session by a zero-height component,
+# so reruns do not send it again; it stays in place for the life of the page
+if not st.session_state.get("stylesheet_injected"):
+    stylesheet = json.dumps(load_stylesheet()).replace("</", "<\\/")
+    html(f"""<script>
+        const page = window.parent.document;
+        if (!page.getElementById("plant-stylesheet")) {{
+            const style = page.createElement("style");
+            style.id = "plant-stylesheet";
+            style.textContent = {stylesheet};
+            page.head.appendChild(style);
+        }}
+    </script>""", height=0)
+    st.session_state["stylesheet_injected"] = True
 
 # Add animated logo and header
 st.markdown("""
@@ -492,18 +52,22 @@ st.markdown("""
             <div style="position: absolute; top: 50%; left: 50%; transform: translate(-50%, -50%); font-size: 30px;">🌿</div>
         </div>
     </div>
-    <style>
-        @keyframes pulse-logo {
-            0% {transform: scale(1); opacity: 1;}
-            50% {transform: scale(1.2); opacity: 0.7;}
-            100% {transform: scale(1); opacity: 1;}
-        }
-    </style>
 """, unsafe_allow_html=True)
 
 st.markdown("<div class='main-title'>Plant Disease Classifier</div>", unsafe_allow_html=True)
 st.markdown("<div class='subtitle'>Intelligent diagnosis for healthier plants</div>", unsafe_allow_html=True)
 
+# Offline accuracy report written by evaluate.py, re-read only when the file changes
+@st.cache_data
+def load_evaluation_report(path, modified):
+    return load_report(path)
+
+
+report_path = settings.EVALUATION_REPORT_PATH
+evaluation_report = load_evaluation_report(
+    report_path, os.path.getmtime(report_path) if os.path.exists(report_path) else None
+)
+
 # Add tabs for better navigation
 tab1, tab2, tab3 = st.tabs(["📸 Diagnose", "📊 Statistics", "ℹ️ Help"])
 
@@ -530,120 +94,121 @@ with tab1:
     # Create two columns for layout with improved styling
     col1, col2 = st.columns([2, 1])
 
-    # Define working directory and model paths
-    working_dir = os.path.dirname(os.path.abspath(__file__))
-    model_path = f"{working_dir}/trained_model/plant_disease_prediction_model.h5"
-
-    # Load the pre-trained model
+    # Create the inference engine once per process, with a prediction cache shared by all sessions.
+    # TensorFlow import, model load and warm-up run in the background so the page renders right away.
+    # With a worker pool, analyses run as jobs in worker processes that load the model instead, and
+    # this process keeps only what cache keys, similar-case search and the statistics need
     @st.cache_resource
-    def load_model():
-        return tf.keras.models.load_model(model_path)
-
-    model = load_model()
-
-    # Load the class indices
-    @st.cache_data
-    def load_class_indices():
-        return json.load(open(f"{working_dir}/class_indices.json"))
-
-    # Create a simple mapping for plant diseases and tips
-    disease_info = {
-        "healthy": {
-            "description": "Your plant appears healthy with no visible disease symptoms.",
-            "tips": "Continue with regular watering and fertilizing schedules."
-        },
-        "blight": {
-            "description": "Blight is a rapid and complete chlorosis, browning, then death of plant tissues.",
-            "tips": "Remove infected parts, improve air circulation, and apply appropriate fungicides."
-        },
-        "rust": {
-            "description": "Rust diseases are caused by fungi that produce rusty spots on leaves.",
-            "tips": "Remove infected leaves, avoid overhead watering, and apply sulfur-based fungicides."
-        },
-        "spot": {
-            "description": "Leaf spot diseases cause spots or lesions on the foliage.",
-            "tips": "Improve air circulation, avoid wetting leaves, and apply copper-based fungicides."
-        },
-        "default": {
-            "description": "A plant disease that affects the health and productivity of the plant.",
-            "tips": "Consult with a plant pathologist or agricultural extension service for specific treatment recommendations."
-        }
+    def load_classifier():
+        job_workers = settings.JOB_WORKERS > 0
+        classifier = create_classifier(micro_batching=not job_workers and settings.MICROBATCH_ENABLED,
+                                       local_inference=not job_workers)
+        tiled_analyzer = TiledAnalyzer(classifier, settings.TILE_MAX_TILES, settings.TILE_OVERLAP,
+                                       settings.TILE_BATCH_SIZE, settings.TILE_LESION_THRESHOLD)
+        if job_workers:
+            job_queue = JobQueue(settings.JOB_WORKERS, settings.JOB_MAX_QUEUE, settings.JOB_TIMEOUT_S).start()
+            return classifier, job_queue, tiled_analyzer, job_queue
+        return classifier, BackgroundLoader(classifier).start(), tiled_analyzer, None
+
+    classifier, model_loader, tiled_analyzer, job_queue = load_classifier()
+
+    # Pipeline stages in the order they run, with the status shown while each is active
+    PREDICTION_STAGES = {
+        "cache": "🗂️ Checking previous diagnoses...",
+        "decode": "📸 Processing image...",
+        "preprocess": "🔍 Analyzing leaf features...",
+        "dedupe": "🪞 Looking for repeat photos...",
+        "gate": "⚡ Quick health check...",
+        "inference": "🧠 Running AI diagnosis...",
+        "tta": "🔁 Double-checking an uncertain diagnosis...",
+        "postprocess": "📊 Compiling results...",
+    }
+    TILED_STAGES = {
+        "decode": "📸 Processing full-resolution image...",
+        "tile": "🔬 Cutting the leaf into tiles...",
+        "inference": "🧠 Running AI diagnosis on every tile...",
+        "aggregate": "🗺️ Mapping lesions...",
     }
 
-    def get_disease_info(prediction):
-        for key in disease_info.keys():
-            if key in prediction.lower():
-                return disease_info[key]
-        return disease_info["default"]
-
-    class_indices = load_class_indices()
-
-    # Function to load and preprocess the image
-    def load_and_preprocess_image(image_path, target_size=(224, 224)):
-        img = Image.open(image_path)
-        img = img.resize(target_size)
-        img_array = np.array(img)
-        img_array = np.expand_dims(img_array, axis=0)
-        img_array = img_array.astype('float32') / 255.
-        return img_array
-
-    # Function to predict the class of an image with progress simulation
-    def predict_image_class(model, image_path, class_indices):
-        # Progress bar simulation
+    # Run an analysis, driving the progress bar from the pipeline stages it reports
+    def run_with_progress(analyze, stages):
         progress_bar = st.progress(0)
         status_text = st.empty()
-        
-        # Simulate loading process with steps
-        status_text.markdown("📸 Processing image...")
-        for i in range(25):
-            time.sleep(0.02)
-            progress_bar.progress(i)
-        
-        status_text.markdown("🔍 Analyzing leaf features...")
-        for i in range(25, 65):
-            time.sleep(0.02)
-            progress_bar.progress(i)
-            
-        # Actual preprocessing and prediction
-        preprocessed_img = load_and_preprocess_image(image_path)
-        
-        status_text.markdown("🧠 Running AI diagnosis...")
-        for i in range(65, 85):
-            time.sleep(0.02)
-            progress_bar.progress(i)
-        
-        predictions = model.predict(preprocessed_img)
-        
-        status_text.markdown("📊 Compiling results...")
-        for i in range(85, 100):
-            time.sleep(0.02)
-            progress_bar.progress(i)
-            
-        progress_bar.progress(100)
-        status_text.markdown("✅ Analysis complete!")
-        time.sleep(0.5)
+        stage_order = list(stages)
+
+        def on_stage_start(name):
+            if name in stages:
+                status_text.markdown(stages[name])
+
+        def on_stage_end(name, elapsed):
+            if name in stages:
+                progress_bar.progress(int(100 * (stage_order.index(name) + 1) / len(stage_order)))
+
+        timer = StageTimer(on_stage_start=on_stage_start, on_stage_end=on_stage_end)
+        try:
+            result = analyze(timer)
+        except SchedulerBusy:
+            result = None
+            st.warning("⏳ The server is busy analyzing other leaves. Please try again in a moment.")
+
         progress_bar.empty()
         status_text.empty()
-        
-        # Extract results
-        predicted_class_index = np.argmax(predictions, axis=1)[0]
-        confidence = float(predictions[0][predicted_class_index]) * 100
-        predicted_class_name = class_indices[str(predicted_class_index)]
-        
-        # Get top 3 predictions for display
-        top_indices = np.argsort(predictions[0])[-3:][::-1]
-        top_predictions = [
-            (class_indices[str(idx)], float(predictions[0][idx]) * 100)
-            for idx in top_indices
-        ]
-        
-        return predicted_class_name, confidence, top_predictions
+        return result
+
+    # Queue an analysis on the worker pool; show_job_progress follows it until it finishes
+    def submit_job(submit):
+        try:
+            submit()
+        except SchedulerBusy:
+            st.warning("⏳ The server is busy analyzing other leaves. Please try again in a moment.")
+
+    # Function to predict the classes of a batch of images
+    def predict_image_classes(memo, uploads):
+        if job_queue is not None:
+            submit_job(lambda: memo.submit(uploads, job_queue))
+            return memo.predictions(uploads)
+        return run_with_progress(lambda timer: memo.predict(uploads, timer=timer), PREDICTION_STAGES)
+
+    # Tiled analysis of one high-resolution image, with its lesion heatmap
+    def analyze_image_tiles(memo, upload):
+        if job_queue is not None:
+            submit_job(lambda: memo.submit_tiles(upload, job_queue))
+            return memo.tiled(upload)
+        return run_with_progress(lambda timer: memo.analyze_tiles(upload, tiled_analyzer, timer), TILED_STAGES)
+
+    # While jobs for these uploads are queued or running, poll them and rerun the page once they finish
+    def show_job_progress(memo, uploads):
+        if job_queue is None:
+            return
+        if memo.collect(uploads, job_queue) is not None:
+            @st.fragment(run_every=settings.JOB_POLL_INTERVAL_S)
+            def job_progress():
+                status = memo.collect(uploads, job_queue)
+                if status is None:
+                    st.rerun()
+                if status["state"] == "queued":
+                    st.info(f"⏳ Waiting for a free diagnosis worker ({status['position']} ahead of you)...")
+                else:
+                    st.info(f"🧠 Running AI diagnosis... {status['running_s']:.0f} s")
+                if st.button("✖️ Cancel", key="cancel_job"):
+                    memo.cancel(uploads, job_queue)
+                    st.rerun()
+
+            job_progress()
+        for name, error in memo.errors(uploads):
+            st.error(f"Could not analyze {name}: {error}")
+
+    # Function to predict the class of a single image
+    def predict_image_class(memo, upload):
+        results = predict_image_classes(memo, [upload])
+        return results[0] if results else None
 
     with col1:
         st.markdown("<div class='card'>", unsafe_allow_html=True)
-        uploaded_image = st.file_uploader(
-            "<div class='upload-area'>Drop your plant leaf image here or click to upload</div>",
+        uploaded_images = st.file_uploader(
+            "<div class='upload-area'>Drop your plant leaf images here or click to upload</div>",
             type=["jpg", "jpeg", "png"],
+            accept_multiple_files=True,
             label_visibility="collapsed"
         )
         st.markdown("</div>", unsafe_allow_html=True)
@@ -670,18 +235,104 @@ with tab1:
         """, unsafe_allow_html=True)
 
     with col2:
-        if uploaded_image is not None:
+        # Poll the background loader and rerun the page once the model is ready
+        if not model_loader.done:
+            @st.fragment(run_every=1.0)
+            def model_loading_status():
+                if model_loader.done:
+                    st.rerun()
+                st.info(f"⏳ Loading the diagnosis model ({model_loader.phase})... "
+                        "You can upload images in the meantime.")
+
+            model_loading_status()
+        elif model_loader.error is not None:
+            st.error(f"The diagnosis model failed to load: {model_loader.status()['error']}")
+
+        # Decoded images and diagnoses persist across reruns, keyed by each upload's identity
+        memo = UploadMemo(st.session_state, classifier)
+        memo.sync(uploaded_images)
+
+        if len(uploaded_images) > 1:
+            images = [memo.preview(uploaded_image) for uploaded_image in uploaded_images]
+            st.image(images, caption=[uploaded_image.name for uploaded_image in uploaded_images], width=110)
+
+            # Classify every uploaded leaf in a single batched forward pass
+            analyze = st.button(f'🔍 Analyze {len(images)} Leaves', disabled=not model_loader.ready)
+            if analyze:
+                predict_image_classes(memo, uploaded_images)
+            show_job_progress(memo, uploaded_images)
+            results = memo.predictions(uploaded_images)
+            if results is not None:
+                st.markdown(
+                    f"""
+                    <div class='prediction-result'>
+                        <div class='content'>
+                            <div style="font-size: 32px; margin-bottom: 10px;">Diagnosis Complete</div>
+                            <div style="font-size: 18px; margin-top: 10px;">{len(results)} leaves analyzed</div>
+                        </div>
+                    </div>
+                    """,
+                    unsafe_allow_html=True
+                )
+
+                # Click a column header to sort the results
+                rows = []
+                for uploaded_image, result in zip(uploaded_images, results):
+                    row = {
+                        "File": uploaded_image.name,
+                        "Crop": result.crop,
+                        "Diagnosis": result.disease or result.label,
+                        "Confidence (%)": round(result.confidence, 2),
+                        "Re-checked": result.augmented,
+                        "Runner-up": result.top_predictions[1][0] if len(result.top_predictions) > 1 else "",
+                        "Runner-up (%)": round(result.top_predictions[1][1], 2) if len(result.top_predictions) > 1 else None,
+                    }
+                    closest = memo.similar_cases(uploaded_image, result, k=1)
+                    if closest is not None:
+                        row["Closest confirmed case"] = closest[0]["label"] if closest else ""
+                        row["Similarity (%)"] = round(closest[0]["similarity"] * 100, 1) if closest else None
+                    rows.append(row)
+                st.dataframe(rows, hide_index=True, use_container_width=True)
+
+                with st.expander("⏱️ Timing breakdown"):
+                    timings = results[0].timings
+                    for stage_name, seconds in timings.items():
+                        st.markdown(f"**{stage_name}**: {seconds * 1000:.1f} ms")
+                    st.markdown(f"**total**: {sum(timings.values()) * 1000:.1f} ms "
+                                f"({sum(timings.values()) * 1000 / len(results):.1f} ms per leaf)")
+
+        elif uploaded_images:
+            uploaded_image = uploaded_images[0]
             st.markdown("<div class='image-container'>", unsafe_allow_html=True)
-            image = Image.open(uploaded_image)
+            image = memo.preview(uploaded_image)
             st.image(image, caption="Uploaded Leaf Image", use_container_width=True)
             st.markdown("</div>", unsafe_allow_html=True)
             
+            # Tiled mode classifies overlapping full-resolution windows, catching lesions too small to
+            # survive shrinking the whole photo to the model's 224x224 input
+            tiled = st.toggle("🔬 Tiled high-resolution analysis",
+                              help="For large field photos: scans the image tile by tile and maps where lesions are.")
+
             # Enhanced button with more descriptive text
-            if st.button('🔍 Analyze Leaf'):
-                prediction, confidence, top_predictions = predict_image_class(model, uploaded_image, class_indices)
+            analyze = st.button('🔍 Analyze Leaf', disabled=not model_loader.ready)
+            # Analyses are memoized per upload, whether they ran here or as a job on the worker pool
+            if analyze:
+                if tiled:
+                    analyze_image_tiles(memo, uploaded_image)
+                else:
+                    predict_image_class(memo, uploaded_image)
+            show_job_progress(memo, [uploaded_image])
+            tile_result = memo.tiled(uploaded_image) if tiled else None
+            if tiled:
+                result = tile_result.prediction if tile_result is not None else None
+            else:
+                result = memo.prediction(uploaded_image)
+            if result is not None:
+                prediction, confidence, top_predictions = result.label, result.confidence, result.top_predictions
+                timings = result.timings
                 
                 # Show primary prediction result
-                disease_info = get_disease_info(prediction)
+                disease_info = result.info
                 st.markdown(
                     f"""
                     <div class='prediction-result'>
@@ -694,6 +345,20 @@ with tab1:
                     """, 
                     unsafe_allow_html=True
                 )
+                if tile_result is not None:
+                    st.image(memo.heatmap(uploaded_image), caption="Lesion heatmap: tinted areas look diseased",
+                             use_container_width=True)
+                    tile_col1, tile_col2 = st.columns(2)
+                    with tile_col1:
+                        st.metric("Tiles analyzed", tile_result.tiles)
+                    with tile_col2:
+                        st.metric("Tiles with lesions", f"{tile_result.affected_fraction:.0%}")
+                if result.augmented:
+                    st.caption("🔁 The first look was uncertain, so this diagnosis averages several "
+                               "flipped, cropped and rotated views of the leaf.")
+                if result.early_exit:
+                    st.caption("⚡ The quick first check was confident this leaf is healthy, "
+                               "so the full disease model was skipped.")
                 
                 # Show disease details in an expandable section
                 st.markdown(f"""
@@ -715,37 +380,169 @@ with tab1:
                     """, unsafe_allow_html=True)
                 st.markdown("</div>", unsafe_allow_html=True)
 
+                # Archived cases with confirmed diagnoses whose leaves look most alike to the model
+                similar_cases = memo.similar_cases(uploaded_image, result)
+                if similar_cases:
+                    with st.expander("🗂️ Similar confirmed cases", expanded=True):
+                        st.dataframe(
+                            [
+                                {
+                                    "Confirmed diagnosis": case["label"],
+                                    "Similarity (%)": round(case["similarity"] * 100, 1),
+                                    "Source": os.path.basename(case["source"]) if case["source"] else "",
+                                    "Confirmed": time.strftime("%Y-%m-%d", time.localtime(case["confirmed_at"])),
+                                }
+                                for case in similar_cases
+                            ],
+                            hide_index=True,
+                            use_container_width=True,
+                        )
+                elif (classifier.similar_cases is not None
+                      and classifier.similar_cases.model_version != classifier.model_version):
+                    st.caption("The case archive was built with a different model version; "
+                               "similar cases are unavailable until it is rebuilt with similar.py.")
+
+                # Optional breakdown of where the time went
+                with st.expander("⏱️ Timing breakdown"):
+                    for stage_name, seconds in timings.items():
+                        st.markdown(f"**{stage_name}**: {seconds * 1000:.1f} ms")
+                    st.markdown(f"**total**: {sum(timings.values()) * 1000:.1f} ms")
+
 with tab2:
     # Statistics and additional information
     st.markdown("<div class='card'>", unsafe_allow_html=True)
     st.markdown("<h3>Classification Performance</h3>", unsafe_allow_html=True)
-    
-    # Simulated performance metrics
-    col1, col2, col3 = st.columns(3)
-    
-    with col1:
-        st.metric("Total Images Analyzed", "500+")
-    
-    with col2:
-        st.metric("Accuracy", "92.5%")
-    
-    with col3:
-        st.metric("Unique Diseases", "10+")
-    
-    # Detailed breakdown visualization
+
+    # Accuracy measured offline on labelled images by evaluate.py
+    if evaluation_report is None:
+        st.caption("No accuracy report yet. Run `python evaluate.py DATA_DIR` on a labelled image folder.")
+    else:
+        col1, col2, col3 = st.columns(3)
+
+        with col1:
+            st.metric("Accuracy (top-1)", f"{evaluation_report['top1_accuracy']:.1%}")
+
+        with col2:
+            # Reports written before the k was recorded used the default of 5
+            k = evaluation_report.get("top_k", 5)
+            st.metric(f"Accuracy (top-{k})", f"{evaluation_report.get(f'top{k}_accuracy', 0.0):.1%}")
+
+        with col3:
+            st.metric("Macro F1", f"{evaluation_report['macro_f1']:.3f}")
+
+        st.caption(f"Evaluated on {evaluation_report['images']:,} labelled images "
+                   f"({evaluation_report['created_at']}, {evaluation_report['images_per_s']:.0f} img/s).")
+        if evaluation_report.get("model_version") != classifier.model_version:
+            st.warning("This report was produced with a different model version than the one being served.")
+
+        with st.expander("📋 Per-class precision and recall"):
+            st.dataframe(
+                [
+                    {
+                        "Class": entry["label"],
+                        "Images": entry["support"],
+                        "Precision": entry["precision"],
+                        "Recall": entry["recall"],
+                        "F1": entry["f1"],
+                    }
+                    for entry in sorted(evaluation_report["per_class"], key=lambda e: (e["recall"] is None, e["recall"] or 0))
+                    if entry["support"]
+                ],
+                hide_index=True,
+                use_container_width=True,
+            )
+
+        with st.expander("🔢 Confusion matrix (rows: true class, columns: predicted)"):
+            st.dataframe(
+                {
+                    label: column
+                    for label, column in zip(evaluation_report["labels"], zip(*evaluation_report["confusion_matrix"]))
+                },
+            )
+
     st.markdown("<div class='divider'></div>", unsafe_allow_html=True)
-    st.markdown("<h4>Disease Classification Breakdown</h4>", unsafe_allow_html=True)
+    st.markdown("<h4>Usage</h4>", unsafe_allow_html=True)
     
-    # Simulated disease distribution
-    disease_distribution = {
-        "Healthy": 40,
-        "Blight": 15,
-        "Rust": 20,
-        "Leaf Spot": 15,
-        "Other Diseases": 10
+    # Live figures from the prediction log's running aggregates (no scan of the log itself)
+    prediction_log = classifier.prediction_log
+    log_stats = prediction_log.stats() if prediction_log is not None else None
+    if log_stats is None:
+        st.info("The prediction log is disabled (PLANT_PREDICTION_LOG=0).")
+    elif not log_stats["total"]:
+        st.info("No leaves analyzed yet. Statistics appear here after the first diagnosis.")
+    else:
+        col1, col2, col3 = st.columns(3)
+
+        with col1:
+            st.metric("Total Images Analyzed", f"{log_stats['total']:,}")
+
+        with col2:
+            st.metric("Mean Confidence", f"{log_stats['mean_confidence']:.1f}%")
+
+        with col3:
+            diseases_seen = [entry for entry in log_stats["labels"] if "healthy" not in entry["label"].lower()]
+            st.metric("Unique Diseases", len(diseases_seen))
+
+        latency = log_stats["latency"]
+        col1, col2, col3 = st.columns(3)
+        for column, percentile in zip((col1, col2, col3), ("p50", "p95", "p99")):
+            with column:
+                st.metric(f"Latency {percentile}", f"{latency[percentile + '_ms']:.0f} ms")
+
+        # Detailed breakdown visualization
+        st.markdown("<div class='divider'></div>", unsafe_allow_html=True)
+        st.markdown("<h4>Disease Classification Breakdown</h4>", unsafe_allow_html=True)
+        st.bar_chart({entry["label"]: entry["count"] for entry in log_stats["labels"]})
+
+        with st.expander("🕒 Recent diagnoses"):
+            st.dataframe(
+                [
+                    {
+                        "Time": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entry["created_at"])),
+                        "Diagnosis": entry["label"],
+                        "Confidence (%)": round(entry["confidence"], 2),
+                        "Latency (ms)": round(entry["latency_ms"], 1),
+                        "Cached": entry["cached"],
+                    }
+                    for entry in prediction_log.recent(20)
+                ],
+                hide_index=True,
+                use_container_width=True,
+            )
+
+    COMPONENT_TITLES = {
+        "micro_batching": "Micro-batching",
+        "tta": "Test-time augmentation",
+        "dedupe": "Near-duplicate detection",
+        "cascade": "Two-stage cascade",
     }
-    
-    st.bar_chart(disease_distribution)
+
+    # Backend stats, then those of each enabled model-side component (see component_stats)
+    def show_component_stats(stats):
+        st.json(stats["backend"])
+        for name, title in COMPONENT_TITLES.items():
+            if name in stats:
+                st.markdown(f"**{title}**")
+                st.json(stats[name])
+
+    # Cold-start breakdown of the background model loader
+    with st.expander("⏱️ Model startup"):
+        startup = model_loader.status()
+        st.markdown(f"**status**: {startup['phase']}")
+        for phase_name, seconds in startup["timings"].items():
+            st.markdown(f"**{phase_name}**: {seconds:.2f} s")
+        # With a worker pool the model runs in the workers, so their reported stats are shown
+        if job_queue is None:
+            show_component_stats(classifier.component_stats())
+        if classifier.similar_cases is not None:
+            st.markdown("**Similar-case archive**")
+            st.json(classifier.similar_cases.stats())
+        if job_queue is not None:
+            st.markdown("**Worker pool**")
+            st.json(job_queue.stats())
+            for number, worker_stats in enumerate(job_queue.worker_stats(), 1):
+                st.markdown(f"**Worker {number}**")
+                show_component_stats(worker_stats)
     
     st.markdown("</div>", unsafe_allow_html=True)
 
@@ -754,13 +551,19 @@ with tab3:
     st.markdown("<div class='card'>", unsafe_allow_html=True)
     st.markdown("<h3>About Plant Disease Classifier</h3>", unsafe_allow_html=True)
     
-    st.markdown("""
+    if evaluation_report is not None:
+        accuracy_line = (f"- **Measured Accuracy**: {evaluation_report['top1_accuracy']:.1%} top-1 accuracy on "
+                         f"{evaluation_report['images']:,} labelled leaf images")
+    else:
+        accuracy_line = "- **Measured Accuracy**: see the Statistics tab once an evaluation report is available"
+
+    st.markdown(f"""
     ### How Our AI Works
     The Plant Disease Classifier uses advanced deep learning techniques to analyze plant leaf images. Our model has been trained on thousands of plant leaf images to recognize various disease symptoms with high accuracy.
 
     ### Key Features
     - **Instant Diagnosis**: Get immediate insights into potential plant diseases
-    - **High Accuracy**: 92.5% accuracy rate in identifying plant health conditions
+    {accuracy_line}
     - **Actionable Recommendations**: Receive specific tips for managing identified diseases
 
     ### Best Practices
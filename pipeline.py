@@ -0,0 +1,100 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+from preprocessing import TARGET_SIZE, load_and_preprocess_image
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+# Sort key matching the walk order below, so a resume point can be compared with any path
+def path_sort_key(relative_path):
+    return tuple(relative_path.replace(os.sep, "/").split("/"))
+
+
+def iter_image_files(root, extensions=IMAGE_EXTENSIONS, after=None):
+    """Yield image paths under ``root`` relative to it, in a stable lexicographic order.
+
+    Only one directory listing is held at a time, so memory does not grow with
+    the size of the tree. ``after`` skips everything up to and including that
+    relative path, which is how interrupted runs resume.
+    """
+    after_key = path_sort_key(after) if after else None
+
+    def walk(directory, prefix):
+        try:
+            entries = sorted(os.scandir(directory), key=lambda entry: entry.name)
+        except OSError:
+            return
+        for entry in entries:
+            relative = f"{prefix}{entry.name}"
+            if entry.is_dir(follow_symlinks=False):
+                # Skip whole subtrees that finished before the resume point
+                key = path_sort_key(relative)
+                if after_key is not None and key < after_key[:len(key)]:
+                    continue
+                yield from walk(entry.path, f"{relative}/")
+            elif entry.name.lower().endswith(extensions):
+                if after_key is not None and path_sort_key(relative) <= after_key:
+                    continue
+                yield relative
+
+    yield from walk(root, "")
+
+
+# Worker function (top level so process pools can pickle it)
+def load_one(path, target_size=TARGET_SIZE):
+    try:
+        return load_and_preprocess_image(path, target_size)[0], None
+    except Exception as exc:
+        return None, f"{type(exc).__name__}: {exc}"
+
+
+def iter_batches(items, batch_size=32, workers=4, prefetch_batches=2, executor="thread",
+                 target_size=TARGET_SIZE, path_of=None):
+    """Decode ``items`` in parallel and yield ``(items, batch, errors)`` in input order.
+
+    At most ``prefetch_batches`` batches of decoded images are in flight, and
+    ``batch`` is a single reused float32 buffer, so memory stays flat no matter
+    how many items stream through. ``batch`` is only valid until the next
+    iteration. ``errors`` maps a position in the batch to the decode error for
+    items that could not be read; their rows in ``batch`` are zeros and
+    should be left out of the forward pass.
+    """
+    path_of = path_of or (lambda item: item)
+    pool_class = ProcessPoolExecutor if executor == "process" else ThreadPoolExecutor
+    buffer = np.empty((batch_size, target_size[1], target_size[0], 3), dtype=np.float32)
+    max_in_flight = batch_size * max(1, prefetch_batches)
+
+    with pool_class(max_workers=workers) as pool:
+        in_flight = deque()
+        source = iter(items)
+        exhausted = False
+
+        while True:
+            while not exhausted and len(in_flight) < max_in_flight:
+                try:
+                    item = next(source)
+                except StopIteration:
+                    exhausted = True
+                    break
+                in_flight.append((item, pool.submit(load_one, path_of(item), target_size)))
+
+            if not in_flight:
+                return
+
+            batch_items, errors = [], {}
+            while in_flight and len(batch_items) < batch_size:
+                item, future = in_flight.popleft()
+                array, error = future.result()
+                position = len(batch_items)
+                if error is None:
+                    buffer[position] = array
+                else:
+                    buffer[position] = 0.0
+                    errors[position] = error
+                batch_items.append(item)
+
+            yield batch_items, buffer[:len(batch_items)], errors
@@ -0,0 +1,166 @@
+from dataclasses import dataclass, field
+
+import numpy as np
+
+# Create a simple mapping for plant diseases and tips
+disease_info = {
+    "healthy": {
+        "description": "Your plant appears healthy with no visible disease symptoms.",
+        "tips": "Continue with regular watering and fertilizing schedules."
+    },
+    "blight": {
+        "description": "Blight is a rapid and complete chlorosis, browning, then death of plant tissues.",
+        "tips": "Remove infected parts, improve air circulation, and apply appropriate fungicides."
+    },
+    "rust": {
+        "description": "Rust diseases are caused by fungi that produce rusty spots on leaves.",
+        "tips": "Remove infected leaves, avoid overhead watering, and apply sulfur-based fungicides."
+    },
+    "spot": {
+        "description": "Leaf spot diseases cause spots or lesions on the foliage.",
+        "tips": "Improve air circulation, avoid wetting leaves, and apply copper-based fungicides."
+    },
+    "default": {
+        "description": "A plant disease that affects the health and productivity of the plant.",
+        "tips": "Consult with a plant pathologist or agricultural extension service for specific treatment recommendations."
+    }
+}
+
+
+def get_disease_info(prediction):
+    for key in disease_info.keys():
+        if key in prediction.lower():
+            return disease_info[key]
+    return disease_info["default"]
+
+
+# "Corn_(maize)___Common_rust_" -> ("Corn (maize)", "Common rust")
+def parse_label(label):
+    crop, separator, disease = label.partition("___")
+    if not separator:
+        return label.replace("_", " ").strip(), ""
+    return crop.replace("_", " ").strip(), disease.replace("_", " ").strip()
+
+
+@dataclass
+class Prediction:
+    """Result for a single image. Confidences are percentages, as shown in the UI."""
+
+    label: str
+    confidence: float
+    top_predictions: list
+    timings: dict = field(default_factory=dict)
+    cached: bool = False
+    augmented: bool = False
+    # Diagnosed by the cascade gate alone, without the full model
+    early_exit: bool = False
+    crop: str = ""
+    disease: str = ""
+    crop_confidences: dict = field(default_factory=dict)
+    info: dict = field(default=None, repr=False, compare=False)
+    # Penultimate-layer embedding when the classifier computes them; not cached or serialized
+    embedding: np.ndarray = field(default=None, repr=False, compare=False)
+
+    def __post_init__(self):
+        if not self.crop:
+            self.crop, self.disease = parse_label(self.label)
+        if self.info is None:
+            self.info = get_disease_info(self.label)
+
+    def to_dict(self):
+        return {
+            "label": self.label,
+            "confidence": self.confidence,
+            "top_predictions": [list(pred) for pred in self.top_predictions],
+            "timings": dict(self.timings),
+            "crop": self.crop,
+            "disease": self.disease,
+            "crop_confidences": dict(self.crop_confidences),
+            "augmented": self.augmented,
+            "early_exit": self.early_exit,
+        }
+
+    @classmethod
+    def from_dict(cls, data, **kwargs):
+        top_predictions = [tuple(pred) for pred in data["top_predictions"]]
+        return cls(data["label"], data["confidence"], top_predictions, dict(data.get("timings", {})),
+                   crop=data.get("crop", ""), disease=data.get("disease", ""),
+                   crop_confidences=dict(data.get("crop_confidences", {})),
+                   augmented=data.get("augmented", False), early_exit=data.get("early_exit", False), **kwargs)
+
+
+class LabelIndex:
+    """Class labels from class_indices.json as arrays indexed by class id, parsed once.
+
+    Holds each class's crop and disease, its disease-info entry and a
+    class-to-crop membership matrix, so per-prediction work is pure indexing.
+    """
+
+    def __init__(self, class_indices):
+        ids = sorted(int(index) for index in class_indices)
+        if ids != list(range(len(ids))):
+            raise ValueError("class indices must be the contiguous ids 0..N-1")
+        self.labels = [class_indices[str(index)] for index in ids]
+        parsed = [parse_label(label) for label in self.labels]
+        self.crops = [crop for crop, _ in parsed]
+        self.diseases = [disease for _, disease in parsed]
+        self.info = [get_disease_info(label) for label in self.labels]
+
+        # Crop names in order of first appearance, and each class's crop column
+        self.crop_names = list(dict.fromkeys(self.crops))
+        self.crop_ids = np.array([self.crop_names.index(crop) for crop in self.crops])
+        self.crop_matrix = np.zeros((len(self.labels), len(self.crop_names)), dtype=np.float32)
+        self.crop_matrix[np.arange(len(self.labels)), self.crop_ids] = 1.0
+
+    def __len__(self):
+        return len(self.labels)
+
+
+# Indices and values of the k largest entries in each row, largest first
+def top_k(probabilities, k):
+    k = min(k, probabilities.shape[1])
+    rows = np.arange(len(probabilities))[:, None]
+    # argpartition is linear in the class count; only the k survivors get sorted
+    candidates = np.argpartition(probabilities, -k, axis=1)[:, -k:]
+    order = np.argsort(-probabilities[rows, candidates], axis=1, kind="stable")
+    indices = candidates[rows, order]
+    return indices, probabilities[rows, indices]
+
+
+# Summed class probability per crop for a (N, num_classes) matrix -> (N, num_crops)
+def crop_probabilities(probabilities, labels):
+    return probabilities @ labels.crop_matrix
+
+
+class PostProcessor:
+    """Turns a (N, num_classes) probability matrix into Predictions in one vectorized pass."""
+
+    def __init__(self, class_indices, top_k=3):
+        self.labels = LabelIndex(class_indices)
+        self.top_k = top_k
+
+    def __call__(self, probabilities):
+        probabilities = np.asarray(probabilities, dtype=np.float32)
+        if probabilities.ndim == 1:
+            probabilities = probabilities[None]
+        indices, values = top_k(probabilities, self.top_k)
+        # Convert to Python scalars in bulk rather than element by element
+        indices = indices.tolist()
+        percents = (values.astype(np.float64) * 100).tolist()
+        crop_percents = (crop_probabilities(probabilities, self.labels).astype(np.float64) * 100).tolist()
+
+        labels, crops, diseases, info = self.labels.labels, self.labels.crops, self.labels.diseases, self.labels.info
+        crop_names = self.labels.crop_names
+        predictions = []
+        for row_indices, row_percents, row_crops in zip(indices, percents, crop_percents):
+            best = row_indices[0]
+            predictions.append(Prediction(
+                labels[best],
+                row_percents[0],
+                [(labels[index], percent) for index, percent in zip(row_indices, row_percents)],
+                crop=crops[best],
+                disease=diseases[best],
+                crop_confidences=dict(zip(crop_names, row_crops)),
+                info=info[best],
+            ))
+        return predictions
@@ -0,0 +1,223 @@
+import json
+import math
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+# Latency histogram buckets grow geometrically by 5%, so percentiles are exact to within ~2.5%
+LATENCY_BUCKET_BASE = 1.05
+MIN_LATENCY_MS = 0.001
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS predictions (
+    id INTEGER PRIMARY KEY,
+    created_at REAL NOT NULL,
+    label TEXT NOT NULL,
+    confidence REAL NOT NULL,
+    top_k TEXT NOT NULL,
+    latency_ms REAL NOT NULL,
+    model_version TEXT NOT NULL,
+    cached INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS predictions_created_at ON predictions (created_at);
+CREATE INDEX IF NOT EXISTS predictions_label ON predictions (label, created_at);
+
+-- Aggregates maintained in the same transaction as the inserts, so statistics never scan predictions
+CREATE TABLE IF NOT EXISTS label_stats (
+    label TEXT PRIMARY KEY,
+    count INTEGER NOT NULL,
+    confidence_sum REAL NOT NULL,
+    cached INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS latency_histogram (
+    bucket INTEGER PRIMARY KEY,
+    count INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+def latency_bucket(latency_ms):
+    return math.floor(math.log(max(latency_ms, MIN_LATENCY_MS), LATENCY_BUCKET_BASE))
+
+
+# Geometric midpoint of a histogram bucket, in milliseconds
+def bucket_latency(bucket):
+    return LATENCY_BUCKET_BASE ** (bucket + 0.5)
+
+
+class PredictionLog:
+    """Append-only log of every prediction in a local SQLite database (WAL mode).
+
+    ``record`` only enqueues; a background thread writes queued predictions in
+    batched transactions and keeps per-label counts and a latency histogram up
+    to date alongside them. Statistics read those aggregates (a few dozen
+    rows), so they stay fast however many predictions have been logged. When
+    the queue is full, new records are dropped and counted rather than
+    slowing down inference.
+    """
+
+    def __init__(self, path, max_queue=10000, batch_size=500):
+        self.path = path
+        self.batch_size = batch_size
+        self.dropped = 0
+        self.written = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        connection = self._connect()
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(SCHEMA)
+        finally:
+            connection.close()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        # WAL with synchronous=NORMAL: durable up to the last checkpoint, no fsync per commit
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="prediction-log", daemon=True)
+                self._thread.start()
+        return self
+
+    # Queue predictions for writing; never blocks. latency_s is the time the caller waited for them
+    def record(self, predictions, latency_s, model_version):
+        if self._thread is None:
+            self.start()
+        now = time.time()
+        rows = [
+            (now, p.label, p.confidence, p.top_predictions, latency_s * 1000.0, model_version, p.cached)
+            for p in predictions
+        ]
+        try:
+            self._queue.put_nowait(rows)
+        except queue.Full:
+            with self._lock:
+                self.dropped += len(rows)
+
+    # Wait until everything queued so far is written (for batch jobs and benchmarks)
+    def flush(self, timeout=None):
+        if self._thread is None:
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout=None):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        connection = self._connect()
+        try:
+            while True:
+                items = [self._queue.get()]
+                while len(items) < self.batch_size:
+                    try:
+                        items.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                rows = [row for item in items if isinstance(item, list) for row in item]
+                if rows:
+                    self._write(connection, rows)
+                for item in items:
+                    if isinstance(item, threading.Event):
+                        item.set()
+                if any(item is None for item in items):
+                    return
+        finally:
+            connection.close()
+
+    def _write(self, connection, rows):
+        labels = {}
+        buckets = Counter()
+        for _, label, confidence, _, latency_ms, _, cached in rows:
+            count, confidence_sum, cached_count = labels.get(label, (0, 0.0, 0))
+            labels[label] = (count + 1, confidence_sum + confidence, cached_count + int(cached))
+            buckets[latency_bucket(latency_ms)] += 1
+
+        with connection:
+            connection.executemany(
+                "INSERT INTO predictions (created_at, label, confidence, top_k, latency_ms, model_version, cached) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(created_at, label, confidence, json.dumps([list(pred) for pred in top_k]), latency_ms,
+                  model_version, int(cached))
+                 for created_at, label, confidence, top_k, latency_ms, model_version, cached in rows],
+            )
+            connection.executemany(
+                "INSERT INTO label_stats (label, count, confidence_sum, cached) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (label) DO UPDATE SET count = count + excluded.count, "
+                "confidence_sum = confidence_sum + excluded.confidence_sum, cached = cached + excluded.cached",
+                [(label, *totals) for label, totals in labels.items()],
+            )
+            connection.executemany(
+                "INSERT INTO latency_histogram (bucket, count) VALUES (?, ?) "
+                "ON CONFLICT (bucket) DO UPDATE SET count = count + excluded.count",
+                list(buckets.items()),
+            )
+        with self._lock:
+            self.written += len(rows)
+
+    def stats(self, percentiles=(50, 95, 99)):
+        connection = self._connect()
+        try:
+            label_rows = connection.execute(
+                "SELECT label, count, confidence_sum, cached FROM label_stats ORDER BY count DESC"
+            ).fetchall()
+            histogram = connection.execute("SELECT bucket, count FROM latency_histogram ORDER BY bucket").fetchall()
+        finally:
+            connection.close()
+
+        total = sum(count for _, count, _, _ in label_rows)
+        latency = {}
+        if histogram:
+            targets = {p: math.ceil(total * p / 100.0) for p in percentiles}
+            seen = 0
+            for bucket, count in histogram:
+                seen += count
+                for p, target in targets.items():
+                    if f"p{p}_ms" not in latency and seen >= target:
+                        latency[f"p{p}_ms"] = bucket_latency(bucket)
+        with self._lock:
+            written, dropped = self.written, self.dropped
+        return {
+            "total": total,
+            "cached": sum(cached for _, _, _, cached in label_rows),
+            "mean_confidence": sum(s for _, _, s, _ in label_rows) / total if total else None,
+            "labels": [
+                {"label": label, "count": count, "mean_confidence": confidence_sum / count}
+                for label, count, confidence_sum, _ in label_rows
+            ],
+            "latency": latency,
+            "written_this_process": written,
+            "dropped": dropped,
+            "queued": self._queue.qsize(),
+        }
+
+    # Most recent predictions, newest first (served by the created_at index)
+    def recent(self, limit=10):
+        connection = self._connect()
+        try:
+            rows = connection.execute(
+                "SELECT created_at, label, confidence, latency_ms, model_version, cached "
+                "FROM predictions ORDER BY created_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+        finally:
+            connection.close()
+        return [
+            {"created_at": created_at, "label": label, "confidence": confidence, "latency_ms": latency_ms,
+             "model_version": model_version, "cached": bool(cached)}
+            for created_at, label, confidence, latency_ms, model_version, cached in rows
+        ]
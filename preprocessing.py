@@ -0,0 +1,107 @@
+import io
+import os
+
+import numpy as np
+from PIL import Image
+
+from instrumentation import counters
+
+TARGET_SIZE = (224, 224)
+
+# Background used when flattening transparent images, so transparent areas do not turn black
+BACKGROUND_COLOR = (255, 255, 255)
+
+
+# Raw encoded bytes of an image given as bytes, a path or a file-like object (None for decoded images)
+def read_image_bytes(image):
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return bytes(image)
+    if isinstance(image, (str, os.PathLike)):
+        with open(image, "rb") as f:
+            return f.read()
+    if hasattr(image, "getvalue"):
+        return image.getvalue()
+    if hasattr(image, "read"):
+        if hasattr(image, "seek"):
+            image.seek(0)
+        return image.read()
+    return None
+
+
+# Open an image given as a path, file-like object, raw bytes or PIL image without decoding pixels yet
+def open_image(image):
+    if isinstance(image, Image.Image):
+        return image
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        image = io.BytesIO(image)
+    elif hasattr(image, "seek"):
+        image.seek(0)
+    return Image.open(image)
+
+
+# Convert any PIL mode (RGBA, LA, P, L, I;16, CMYK, ...) to the 3-channel RGB the model expects
+def to_rgb(img):
+    if img.mode == "RGB":
+        return img
+    if img.mode == "P" and "transparency" in img.info:
+        img = img.convert("RGBA")
+    if img.mode in ("RGBA", "LA", "PA"):
+        rgba = img.convert("RGBA")
+        background = Image.new("RGB", rgba.size, BACKGROUND_COLOR)
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        return background
+    if img.mode in ("I", "I;16", "F"):
+        # High bit-depth grayscale: scale into 8 bits before expanding to RGB
+        array = np.asarray(img, dtype=np.float32)
+        peak = array.max() or 1.0
+        img = Image.fromarray((array * (255.0 / peak)).astype(np.uint8), mode="L")
+    return img.convert("RGB")
+
+
+# Decode an image to RGB. JPEGs are decoded at the smallest DCT scale that still covers min_size
+def decode_image(image, min_size=TARGET_SIZE):
+    img = open_image(image)
+    if img.format == "JPEG" and min_size is not None:
+        img.draft("RGB", min_size)
+    # Only count images whose pixels are still encoded; already decoded ones pass through
+    if img.tile:
+        counters.increment("decode")
+    img.load()
+    return to_rgb(img)
+
+
+def resize_image(img, target_size=TARGET_SIZE):
+    if img.size == tuple(target_size):
+        return img
+    return img.resize(target_size, Image.Resampling.BICUBIC, reducing_gap=3.0)
+
+
+# Re-encode a decoded image as a JPEG at most max_dim pixels on its longer side, for display
+def encode_preview(img, max_dim, quality=80):
+    scale = min(1.0, max_dim / max(img.size))
+    size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+    preview = img if size == img.size else img.resize(size, Image.Resampling.BICUBIC, reducing_gap=3.0)
+    buffer = io.BytesIO()
+    to_rgb(preview).save(buffer, format="JPEG", quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+# Scale uint8 pixels into [0, 1] directly into a float32 destination, in a single pass
+def normalize_into(img, out):
+    np.divide(np.asarray(img, dtype=np.uint8), np.float32(255.0), out=out)
+    return out
+
+
+# Decode, resize and normalize images into one float32 (N, H, W, 3) batch
+def preprocess_batch(images, target_size=TARGET_SIZE, out=None, decoded=False):
+    if out is None:
+        out = np.empty((len(images), target_size[1], target_size[0], 3), dtype=np.float32)
+    for i, image in enumerate(images):
+        img = image if decoded else decode_image(image, target_size)
+        normalize_into(resize_image(to_rgb(img), target_size), out[i])
+    return out
+
+
+# Function to load and preprocess the image
+def load_and_preprocess_image(image, target_size=TARGET_SIZE):
+    return preprocess_batch([image], target_size)
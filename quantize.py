@@ -0,0 +1,205 @@
+"""Build float16 and int8 TFLite variants of the classifier, gated on agreement with float32.
+
+Each variant is evaluated on a labelled sample directory (one sub-folder per
+class, named as in class_indices.json). A variant is only written next to the
+.h5 model when its top-1 agreement with the float32 model reaches the
+threshold. Size, resident memory and single-image latency are reported for
+every variant, measured in a fresh process each.
+
+Usage: python quantize.py --calibration-dir DIR --eval-dir DIR [--variants int8 float16] [--min-agreement 0.98]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import numpy as np
+
+from cache import model_version
+from convert_model import export_saved_model
+from engine import DEFAULT_MODEL_PATH, PlantDiseaseClassifier, load_class_indices, quantized_model_path
+from evaluate import iter_labelled_images
+from pipeline import iter_batches, iter_image_files
+from preprocessing import load_and_preprocess_image
+
+
+def representative_images(directory, limit):
+    for relative in islice(iter_image_files(directory), limit):
+        yield load_and_preprocess_image(os.path.join(directory, relative))
+
+
+def convert_variant(saved_model_dir, variant, calibration_dir=None, calibration_samples=100):
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_saved_model(saved_model_dir)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if variant == "float16":
+        converter.target_spec.supported_types = [tf.float16]
+    elif variant == "int8":
+        if not calibration_dir:
+            raise ValueError("int8 quantization needs --calibration-dir with representative images")
+        # Calibrate activation ranges on real leaves; inputs and outputs stay float32
+        converter.representative_dataset = lambda: ([batch] for batch in representative_images(
+            calibration_dir, calibration_samples))
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    else:
+        raise ValueError(f"unknown variant {variant!r}")
+    return converter.convert()
+
+
+# Labelled evaluation sample: (relative path, class index) with the label taken from the folder name
+def labelled_sample(eval_dir, class_indices, limit):
+    return list(islice(iter_labelled_images(eval_dir, class_indices), limit))
+
+
+# Top-1 class of every readable image in the sample, and the (path, error) of those that are not
+def top1_predictions(classifier, eval_dir, sample, batch_size=32):
+    predictions, decode_errors = [], []
+    batches = iter_batches(sample, batch_size=batch_size,
+                           path_of=lambda item: os.path.join(eval_dir, item[0]))
+    for batch_items, batch, errors in batches:
+        keep = [position for position in range(len(batch_items)) if position not in errors]
+        for position, error in errors.items():
+            decode_errors.append((batch_items[position][0], error))
+        if keep:
+            rows = batch if len(keep) == len(batch_items) else batch[keep]
+            predictions.append(np.argmax(classifier.predictor(rows), axis=1))
+    return (np.concatenate(predictions) if predictions else np.empty(0, dtype=int)), decode_errors
+
+
+# Runs in a fresh process so resident memory reflects only this variant
+def measure_variant(model_path, variant, tflite_threads, repeat):
+    import time
+    import tensorflow  # noqa: F401  (import before the baseline so TensorFlow itself is excluded)
+    from instrumentation import resident_memory_bytes
+
+    before = resident_memory_bytes()
+    classifier = PlantDiseaseClassifier(model_path=model_path, variant=variant,
+                                        tflite_threads=tflite_threads).load()
+    after_load = resident_memory_bytes()
+    image = np.random.default_rng(0).random((1, 224, 224, 3), dtype=np.float32)
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        classifier.predictor(image)
+        samples.append(time.perf_counter() - start)
+    return {
+        "model_format": classifier.model_format,
+        "resident_memory_mb": (resident_memory_bytes() - before) / 2 ** 20,
+        "load_resident_memory_mb": (after_load - before) / 2 ** 20,
+        "latency_p50_ms": float(np.percentile(samples, 50)) * 1000,
+        "latency_p95_ms": float(np.percentile(samples, 95)) * 1000,
+    }
+
+
+def artifact_size(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(root, name))
+                   for root, _, names in os.walk(path) for name in names)
+    return os.path.getsize(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH)
+    parser.add_argument("--variants", nargs="+", choices=["int8", "float16"], default=["int8", "float16"])
+    parser.add_argument("--calibration-dir", help="representative images for int8 calibration")
+    parser.add_argument("--calibration-samples", type=int, default=100)
+    parser.add_argument("--eval-dir", required=True, help="labelled images, one folder per class")
+    parser.add_argument("--eval-samples", type=int, default=500)
+    parser.add_argument("--min-agreement", type=float, default=0.98,
+                        help="minimum top-1 agreement with float32 for a variant to be accepted")
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1, help="TFLite interpreter threads")
+    parser.add_argument("--repeat", type=int, default=50, help="latency samples per variant")
+    parser.add_argument("--report", default="quantization_report.json")
+    args = parser.parse_args()
+
+    class_indices = load_class_indices()
+    sample = labelled_sample(args.eval_dir, class_indices, args.eval_samples)
+    if not sample:
+        sys.exit(f"no labelled images found under {args.eval_dir}")
+
+    reference = PlantDiseaseClassifier(model_path=args.model, prefer_converted=False).load()
+    reference_top1, decode_errors = top1_predictions(reference, args.eval_dir, sample)
+    # Unreadable images are left out of every score, not classified as blank inputs
+    unreadable = {path for path, _ in decode_errors}
+    sample = [item for item in sample if item[0] not in unreadable]
+    if not sample:
+        sys.exit(f"none of the labelled images under {args.eval_dir} could be read")
+    labels = np.array([index for _, index in sample])
+    mp_context = multiprocessing.get_context("spawn")
+    report = {
+        "eval_images": len(sample),
+        "decode_errors": len(decode_errors),
+        "decode_error_samples": [{"path": path, "error": error} for path, error in decode_errors[:20]],
+        "min_agreement": args.min_agreement,
+        "variants": {
+            "float32": {
+                "path": args.model,
+                "size_mb": artifact_size(args.model) / 2 ** 20,
+                "accuracy": float((reference_top1 == labels).mean()),
+            },
+        },
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        saved_model_dir = os.path.join(tmp, "saved_model")
+        export_saved_model(reference.model, saved_model_dir)
+
+        for variant in args.variants:
+            print(f"converting {variant} ...", file=sys.stderr)
+            candidate = os.path.join(tmp, f"{variant}.tflite")
+            with open(candidate, "wb") as f:
+                f.write(convert_variant(saved_model_dir, variant, args.calibration_dir, args.calibration_samples))
+
+            # Evaluate from a scratch copy laid out the way the engine expects it
+            scratch_model = os.path.join(tmp, os.path.basename(args.model))
+            if not os.path.exists(scratch_model):
+                os.symlink(os.path.abspath(args.model), scratch_model)
+            scratch_variant = quantized_model_path(scratch_model, variant)
+            shutil.copyfile(candidate, scratch_variant)
+            with open(f"{scratch_variant}.json", "w") as f:
+                json.dump({"source_version": model_version(scratch_model)}, f)
+            quantized = PlantDiseaseClassifier(model_path=scratch_model, variant=variant,
+                                               tflite_threads=args.threads).load()
+            top1, _ = top1_predictions(quantized, args.eval_dir, sample)
+            agreement = float((top1 == reference_top1).mean())
+            accepted = agreement >= args.min_agreement
+
+            destination = quantized_model_path(args.model, variant)
+            report["variants"][variant] = {
+                "path": destination if accepted else None,
+                "size_mb": artifact_size(candidate) / 2 ** 20,
+                "accuracy": float((top1 == labels).mean()),
+                "top1_agreement": agreement,
+                "accepted": accepted,
+            }
+            if accepted:
+                shutil.copyfile(candidate, destination)
+                with open(f"{destination}.json", "w") as f:
+                    json.dump({"source_version": model_version(args.model), **report["variants"][variant]}, f)
+            elif os.path.exists(destination):
+                # A stale variant that no longer passes the gate must not be served
+                os.remove(destination)
+
+        with ProcessPoolExecutor(max_workers=1, mp_context=mp_context) as pool:
+            for variant, entry in report["variants"].items():
+                if variant != "float32" and not entry["accepted"]:
+                    continue
+                entry.update(pool.submit(measure_variant, args.model, variant, args.threads, args.repeat).result())
+
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+    rejected = [name for name, entry in report["variants"].items() if entry.get("accepted") is False]
+    if rejected:
+        sys.exit(f"rejected (top-1 agreement below {args.min_agreement}): {', '.join(rejected)}")
+
+
+if __name__ == "__main__":
+    main()
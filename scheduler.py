@@ -0,0 +1,169 @@
+import queue
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class SchedulerBusy(RuntimeError):
+    """Raised when the request queue is full; callers should back off and retry."""
+
+
+class _Request:
+    __slots__ = ("batch", "future", "enqueued_at")
+
+    def __init__(self, batch):
+        self.batch = batch
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class MicroBatchScheduler:
+    """Coalesces inference requests from many threads into shared forward passes.
+
+    Each request is a float32 (n, H, W, 3) batch. A single worker thread takes
+    the oldest request and, if others are already waiting, keeps collecting
+    until ``max_batch_size`` rows are queued or the oldest request has waited
+    ``max_wait_ms``. It runs ``forward`` once on the combined batch and hands
+    every caller its own slice of the result. The queue is bounded: ``submit``
+    raises ``SchedulerBusy`` instead of letting work pile up without limit.
+    """
+
+    def __init__(self, forward, max_batch_size=32, max_wait_ms=5.0, max_queue=64):
+        self.forward = forward
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._carry = None
+        self._thread = None
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+
+        self.requests = 0
+        self.rejected = 0
+        self.batches = 0
+        self.max_queue_depth = 0
+        self.batch_sizes = Counter()
+        self._queue_waits = deque(maxlen=1000)
+        self._forward_times = deque(maxlen=1000)
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._stopping.clear()
+                self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        self._thread = None
+
+    def submit(self, batch, timeout=None):
+        """Queue a batch and return a Future resolving to its probabilities.
+
+        With ``timeout=None`` a full queue is rejected immediately; otherwise
+        the caller waits up to ``timeout`` seconds for room.
+        """
+        if self._thread is None:
+            self.start()
+        request = _Request(np.asarray(batch, dtype=np.float32))
+        try:
+            if timeout is None:
+                self._queue.put_nowait(request)
+            else:
+                self._queue.put(request, timeout=timeout)
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            raise SchedulerBusy(f"inference queue is full ({self._queue.maxsize} requests waiting)") from None
+        with self._lock:
+            self.requests += 1
+            self.max_queue_depth = max(self.max_queue_depth, self._queue.qsize())
+        return request.future
+
+    def predict(self, batch, timeout=None):
+        return self.submit(batch, timeout).result()
+
+    def _next_request(self, timeout):
+        if self._carry is not None:
+            request, self._carry = self._carry, None
+            return request
+        return self._queue.get(timeout=timeout)
+
+    def _collect(self):
+        first = self._next_request(timeout=0.1)
+        requests, rows = [first], len(first.batch)
+        # A lone request with nothing else queued goes straight through; waiting only pays off
+        # under concurrency, when requests pile up while the previous forward pass runs
+        if self._queue.empty():
+            return requests, rows
+        deadline = first.enqueued_at + self.max_wait
+        while rows < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                request = self._queue.get_nowait() if remaining <= 0 else self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if rows + len(request.batch) > self.max_batch_size:
+                # Does not fit: it leads the next micro-batch instead
+                self._carry = request
+                break
+            requests.append(request)
+            rows += len(request.batch)
+        return requests, rows
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                requests, rows = self._collect()
+            except queue.Empty:
+                continue
+
+            started = time.perf_counter()
+            try:
+                batch = requests[0].batch if len(requests) == 1 else np.concatenate([r.batch for r in requests])
+                probabilities = self.forward(batch)
+            except Exception as exc:
+                for request in requests:
+                    request.future.set_exception(exc)
+                continue
+            finished = time.perf_counter()
+
+            offset = 0
+            for request in requests:
+                size = len(request.batch)
+                request.future.set_result(probabilities[offset:offset + size])
+                offset += size
+
+            with self._lock:
+                self.batches += 1
+                self.batch_sizes[rows] += 1
+                self._forward_times.append(finished - started)
+                self._queue_waits.extend(started - request.enqueued_at for request in requests)
+
+    def metrics(self):
+        with self._lock:
+            waits = list(self._queue_waits)
+            forward_times = list(self._forward_times)
+            total_rows = sum(size * count for size, count in self.batch_sizes.items())
+            metrics = {
+                "requests": self.requests,
+                "rejected": self.rejected,
+                "batches": self.batches,
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self.max_queue_depth,
+                "mean_batch_size": total_rows / self.batches if self.batches else 0.0,
+                "batch_size_histogram": dict(sorted(self.batch_sizes.items())),
+            }
+        if waits:
+            metrics["queue_wait_p50_ms"] = float(np.percentile(waits, 50)) * 1000
+            metrics["queue_wait_p95_ms"] = float(np.percentile(waits, 95)) * 1000
+        if forward_times:
+            metrics["forward_p50_ms"] = float(np.percentile(forward_times, 50)) * 1000
+        return metrics
@@ -0,0 +1,143 @@
+import threading
+import time
+
+import numpy as np
+
+DEFAULT_BATCH_BUCKETS = (1, 4, 16, 32)
+
+
+class CompiledPredictor:
+    """Low-overhead inference for a model's forward function, used instead of ``model.predict``.
+
+    ``model.predict`` builds a data adapter, a step loop and callbacks on every
+    call and retraces on new shapes. Here the forward pass is traced once per
+    batch-size bucket into a concrete function with a fixed input signature;
+    incoming batches are zero-padded up to the nearest bucket (and split into
+    chunks of the largest one), so serving never triggers a retrace.
+
+    ``forward`` maps a float32 (N, H, W, 3) tensor to class probabilities, e.g.
+    ``lambda x: model(x, training=False)`` or a SavedModel serving endpoint.
+    """
+
+    def __init__(self, forward, input_shape=(224, 224, 3), buckets=DEFAULT_BATCH_BUCKETS):
+        import tensorflow as tf
+
+        self.input_shape = tuple(input_shape)
+        self.buckets = tuple(sorted(set(buckets)))
+        forward = tf.function(forward)
+        self._functions = {
+            bucket: forward.get_concrete_function(tf.TensorSpec((bucket,) + self.input_shape, tf.float32))
+            for bucket in self.buckets
+        }
+        self._tf = tf
+
+    def bucket_for(self, batch_size):
+        for bucket in self.buckets:
+            if bucket >= batch_size:
+                return bucket
+        return self.buckets[-1]
+
+    # Run every bucket once so tracing and graph optimization happen before the first real request
+    def warmup(self):
+        timings = {}
+        for bucket, function in self._functions.items():
+            start = time.perf_counter()
+            function(self._tf.zeros((bucket,) + self.input_shape, self._tf.float32))
+            timings[bucket] = time.perf_counter() - start
+        return timings
+
+    def __call__(self, batch):
+        batch = np.asarray(batch, dtype=np.float32)
+        largest = self.buckets[-1]
+        if len(batch) > largest:
+            return np.concatenate([self(batch[i:i + largest]) for i in range(0, len(batch), largest)])
+
+        bucket = self.bucket_for(len(batch))
+        if len(batch) < bucket:
+            padded = np.zeros((bucket,) + self.input_shape, dtype=np.float32)
+            padded[:len(batch)] = batch
+        else:
+            padded = batch
+        return self._functions[bucket](self._tf.constant(padded)).numpy()[:len(batch)]
+
+
+class TFLitePredictor:
+    """Runs a TFLite interpreter with the same bucket padding as ``CompiledPredictor``.
+
+    The interpreter is resized only when a batch needs a different bucket, and
+    calls are serialized because an interpreter is not thread-safe.
+    """
+
+    def __init__(self, interpreter, input_shape=(224, 224, 3), buckets=DEFAULT_BATCH_BUCKETS):
+        self.interpreter = interpreter
+        self.input_shape = tuple(input_shape)
+        self.buckets = tuple(sorted(set(buckets)))
+        self._input_index = interpreter.get_input_details()[0]["index"]
+        self._output_index = interpreter.get_output_details()[0]["index"]
+        self._batch_size = None
+        self._lock = threading.Lock()
+
+    def bucket_for(self, batch_size):
+        for bucket in self.buckets:
+            if bucket >= batch_size:
+                return bucket
+        return self.buckets[-1]
+
+    def _run(self, padded):
+        if self._batch_size != len(padded):
+            self.interpreter.resize_tensor_input(self._input_index, padded.shape)
+            self.interpreter.allocate_tensors()
+            self._batch_size = len(padded)
+        self.interpreter.set_tensor(self._input_index, padded)
+        self.interpreter.invoke()
+        return self.interpreter.get_tensor(self._output_index).copy()
+
+    # Warm up with the smallest bucket, the common single-image case
+    def warmup(self):
+        bucket = self.buckets[0]
+        start = time.perf_counter()
+        with self._lock:
+            self._run(np.zeros((bucket,) + self.input_shape, dtype=np.float32))
+        return {bucket: time.perf_counter() - start}
+
+    def __call__(self, batch):
+        batch = np.asarray(batch, dtype=np.float32)
+        largest = self.buckets[-1]
+        if len(batch) > largest:
+            return np.concatenate([self(batch[i:i + largest]) for i in range(0, len(batch), largest)])
+
+        bucket = self.bucket_for(len(batch))
+        padded = np.zeros((bucket,) + self.input_shape, dtype=np.float32)
+        padded[:len(batch)] = batch
+        with self._lock:
+            return self._run(padded)[:len(batch)]
+
+
+# Forward function of a Keras classifier returning its class probabilities and penultimate-layer
+# embedding (the input of the last layer with weights, i.e. the classification head) from the same
+# pass, concatenated into one (N, num_classes + embedding_size) tensor
+def embedding_forward(model):
+    import tensorflow as tf
+
+    head = next(layer for layer in reversed(model.layers) if layer.weights)
+    features = tf.keras.Model(model.inputs, [model.outputs[0], head.input])
+    return lambda x: tf.concat(features(x, training=False), axis=1)
+
+
+# Prefer a slim standalone interpreter package when installed, otherwise use TensorFlow's own
+def tflite_interpreter_class():
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+    return Interpreter
+
+
+def load_tflite_interpreter(path, num_threads=None):
+    interpreter = tflite_interpreter_class()(model_path=path, num_threads=num_threads)
+    interpreter.allocate_tensors()
+    return interpreter
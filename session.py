@@ -0,0 +1,226 @@
+import io
+
+import numpy as np
+from PIL import Image
+
+import settings
+from instrumentation import StageTimer
+from jobs import ACTIVE_STATES, CANCELLED, DONE
+from preprocessing import decode_image, encode_preview, preprocess_batch, read_image_bytes
+
+
+class UploadEntry:
+    __slots__ = ("name", "cache_key", "image", "preview", "upload_bytes", "tensor", "prediction", "tiled", "heatmap",
+                 "job", "tiled_job", "error")
+
+    def __init__(self, name, cache_key, image, preview, upload_bytes):
+        self.name = name
+        self.cache_key = cache_key
+        self.image = image
+        self.preview = preview
+        self.upload_bytes = upload_bytes
+        self.tensor = None
+        self.prediction = None
+        self.tiled = None
+        self.heatmap = None
+        # (job id, row of this upload in the job's batch) while a worker classifies it, see UploadMemo.submit
+        self.job = None
+        self.tiled_job = None
+        self.error = None
+
+
+class UploadMemo:
+    """Per-session memo of each upload's decoded image, model input and diagnosis.
+
+    Streamlit reruns the whole script on every interaction. Entries live in
+    session state keyed by the upload's ``file_id``, so a rerun reuses them:
+    each file is decoded once, preprocessed once and classified once, and its
+    diagnosis survives tab switches and unrelated clicks. Entries of files
+    removed from the uploader are dropped.
+
+    The single decode serves both inference and display: the UI shows a
+    re-encoded JPEG preview bounded to ``preview_max_dim`` rather than sending
+    the full-resolution upload back to the browser.
+    """
+
+    def __init__(self, state, classifier, key="upload_memo", preview_max_dim=settings.PREVIEW_MAX_DIM,
+                 preview_quality=settings.PREVIEW_QUALITY):
+        if key not in state:
+            state[key] = {}
+        self.entries = state[key]
+        self.classifier = classifier
+        self.preview_max_dim = preview_max_dim
+        self.preview_quality = preview_quality
+        # JPEGs decode at the smallest scale that still covers both the preview and the model input
+        side = max(preview_max_dim, *classifier.target_size)
+        self.decode_size = (side, side)
+
+    # Forget files that are no longer uploaded
+    def sync(self, uploads):
+        current = {upload.file_id for upload in uploads}
+        for file_id in [file_id for file_id in self.entries if file_id not in current]:
+            del self.entries[file_id]
+
+    def entry(self, upload):
+        entry = self.entries.get(upload.file_id)
+        if entry is None:
+            data = read_image_bytes(upload)
+            image = decode_image(data, self.decode_size)
+            preview = encode_preview(image, self.preview_max_dim, self.preview_quality)
+            entry = UploadEntry(upload.name, self.classifier.cache_key(data), image, preview, len(data))
+            self.entries[upload.file_id] = entry
+        return entry
+
+    def image(self, upload):
+        return self.entry(upload).image
+
+    # JPEG bytes to display in place of the upload
+    def preview(self, upload):
+        return self.entry(upload).preview
+
+    def prediction(self, upload):
+        entry = self.entries.get(upload.file_id)
+        return None if entry is None else entry.prediction
+
+    # Memoized diagnoses of all uploads, or None while any of them has not been classified
+    def predictions(self, uploads):
+        predictions = [self.prediction(upload) for upload in uploads]
+        return None if any(prediction is None for prediction in predictions) else predictions
+
+    # Memoized tiled analysis of an upload (a tiling.TileResult), or None before it has run
+    def tiled(self, upload):
+        entry = self.entries.get(upload.file_id)
+        return None if entry is None else entry.tiled
+
+    # Lesion heatmap of the tiled analysis drawn over the preview, as JPEG bytes
+    def heatmap(self, upload):
+        entry = self.entries.get(upload.file_id)
+        return None if entry is None else entry.heatmap
+
+    # Run the tiled analysis on the full-resolution upload once, rendering its heatmap over the preview
+    def analyze_tiles(self, upload, analyzer, timer=None):
+        entry = self.entry(upload)
+        if entry.tiled is None:
+            self._store_tiles(entry, analyzer(read_image_bytes(upload), timer))
+        return entry.tiled
+
+    def _store_tiles(self, entry, result):
+        entry.heatmap = result.overlay(Image.open(io.BytesIO(entry.preview)), self.preview_quality)
+        entry.tiled = result
+
+    # Confirmed cases most similar to an upload's diagnosis (whole-image or tiled), or None without a
+    # usable case archive. Diagnoses served from a cache have no embedding; it is computed here once
+    def similar_cases(self, upload, prediction, k=settings.SIMILAR_CASES_K):
+        index = self.classifier.similar_cases
+        if index is None or index.model_version != self.classifier.model_version:
+            return None
+        if prediction.embedding is None:
+            entry = self.entry(upload)
+            if entry.tensor is None:
+                return None
+            prediction.embedding = self.classifier.embed(entry.tensor[None])[0]
+        return index.similar(prediction.embedding, k)
+
+    # Model input of each entry, preprocessed once, stacked into one batch
+    def _batch(self, entries, timer):
+        missing = [entry for entry in entries if entry.tensor is None]
+        if missing:
+            with timer.stage("preprocess"):
+                tensors = preprocess_batch([entry.image for entry in missing], self.classifier.target_size,
+                                           decoded=True)
+            for entry, tensor in zip(missing, tensors):
+                entry.tensor = tensor
+        return np.stack([entry.tensor for entry in entries])
+
+    # Classify every upload without a memoized diagnosis in one forward pass
+    def predict(self, uploads, timer=None):
+        timer = timer if timer is not None else StageTimer()
+        entries = [self.entry(upload) for upload in uploads]
+        pending = [entry for entry in entries if entry.prediction is None]
+        if pending:
+            batch = self._batch(pending, timer)
+            results = self.classifier.predict_preprocessed(
+                batch, timer=timer, keys=[entry.cache_key for entry in pending]
+            )
+            for entry, result in zip(pending, results):
+                entry.prediction = result
+        return [entry.prediction for entry in entries]
+
+    # Queue every upload without a memoized diagnosis or a job under way as one job on a jobs.JobQueue,
+    # whose worker classifies them in one forward pass. Raises jobs.JobQueueFull under overload
+    def submit(self, uploads, job_queue):
+        entries = [self.entry(upload) for upload in uploads]
+        pending = [entry for entry in entries if entry.prediction is None and entry.job is None]
+        if pending:
+            batch = self._batch(pending, StageTimer())
+            job_id = job_queue.submit("predict", (batch, [entry.cache_key for entry in pending]))
+            for row, entry in enumerate(pending):
+                entry.job = (job_id, row)
+                entry.error = None
+
+    # Queue the tiled analysis of an upload's full-resolution image, unless it has run or is under way
+    def submit_tiles(self, upload, job_queue):
+        entry = self.entry(upload)
+        if entry.tiled is None and entry.tiled_job is None:
+            entry.tiled_job = job_queue.submit("tiles", read_image_bytes(upload))
+            entry.error = None
+
+    # Memoize the results of finished jobs for these uploads. Returns the status (see jobs.Job.status)
+    # of the first job still queued or running, or None once there are none
+    def collect(self, uploads, job_queue):
+        active = None
+        for upload in uploads:
+            entry = self.entries.get(upload.file_id)
+            if entry is None:
+                continue
+            if entry.job is not None:
+                job_id, row = entry.job
+                status = self._finished_status(entry, job_queue.poll(job_id))
+                if status is None:
+                    entry.job = None
+                elif status["state"] in ACTIVE_STATES:
+                    active = active or status
+                else:
+                    entry.prediction = status["result"][row]
+                    entry.job = None
+            if entry.tiled_job is not None:
+                status = self._finished_status(entry, job_queue.poll(entry.tiled_job))
+                if status is None:
+                    entry.tiled_job = None
+                elif status["state"] in ACTIVE_STATES:
+                    active = active or status
+                else:
+                    self._store_tiles(entry, status["result"])
+                    entry.tiled_job = None
+        return active
+
+    # The status of a job that is still active or has succeeded; None, with the entry's error set,
+    # for one that failed, timed out, was cancelled or has been forgotten
+    @staticmethod
+    def _finished_status(entry, status):
+        if status is None:
+            entry.error = "the result is no longer available; please analyze again"
+        elif status["state"] == CANCELLED:
+            return None
+        elif status["state"] not in ACTIVE_STATES and status["state"] != DONE:
+            entry.error = status["error"]
+            return None
+        return status
+
+    # Cancel the queued or running jobs of these uploads
+    def cancel(self, uploads, job_queue):
+        for upload in uploads:
+            entry = self.entries.get(upload.file_id)
+            if entry is None:
+                continue
+            if entry.job is not None:
+                job_queue.cancel(entry.job[0])
+                entry.job = None
+            if entry.tiled_job is not None:
+                job_queue.cancel(entry.tiled_job)
+                entry.tiled_job = None
+
+    # (file name, message) of each upload whose last job failed
+    def errors(self, uploads):
+        entries = [self.entries.get(upload.file_id) for upload in uploads]
+        return [(entry.name, entry.error) for entry in entries if entry is not None and entry.error]
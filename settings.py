@@ -0,0 +1,115 @@
+import os
+
+# Runtime configuration, overridable through environment variables so each
+# deployment (Docker, batch jobs, local runs) can tune it without code changes.
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value not in (None, "") else default
+
+
+def _env_float(name, default):
+    value = os.environ.get(name)
+    return float(value) if value not in (None, "") else default
+
+
+def _env_str(name, default=None):
+    value = os.environ.get(name)
+    return value if value not in (None, "") else default
+
+
+WORKING_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Prediction cache: bounded in-memory LRU plus an optional on-disk tier, whose least recently
+# used entries are deleted past CACHE_DISK_MAX_MB (0 for no limit)
+CACHE_MAX_ENTRIES = _env_int("PLANT_CACHE_MAX_ENTRIES", 512)
+CACHE_DIR = _env_str("PLANT_CACHE_DIR")
+CACHE_DISK_MAX_MB = _env_int("PLANT_CACHE_DISK_MAX_MB", 256)
+
+# Near-duplicate detection: an upload whose 64-bit perceptual hash differs in at most
+# DEDUPE_MAX_DISTANCE bits from an already classified image's reuses its result, skipping the model
+DEDUPE_ENABLED = _env_int("PLANT_DEDUPE", 1) == 1
+DEDUPE_MAX_DISTANCE = _env_int("PLANT_DEDUPE_MAX_DISTANCE", 3)
+DEDUPE_MAX_ENTRIES = _env_int("PLANT_DEDUPE_MAX_ENTRIES", 200_000)
+
+# Test-time augmentation: predictions under TTA_THRESHOLD percent confidence are re-checked on
+# flipped, cropped and rotated views of the image, all in one extra batched forward pass
+TTA_ENABLED = _env_int("PLANT_TTA", 1) == 1
+TTA_THRESHOLD = _env_float("PLANT_TTA_THRESHOLD", 50.0)
+
+# Tiled analysis of high-resolution photos: up to TILE_MAX_TILES overlapping 224x224 windows
+# (TILE_OVERLAP of a tile) classified TILE_BATCH_SIZE at a time. Tiles whose probability mass
+# outside the healthy classes reaches TILE_LESION_THRESHOLD percent decide the verdict
+TILE_MAX_TILES = _env_int("PLANT_TILE_MAX_TILES", 64)
+TILE_OVERLAP = _env_float("PLANT_TILE_OVERLAP", 0.5)
+TILE_BATCH_SIZE = _env_int("PLANT_TILE_BATCH_SIZE", 16)
+TILE_LESION_THRESHOLD = _env_float("PLANT_TILE_LESION_THRESHOLD", 50.0)
+
+# Two-stage cascade: a gate fitted with cascade.py (saved next to the model) screens every leaf
+# first; leaves it calls healthy with at least CASCADE_THRESHOLD percent confidence skip the full
+# model. Without a gate fitted to the deployed model every leaf goes through the full model
+CASCADE_ENABLED = _env_int("PLANT_CASCADE", 1) == 1
+CASCADE_THRESHOLD = _env_float("PLANT_CASCADE_THRESHOLD", 95.0)
+
+# Similar confirmed cases: each diagnosis lists the SIMILAR_CASES_K archived cases (added with
+# similar.py) whose penultimate-layer embeddings are closest by cosine similarity. Partitioned
+# archives score the rows of the SIMILAR_CASES_NPROBE nearest clusters only
+SIMILAR_CASES_ENABLED = _env_int("PLANT_SIMILAR_CASES", 1) == 1
+SIMILAR_CASES_DIR = _env_str("PLANT_SIMILAR_CASES_DIR", os.path.join(WORKING_DIR, "data", "similar_cases"))
+SIMILAR_CASES_K = _env_int("PLANT_SIMILAR_CASES_K", 5)
+SIMILAR_CASES_NPROBE = _env_int("PLANT_SIMILAR_CASES_NPROBE", 16)
+
+# Batch sizes the serving path compiles and warms up at startup; other sizes are padded up
+SERVING_BATCH_BUCKETS = tuple(
+    int(size) for size in _env_str("PLANT_SERVING_BATCH_BUCKETS", "1,4,16,32").split(",")
+)
+
+# Which model variant to serve: "float32" (Keras/SavedModel) or a quantized TFLite "float16"/"int8"
+MODEL_VARIANT = _env_str("PLANT_MODEL_VARIANT", "float32")
+TFLITE_THREADS = _env_int("PLANT_TFLITE_THREADS", os.cpu_count() or 1)
+
+# Inference backend: "auto" (quantized variant -> tflite, else converted savedmodel, else keras),
+# or force one of "keras", "savedmodel", "tflite"
+BACKEND = _env_str("PLANT_BACKEND", "auto")
+
+# Cross-session micro-batching: concurrent requests share forward passes of up to
+# MICROBATCH_MAX_BATCH rows, waiting at most MICROBATCH_MAX_WAIT_MS for company
+MICROBATCH_ENABLED = _env_int("PLANT_MICROBATCH", 1) == 1
+MICROBATCH_MAX_BATCH = _env_int("PLANT_MICROBATCH_MAX_BATCH", 32)
+MICROBATCH_MAX_WAIT_MS = _env_float("PLANT_MICROBATCH_MAX_WAIT_MS", 5.0)
+MICROBATCH_MAX_QUEUE = _env_int("PLANT_MICROBATCH_MAX_QUEUE", 64)
+
+# Optional worker pool for the UI (off by default): with JOB_WORKERS > 0 each analysis is submitted
+# as a job to that many worker processes, each holding its own copy of the model, and the page
+# polls for the result instead of blocking on it. At most JOB_MAX_QUEUE jobs wait; a job
+# unfinished JOB_TIMEOUT_S after submission is abandoned.
+# The trade-off: the Streamlit process then loads no model, and the backend, test-time
+# augmentation, duplicate and cascade stats shown are those each worker reports (per worker: a
+# repeat photo is only recognised by the worker that saw the first). Each worker runs one job at a
+# time, so the cross-session micro-batching above does not apply, and with one worker sessions are
+# served one after another, slower than the default of inference in the Streamlit process
+JOB_WORKERS = _env_int("PLANT_JOB_WORKERS", 0)
+JOB_MAX_QUEUE = _env_int("PLANT_JOB_MAX_QUEUE", 32)
+JOB_TIMEOUT_S = _env_float("PLANT_JOB_TIMEOUT_S", 60.0)
+JOB_POLL_INTERVAL_S = _env_float("PLANT_JOB_POLL_INTERVAL_S", 0.5)
+
+# HTTP inference API (api.py): bind address, largest accepted request body, images per
+# multipart batch, and how long an idle keep-alive connection is held open
+API_HOST = _env_str("PLANT_API_HOST", "0.0.0.0")
+API_PORT = _env_int("PLANT_API_PORT", 8080)
+API_MAX_REQUEST_BYTES = _env_int("PLANT_API_MAX_REQUEST_BYTES", 20 * 2 ** 20)
+API_MAX_BATCH_IMAGES = _env_int("PLANT_API_MAX_BATCH_IMAGES", 64)
+API_KEEPALIVE_TIMEOUT_S = _env_float("PLANT_API_KEEPALIVE_TIMEOUT_S", 30.0)
+
+# Upload previews shown in the UI: re-encoded JPEG bounded to PREVIEW_MAX_DIM pixels per side
+PREVIEW_MAX_DIM = _env_int("PLANT_PREVIEW_MAX_DIM", 800)
+PREVIEW_QUALITY = _env_int("PLANT_PREVIEW_QUALITY", 80)
+
+# Persistent log of every prediction (SQLite, WAL mode) behind the Statistics tab
+PREDICTION_LOG_ENABLED = _env_int("PLANT_PREDICTION_LOG", 1) == 1
+PREDICTION_LOG_PATH = _env_str("PLANT_PREDICTION_LOG_PATH", os.path.join(WORKING_DIR, "data", "predictions.sqlite3"))
+PREDICTION_LOG_MAX_QUEUE = _env_int("PLANT_PREDICTION_LOG_MAX_QUEUE", 10000)
+
+# Accuracy report written by evaluate.py and shown in the Statistics tab
+EVALUATION_REPORT_PATH = _env_str("PLANT_EVALUATION_REPORT", os.path.join(WORKING_DIR, "evaluation_report.json"))
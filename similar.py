@@ -0,0 +1,479 @@
+"""Archive of confirmed cases searchable by image similarity, and the tool that fills it.
+
+Each case is the penultimate-layer embedding of a leaf whose diagnosis was
+confirmed, stored as one row of a memory-mapped float16 matrix next to a
+SQLite table with its label and source. Diagnoses in the app show the
+archive's nearest cases by cosine similarity.
+
+    add DATA_DIR     embed labelled images (one folder per class, as for
+                     evaluate.py) and append them; images already in the
+                     archive are skipped
+    partition        cluster the archive for approximate search (rerun after
+                     large imports)
+    stats            print the archive's size and search statistics
+
+Usage: python similar.py add DATA_DIR [--index DIR] [--model path.h5] [--limit N]
+       python similar.py partition [--index DIR] [--lists N]
+       python similar.py stats [--index DIR]
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+from itertools import islice
+
+import numpy as np
+
+import settings
+
+VECTORS_FILE = "vectors.f16"
+PARTITIONS_FILE = "partitions.i32"
+CENTROIDS_FILE = "centroids.npy"
+CASES_FILE = "cases.sqlite3"
+METADATA_FILE = "index.json"
+# Appended rows are scored exactly until this many have accumulated, then the inverted lists are rebuilt
+LIST_REBUILD_ROWS = 16384
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cases (
+    id INTEGER PRIMARY KEY,
+    label TEXT NOT NULL,
+    source TEXT,
+    confirmed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cases_source ON cases (source);
+"""
+
+
+# Rows scaled to unit length, as float32, so dot products are cosine similarities
+def normalize(vectors):
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+# Column indices of the k largest scores per row, best first
+def top_k_columns(scores, k):
+    k = min(k, scores.shape[1])
+    columns = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, columns, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(columns, order, axis=1)
+
+
+# Index of the nearest unit centroid for each row, scored a block at a time to bound the score matrix
+def nearest_centroids(points, centroids, block_rows=4096):
+    assignment = np.empty(len(points), dtype=np.int32)
+    for start in range(0, len(points), block_rows):
+        block = np.asarray(points[start:start + block_rows], dtype=np.float32)
+        assignment[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assignment
+
+
+# Spherical k-means: unit centroids, points assigned by largest dot product
+def spherical_kmeans(points, clusters, iterations=10, seed=0):
+    rng = np.random.default_rng(seed)
+    centroids = points[rng.choice(len(points), clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = nearest_centroids(points, centroids)
+        order = np.argsort(assignment, kind="stable")
+        members = np.bincount(assignment, minlength=clusters)
+        starts = np.concatenate([[0], np.cumsum(members)[:-1]])
+        filled = members > 0
+        sums = np.add.reduceat(points[order], starts[filled], axis=0)
+        centroids[filled] = normalize(sums)
+        # Empty clusters restart from random points rather than staying dead
+        centroids[~filled] = points[rng.choice(len(points), int((~filled).sum()), replace=False)]
+    return centroids
+
+
+class SimilarCaseIndex:
+    """Embeddings of confirmed cases in a directory, searched by cosine similarity.
+
+    Vectors are unit-normalized float16 rows appended to one flat file and
+    read through a memory map, so a million 256-wide embeddings take 512 MB on
+    disk and in the (evictable) page cache, but only the rows a search scores
+    are copied into the process. Case ``i`` is row
+    ``i``; its label and source live in SQLite. Appends write the cases first
+    and the vectors last, and readers size the matrix from the vector file, so
+    a search never sees a row without its case, even while another process is
+    appending. One process appends at a time.
+
+    Search is exact (a chunked matrix product over every row) until
+    ``partition`` clusters the vectors; from then on each query only scores
+    the rows of its ``nprobe`` nearest clusters, plus the most recently
+    appended rows. Appended rows join their nearest existing cluster; rerun
+    ``partition`` after large imports.
+    """
+
+    def __init__(self, directory, dim=None, model_version=None, chunk_rows=65536, nprobe=16):
+        self.directory = directory
+        self.chunk_rows = chunk_rows
+        self.nprobe = nprobe
+        metadata_path = os.path.join(directory, METADATA_FILE)
+        if os.path.exists(metadata_path):
+            with open(metadata_path) as f:
+                self.metadata = json.load(f)
+            if dim is not None and dim != self.metadata["dim"]:
+                raise ValueError(f"{directory} holds {self.metadata['dim']}-wide embeddings, not {dim}")
+        else:
+            if dim is None:
+                raise ValueError(f"no similar-case index at {directory}; create it with similar.py add")
+            os.makedirs(directory, exist_ok=True)
+            self.metadata = {"dim": int(dim), "model_version": model_version,
+                             "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z")}
+            self._write_metadata()
+        self.dim = self.metadata["dim"]
+        self.row_bytes = self.dim * 2
+
+        self._lock = threading.Lock()
+        self._vectors = None
+        self._partitions = None
+        self._centroids = None
+        self._centroids_mtime = None
+        self._lists = None
+        self.lookups = 0
+        self._lookup_times = deque(maxlen=10000)
+
+        connection = self._connect()
+        try:
+            connection.executescript(SCHEMA)
+        finally:
+            connection.close()
+
+    # True when ``directory`` holds an index created by similar.py
+    @staticmethod
+    def exists(directory):
+        return os.path.exists(os.path.join(directory, METADATA_FILE))
+
+    @property
+    def model_version(self):
+        return self.metadata.get("model_version")
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _write_metadata(self):
+        path = self._path(METADATA_FILE)
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(self.metadata, f, indent=2)
+        os.replace(f"{path}.tmp", path)
+
+    def _connect(self):
+        connection = sqlite3.connect(self._path(CASES_FILE), timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    # An append interrupted between its writes leaves cases without vectors, or partial rows; drop them.
+    # Returns the number of complete cases
+    def _repair(self):
+        connection = self._connect()
+        try:
+            # Ids are contiguous from 0, so this is the case count without scanning the table
+            cases = connection.execute("SELECT COALESCE(MAX(id) + 1, 0) FROM cases").fetchone()[0]
+            rows = min(cases, len(self))
+            if cases > rows:
+                with connection:
+                    connection.execute("DELETE FROM cases WHERE id >= ?", (rows,))
+        finally:
+            connection.close()
+        for name, row_bytes in ((VECTORS_FILE, self.row_bytes), (PARTITIONS_FILE, 4)):
+            path = self._path(name)
+            if os.path.exists(path) and os.path.getsize(path) > rows * row_bytes:
+                os.truncate(path, rows * row_bytes)
+        return rows
+
+    def _file_rows(self, name, row_bytes):
+        try:
+            return os.path.getsize(self._path(name)) // row_bytes
+        except OSError:
+            return 0
+
+    def __len__(self):
+        return self._file_rows(VECTORS_FILE, self.row_bytes)
+
+    # Memory maps of the vectors and cluster assignments, re-opened when another writer has grown them
+    def _refresh(self):
+        count = len(self)
+        if self._vectors is None or len(self._vectors) != count:
+            self._vectors = (np.memmap(self._path(VECTORS_FILE), dtype=np.float16, mode="r", shape=(count, self.dim))
+                             if count else np.zeros((0, self.dim), dtype=np.float16))
+        centroids_path = self._path(CENTROIDS_FILE)
+        mtime = os.path.getmtime(centroids_path) if os.path.exists(centroids_path) else None
+        if mtime != self._centroids_mtime:
+            self._centroids = np.load(centroids_path) if mtime is not None else None
+            self._centroids_mtime = mtime
+            self._partitions = None
+            self._lists = None
+        if self._centroids is not None:
+            assigned = min(self._file_rows(PARTITIONS_FILE, 4), count)
+            if self._partitions is None or len(self._partitions) != assigned:
+                self._partitions = (np.memmap(self._path(PARTITIONS_FILE), dtype=np.int32, mode="r",
+                                              shape=(assigned,)) if assigned else np.zeros(0, dtype=np.int32))
+        return self._vectors
+
+    # Rows of every cluster as one array plus offsets, and how many rows it covers. Rebuilt once
+    # LIST_REBUILD_ROWS more rows have been assigned; until then newer rows are scored exactly
+    def _inverted_lists(self):
+        assigned = len(self._partitions)
+        if self._lists is None or assigned - self._lists[2] >= LIST_REBUILD_ROWS:
+            partitions = np.asarray(self._partitions)
+            # Cluster ids fit in 16 bits, where numpy's stable sort is a radix sort (~6x faster)
+            keys = partitions.astype(np.uint16) if len(self._centroids) <= 2 ** 16 else partitions
+            order = np.argsort(keys, kind="stable").astype(np.int32)
+            offsets = np.concatenate([[0], np.cumsum(np.bincount(partitions, minlength=len(self._centroids)))])
+            self._lists = (order, offsets, assigned)
+        return self._lists
+
+    def add(self, embeddings, labels, sources=None):
+        """Append confirmed cases; returns their ids (row numbers)."""
+        vectors = normalize(embeddings)
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"expected {self.dim}-wide embeddings, got {vectors.shape[1]}")
+        sources = list(sources) if sources is not None else [None] * len(vectors)
+        now = time.time()
+        with self._lock:
+            start = self._repair()
+            connection = self._connect()
+            try:
+                with connection:
+                    connection.executemany(
+                        "INSERT INTO cases (id, label, source, confirmed_at) VALUES (?, ?, ?, ?)",
+                        [(start + i, label, source, now) for i, (label, source) in enumerate(zip(labels, sources))],
+                    )
+            finally:
+                connection.close()
+            self._refresh()
+            # New rows join their nearest cluster; if assignments lag behind, they stay unassigned
+            # (searched exactly) until the next partition
+            if self._centroids is not None and self._file_rows(PARTITIONS_FILE, 4) == start:
+                with open(self._path(PARTITIONS_FILE), "ab") as f:
+                    nearest_centroids(vectors, self._centroids).tofile(f)
+            with open(self._path(VECTORS_FILE), "ab") as f:
+                f.write(vectors.astype(np.float16).tobytes())
+        return np.arange(start, start + len(vectors))
+
+    # Source paths already in the archive, out of ``sources``
+    def known_sources(self, sources):
+        sources = list(sources)
+        connection = self._connect()
+        try:
+            known = set()
+            for offset in range(0, len(sources), 500):
+                chunk = sources[offset:offset + 500]
+                known.update(row[0] for row in connection.execute(
+                    f"SELECT source FROM cases WHERE source IN ({','.join('?' * len(chunk))})", chunk
+                ))
+        finally:
+            connection.close()
+        return known
+
+    def partition(self, lists=None, iterations=10, sample=None, seed=0):
+        """Cluster the vectors into ``lists`` cells (default 4 * sqrt(rows)) for approximate search.
+
+        Centroids are trained on a random sample of at most ``sample`` rows
+        (default 64 per cell), then every row is assigned in chunks.
+        """
+        with self._lock:
+            vectors = self._refresh()
+            count = len(vectors)
+            if not count:
+                raise ValueError("the index is empty")
+            lists = min(lists or max(1, int(round(4 * np.sqrt(count)))), count)
+            rng = np.random.default_rng(seed)
+            picks = np.sort(rng.choice(count, min(count, sample or lists * 64), replace=False))
+            centroids = spherical_kmeans(vectors[picks].astype(np.float32), lists, iterations, seed)
+
+            path = self._path(PARTITIONS_FILE)
+            with open(f"{path}.tmp", "wb") as f:
+                nearest_centroids(vectors, centroids).tofile(f)
+            # Assignments first, centroids last: readers switch to the new clusters once both are in place
+            os.replace(f"{path}.tmp", path)
+            np.save(f"{self._path(CENTROIDS_FILE)}.tmp.npy", centroids)
+            os.replace(f"{self._path(CENTROIDS_FILE)}.tmp.npy", self._path(CENTROIDS_FILE))
+            self.metadata["partitioned_rows"] = count
+            self.metadata["lists"] = lists
+            self._write_metadata()
+            self._centroids_mtime = None
+            self._refresh()
+        return lists
+
+    def search(self, queries, k=5, nprobe=None, exact=False):
+        """Ids and cosine similarities of the ``k`` nearest cases for each query embedding.
+
+        Returns two (Q, k) arrays, best first; rows are padded with id -1 when
+        fewer than ``k`` cases are searched.
+        """
+        start = time.perf_counter()
+        queries = normalize(queries)
+        with self._lock:
+            vectors = self._refresh()
+            partitioned = self._centroids is not None and not exact
+            lists = self._inverted_lists() if partitioned else None
+            centroids = self._centroids
+        ids = np.full((len(queries), k), -1, dtype=np.int64)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        if len(vectors):
+            if partitioned:
+                for q, query in enumerate(queries):
+                    candidates = self._candidates(query, lists, centroids, len(vectors), nprobe)
+                    found_ids, found_scores = self._score_rows(vectors, candidates, query[None], k)
+                    found = found_ids.shape[1]
+                    ids[q, :found], scores[q, :found] = found_ids[0], found_scores[0]
+            else:
+                found_ids, found_scores = self._scan(vectors, queries, k)
+                found = found_ids.shape[1]
+                ids[:, :found], scores[:, :found] = found_ids, found_scores
+        with self._lock:
+            self.lookups += len(queries)
+            self._lookup_times.append((time.perf_counter() - start) / len(queries))
+        return ids, scores
+
+    # Rows of the nprobe clusters nearest the query, plus the rows not in the inverted lists yet
+    def _candidates(self, query, lists, centroids, count, nprobe):
+        order, offsets, listed = lists
+        nprobe = min(nprobe or self.nprobe, len(centroids))
+        probes = top_k_columns((centroids @ query)[None], nprobe)[0]
+        candidates = [order[offsets[cell]:offsets[cell + 1]] for cell in probes]
+        candidates.append(np.arange(listed, count, dtype=np.int32))
+        # Sorted rows read the memory map front to back
+        return np.sort(np.concatenate(candidates))
+
+    def _score_rows(self, vectors, rows, queries, k):
+        if not len(rows):
+            return np.zeros((len(queries), 0), dtype=np.int64), np.zeros((len(queries), 0), dtype=np.float32)
+        scores = np.take(vectors, rows, axis=0).astype(np.float32) @ queries.T
+        best = top_k_columns(scores.T, k)
+        return rows[best].astype(np.int64), np.take_along_axis(scores.T, best, axis=1)
+
+    # Exact search: every row scored in chunks converted to float32 in one reused buffer
+    def _scan(self, vectors, queries, k):
+        buffer = np.empty((min(self.chunk_rows, len(vectors)), self.dim), dtype=np.float32)
+        best_ids, best_scores = [], []
+        for start in range(0, len(vectors), self.chunk_rows):
+            chunk = buffer[:min(self.chunk_rows, len(vectors) - start)]
+            chunk[...] = vectors[start:start + len(chunk)]
+            scores = queries @ chunk.T
+            columns = top_k_columns(scores, k)
+            best_ids.append(columns + start)
+            best_scores.append(np.take_along_axis(scores, columns, axis=1))
+        ids, scores = np.concatenate(best_ids, axis=1), np.concatenate(best_scores, axis=1)
+        best = top_k_columns(scores, k)
+        return np.take_along_axis(ids, best, axis=1), np.take_along_axis(scores, best, axis=1)
+
+    # Label, source and confirmation time of cases by id
+    def cases(self, ids):
+        ids = [int(i) for i in ids if i >= 0]
+        if not ids:
+            return {}
+        connection = self._connect()
+        try:
+            rows = connection.execute(
+                f"SELECT id, label, source, confirmed_at FROM cases WHERE id IN ({','.join('?' * len(ids))})", ids
+            ).fetchall()
+        finally:
+            connection.close()
+        return {row[0]: {"id": row[0], "label": row[1], "source": row[2], "confirmed_at": row[3]} for row in rows}
+
+    def similar(self, embedding, k=5):
+        """The ``k`` most similar cases to one embedding, as dicts with a ``similarity`` in [-1, 1]."""
+        ids, scores = self.search(embedding, k)
+        cases = self.cases(ids[0])
+        return [dict(cases[i], similarity=float(score)) for i, score in zip(ids[0], scores[0]) if i in cases]
+
+    def stats(self):
+        with self._lock:
+            lookup_times = np.array(self._lookup_times) * 1000
+            self._refresh()
+            return {
+                "entries": len(self._vectors),
+                "dim": self.dim,
+                "file_mb": len(self._vectors) * self.row_bytes / 2 ** 20,
+                "model_version": self.model_version,
+                "lists": None if self._centroids is None else len(self._centroids),
+                "unassigned": None if self._centroids is None else len(self._vectors) - len(self._partitions),
+                "nprobe": self.nprobe,
+                "lookups": self.lookups,
+                "lookup_ms_p50": float(np.percentile(lookup_times, 50)) if lookup_times.size else None,
+                "lookup_ms_p99": float(np.percentile(lookup_times, 99)) if lookup_times.size else None,
+            }
+
+
+# Embed labelled images and append those not yet in the archive
+def add_cases(classifier, index, data_dir, batch_size=32, workers=4, limit=None, progress=True):
+    from evaluate import iter_labelled_images
+    from pipeline import iter_batches
+
+    class_indices = classifier.class_indices
+    items = iter_labelled_images(data_dir, class_indices)
+    if limit is not None:
+        items = islice(items, limit)
+    added = skipped = failed = 0
+    batches = iter_batches(items, batch_size=batch_size, workers=workers,
+                           path_of=lambda item: os.path.join(data_dir, item[0]))
+    for batch_items, batch, errors in batches:
+        sources = [os.path.abspath(os.path.join(data_dir, relative)) for relative, _ in batch_items]
+        known = index.known_sources(sources)
+        keep = [p for p in range(len(batch_items)) if p not in errors and sources[p] not in known]
+        failed += len(errors)
+        skipped += len(batch_items) - len(errors) - len(keep)
+        if keep:
+            _, embeddings, _ = classifier.predict_outputs(batch if len(keep) == len(batch) else batch[keep],
+                                                          augment=False)
+            index.add(embeddings, [class_indices[str(batch_items[p][1])] for p in keep], [sources[p] for p in keep])
+            added += len(keep)
+        if progress:
+            print(f"\r{added} added  {skipped} already archived  {failed} unreadable", end="", file=sys.stderr)
+    if progress:
+        print(file=sys.stderr)
+    return {"added": added, "skipped": skipped, "failed": failed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=["add", "partition", "stats"])
+    parser.add_argument("data_dir", nargs="?", help="labelled images for add, one folder per class")
+    parser.add_argument("--index", default=settings.SIMILAR_CASES_DIR)
+    parser.add_argument("--model", help="model file for add (default: the deployed model)")
+    parser.add_argument("--backend", default="auto", choices=["auto", "keras", "savedmodel"])
+    parser.add_argument("--lists", type=int, help="clusters for partition (default: 4 * sqrt(rows))")
+    parser.add_argument("--limit", type=int)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    args = parser.parse_args()
+
+    if args.command == "add":
+        from engine import DEFAULT_MODEL_PATH, PlantDiseaseClassifier
+
+        if not args.data_dir:
+            parser.error("add needs DATA_DIR")
+        classifier = PlantDiseaseClassifier(model_path=args.model or DEFAULT_MODEL_PATH, backend=args.backend,
+                                            embeddings=True).load()
+        dim = classifier.embedding_size
+        if SimilarCaseIndex.exists(args.index):
+            index = SimilarCaseIndex(args.index, dim)
+            if index.model_version != classifier.model_version:
+                sys.exit(f"{args.index} was built with model {index.model_version}, not "
+                         f"{classifier.model_version}; use a new --index directory")
+        else:
+            index = SimilarCaseIndex(args.index, dim, classifier.model_version)
+        result = add_cases(classifier, index, args.data_dir, args.batch_size, args.workers, args.limit)
+        print(json.dumps(dict(result, index=index.stats()), indent=2))
+        return
+
+    if not SimilarCaseIndex.exists(args.index):
+        sys.exit(f"no similar-case index at {args.index}; create it with similar.py add")
+    index = SimilarCaseIndex(args.index)
+    if args.command == "partition":
+        start = time.perf_counter()
+        lists = index.partition(args.lists)
+        print(f"partitioned {len(index)} cases into {lists} clusters in {time.perf_counter() - start:.1f} s")
+    print(json.dumps(index.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import io
+import math
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from PIL import Image
+
+from instrumentation import StageTimer
+from preprocessing import TARGET_SIZE, decode_image, open_image
+
+# Heatmap overlay colour (RGB) and its opacity where the disease score is 1
+HEATMAP_COLOR = (231, 76, 60)
+HEATMAP_OPACITY = 0.6
+
+
+# Columns and rows of tile_size windows, stride apart, that cover a width x height image with at most
+# max_tiles windows. The grid is never wider than the image, so the image is only scaled up along a
+# side shorter than one tile (and, from rounding the row count, by under half a stride in height).
+# Returns (columns, rows)
+def tile_grid(width, height, tile_size, stride, max_tiles):
+    best = None
+    for columns in range(1, max_tiles + 1):
+        span = tile_size + (columns - 1) * stride
+        if columns > 1 and span > width:
+            break
+        rows = max(1, round((span * height / width - tile_size) / stride) + 1)
+        if columns * rows > max_tiles:
+            # Very tall images: a single column of as many tiles as allowed
+            return best or (1, max_tiles)
+        best = (columns, rows)
+    return best
+
+
+class TileResult:
+    """Image-level verdict of a tiled analysis plus the per-tile scores behind it."""
+
+    def __init__(self, prediction, tile_probabilities, disease_scores, grid, tile_size, stride, threshold):
+        self.prediction = prediction
+        self.tile_probabilities = tile_probabilities
+        self.disease_scores = disease_scores
+        self.grid = grid
+        self.tile_size = tile_size
+        self.stride = stride
+        self.threshold = threshold
+
+    @property
+    def tiles(self):
+        return len(self.disease_scores.ravel())
+
+    # Share of tiles whose disease score reaches the lesion threshold
+    @property
+    def affected_fraction(self):
+        return float((self.disease_scores >= self.threshold).mean())
+
+    def heatmap(self, size):
+        """Disease score per pixel of an image of ``size`` (width, height), in [0, 1].
+
+        Overlapping tiles are averaged on a grid of stride-sized cells, then
+        the cell grid is scaled up to ``size``.
+        """
+        columns, rows = self.grid
+        cell = math.gcd(self.tile_size, self.stride)
+        span, step = self.tile_size // cell, self.stride // cell
+        total = np.zeros((span + (rows - 1) * step, span + (columns - 1) * step), dtype=np.float32)
+        count = np.zeros_like(total)
+        for row in range(rows):
+            for column in range(columns):
+                window = (slice(row * step, row * step + span), slice(column * step, column * step + span))
+                total[window] += self.disease_scores[row, column]
+                count[window] += 1
+        cells = Image.fromarray((total / count * 255).astype(np.uint8), mode="L")
+        return np.asarray(cells.resize(size, Image.Resampling.BILINEAR), dtype=np.float32) / 255.0
+
+    # JPEG of the image with tiles tinted by disease score, for display
+    def overlay(self, image, quality=80):
+        image = image.convert("RGB")
+        alpha = self.heatmap(image.size)[..., None] * HEATMAP_OPACITY
+        pixels = np.asarray(image, dtype=np.float32)
+        blended = pixels * (1 - alpha) + np.array(HEATMAP_COLOR, dtype=np.float32) * alpha
+        buffer = io.BytesIO()
+        Image.fromarray(blended.astype(np.uint8)).save(buffer, format="JPEG", quality=quality)
+        return buffer.getvalue()
+
+
+class TiledAnalyzer:
+    """Classifies a high-resolution photo tile by tile instead of as one downscaled image.
+
+    The photo is decoded (JPEGs at a reduced DCT scale) to the largest size
+    whose grid of overlapping ``tile_size`` windows stays within ``max_tiles``.
+    Windows are strided views of the decoded pixels (no copies); they are
+    normalized ``batch_size`` at a time into one reused buffer and classified
+    in batched forward passes, so memory stays bounded whatever the input
+    resolution.
+
+    A tile's disease score is its probability mass outside the healthy
+    classes. If any tile scores at least ``lesion_threshold`` (percent), the
+    verdict averages the probabilities of those tiles only, so a few lesions
+    are not outvoted by healthy leaf area; otherwise it averages all tiles.
+    """
+
+    def __init__(self, classifier, max_tiles=64, overlap=0.5, batch_size=16, lesion_threshold=50.0,
+                 tile_size=TARGET_SIZE[0]):
+        self.classifier = classifier
+        self.max_tiles = max_tiles
+        self.tile_size = tile_size
+        self.stride = max(1, round(tile_size * (1 - overlap)))
+        self.batch_size = batch_size
+        self.lesion_threshold = lesion_threshold
+        labels = classifier.postprocessor.labels.labels
+        self.healthy = np.array(["healthy" in label.lower() for label in labels])
+
+    def __call__(self, image, timer=None):
+        timer = timer if timer is not None else StageTimer()
+        with timer.stage("decode"):
+            # Only the header is read here; pixels are decoded once the tile grid is known
+            img = open_image(image)
+            columns, rows = tile_grid(img.width, img.height, self.tile_size, self.stride, self.max_tiles)
+            size = (self.tile_size + (columns - 1) * self.stride, self.tile_size + (rows - 1) * self.stride)
+            # JPEGs decode at the smallest DCT scale covering the grid, so 50 MP inputs are never fully expanded
+            img = decode_image(img, size)
+            if img.size != size:
+                img = img.resize(size, Image.Resampling.BICUBIC, reducing_gap=3.0)
+            pixels = np.asarray(img, dtype=np.uint8)
+
+        tile_shape = (self.tile_size, self.tile_size, 3)
+        windows = sliding_window_view(pixels, tile_shape)[::self.stride, ::self.stride, 0]
+        buffer = np.empty((min(self.batch_size, rows * columns),) + tile_shape, dtype=np.float32)
+        probabilities, embeddings = [], []
+        for start in range(0, rows * columns, self.batch_size):
+            positions = range(start, min(start + self.batch_size, rows * columns))
+            with timer.stage("tile"):
+                batch = buffer[:len(positions)]
+                for k, position in enumerate(positions):
+                    np.divide(windows[divmod(position, columns)], np.float32(255.0), out=batch[k])
+            tile_probabilities, tile_embeddings, _ = self.classifier.predict_outputs(batch, timer, augment=False)
+            probabilities.append(tile_probabilities)
+            embeddings.append(tile_embeddings)
+
+        with timer.stage("aggregate"):
+            probabilities = np.concatenate(probabilities)
+            disease_scores = (1.0 - probabilities[:, self.healthy].sum(axis=1)) * 100.0
+            lesions = disease_scores >= self.lesion_threshold
+            chosen = lesions if lesions.any() else slice(None)
+            prediction = self.classifier.postprocessor(probabilities[chosen].mean(axis=0)[None])[0]
+            # The verdict's embedding averages the same tiles, for similar-case search
+            if embeddings[0] is not None:
+                prediction.embedding = np.concatenate(embeddings)[chosen].mean(axis=0)
+        prediction.timings = dict(timer.timings)
+        self.classifier.log_predictions([prediction], timer)
+        return TileResult(prediction, probabilities.reshape(rows, columns, -1),
+                          disease_scores.reshape(rows, columns) / 100.0, (columns, rows), self.tile_size,
+                          self.stride, self.lesion_threshold / 100.0)